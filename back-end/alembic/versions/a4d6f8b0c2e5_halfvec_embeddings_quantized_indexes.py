@@ -0,0 +1,70 @@
+"""store embeddings as halfvec, index truncated + binary-quantized expressions
+
+Revision ID: a4d6f8b0c2e5
+Revises: f1c3e5a7b9d2
+Create Date: 2026-10-17 23:00:00.000000
+
+- vector(3072) → halfvec(3072): 12 KB → 6 KB mỗi row, dùng để re-rank
+- Bỏ HNSW 3072 chiều, thay bằng HNSW trên 768 chiều đầu (Matryoshka) và
+  trên binary_quantize (hamming)
+
+Đổi kiểu cột rewrite cả bảng (ACCESS EXCLUSIVE lock) → chạy lúc ít traffic.
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a4d6f8b0c2e5"
+down_revision: Union[str, Sequence[str], None] = "f1c3e5a7b9d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DIMENSIONS = 3072
+SEARCH_DIMENSIONS = 768
+
+# (bảng, cột, prefix tên index)
+EMBEDDING_COLUMNS = [
+    ("nutrition_embeddings", "vector", "ix_nutrition_embeddings_vector"),
+    ("meal_items", "embedding_vector", "ix_meal_items_embedding"),
+]
+OLD_INDEXES = {
+    "nutrition_embeddings": "ix_nutrition_embeddings_vector_hnsw",
+    "meal_items": "ix_meal_items_embedding_hnsw",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column, prefix in EMBEDDING_COLUMNS:
+        op.drop_index(OLD_INDEXES[table], table_name=table)
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE halfvec({DIMENSIONS}) "
+            f"USING {column}::halfvec({DIMENSIONS})"
+        )
+        op.execute(
+            f"CREATE INDEX {prefix}_trunc_hnsw ON {table} USING hnsw "
+            f"((subvector({column}, 1, {SEARCH_DIMENSIONS})"
+            f"::halfvec({SEARCH_DIMENSIONS})) halfvec_cosine_ops)"
+        )
+        op.execute(
+            f"CREATE INDEX {prefix}_binary_hnsw ON {table} USING hnsw "
+            f"((binary_quantize({column})::bit({DIMENSIONS})) bit_hamming_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column, prefix in EMBEDDING_COLUMNS:
+        op.drop_index(f"{prefix}_binary_hnsw", table_name=table)
+        op.drop_index(f"{prefix}_trunc_hnsw", table_name=table)
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE vector({DIMENSIONS}) "
+            f"USING {column}::vector({DIMENSIONS})"
+        )
+        op.execute(
+            f"CREATE INDEX {OLD_INDEXES[table]} ON {table} USING hnsw "
+            f"(({column}::halfvec({DIMENSIONS})) halfvec_cosine_ops)"
+        )
@@ -0,0 +1,77 @@
+"""add analysis_jobs queue table
+
+Revision ID: b7c41d9e2f10
+Revises: a29ab5e78d24
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b7c41d9e2f10"
+down_revision: Union[str, Sequence[str], None] = "a29ab5e78d24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "analysis_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("meal_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum(
+                "QUEUED",
+                "RUNNING",
+                "SUCCEEDED",
+                "FAILED",
+                name="analysis_job_status_enum",
+            ),
+            nullable=False,
+        ),
+        sa.Column("image_data", sa.LargeBinary(), nullable=True),
+        sa.Column("content_type", sa.String(length=50), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("locked_by", sa.String(length=255), nullable=True),
+        sa.Column("locked_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["meal_id"], ["user_meals.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_analysis_jobs_id"), "analysis_jobs", ["id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_analysis_jobs_meal_id"), "analysis_jobs", ["meal_id"], unique=True
+    )
+    op.create_index(
+        op.f("ix_analysis_jobs_status"), "analysis_jobs", ["status"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_analysis_jobs_status"), table_name="analysis_jobs")
+    op.drop_index(op.f("ix_analysis_jobs_meal_id"), table_name="analysis_jobs")
+    op.drop_index(op.f("ix_analysis_jobs_id"), table_name="analysis_jobs")
+    op.drop_table("analysis_jobs")
+    op.execute("DROP TYPE IF EXISTS analysis_job_status_enum")
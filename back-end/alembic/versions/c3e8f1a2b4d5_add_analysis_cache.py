@@ -0,0 +1,75 @@
+"""add analysis_cache table
+
+Revision ID: c3e8f1a2b4d5
+Revises: b7c41d9e2f10
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c3e8f1a2b4d5"
+down_revision: Union[str, Sequence[str], None] = "b7c41d9e2f10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "analysis_cache",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("cache_version", sa.String(length=64), nullable=False),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("phash", sa.BigInteger(), nullable=False),
+        sa.Column("phash_band_0", sa.Integer(), nullable=False),
+        sa.Column("phash_band_1", sa.Integer(), nullable=False),
+        sa.Column("phash_band_2", sa.Integer(), nullable=False),
+        sa.Column("phash_band_3", sa.Integer(), nullable=False),
+        sa.Column("component_detection", sa.JSON(), nullable=True),
+        sa.Column("result", sa.JSON(), nullable=False),
+        sa.Column("estimated_tokens", sa.Integer(), nullable=False),
+        sa.Column("hit_count", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("last_hit_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "cache_version", "content_hash", name="uq_analysis_cache_key"
+        ),
+    )
+    op.create_index(
+        op.f("ix_analysis_cache_id"), "analysis_cache", ["id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_analysis_cache_cache_version"),
+        "analysis_cache",
+        ["cache_version"],
+        unique=False,
+    )
+    for band in range(4):
+        op.create_index(
+            op.f(f"ix_analysis_cache_phash_band_{band}"),
+            "analysis_cache",
+            [f"phash_band_{band}"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for band in range(4):
+        op.drop_index(
+            op.f(f"ix_analysis_cache_phash_band_{band}"), table_name="analysis_cache"
+        )
+    op.drop_index(op.f("ix_analysis_cache_cache_version"), table_name="analysis_cache")
+    op.drop_index(op.f("ix_analysis_cache_id"), table_name="analysis_cache")
+    op.drop_table("analysis_cache")
@@ -0,0 +1,77 @@
+"""add usda_foods mirror table
+
+Revision ID: d5a7c9e1f3b2
+Revises: c3e8f1a2b4d5
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "d5a7c9e1f3b2"
+down_revision: Union[str, Sequence[str], None] = "c3e8f1a2b4d5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    op.create_table(
+        "usda_foods",
+        sa.Column("fdc_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column("data_type", sa.String(length=32), nullable=False),
+        sa.Column("food_category", sa.String(length=255), nullable=True),
+        sa.Column("calories", sa.Float(), nullable=False),
+        sa.Column("protein", sa.Float(), nullable=False),
+        sa.Column("carbs", sa.Float(), nullable=False),
+        sa.Column("fat", sa.Float(), nullable=False),
+        sa.Column("fiber", sa.Float(), nullable=False),
+        sa.Column("sodium", sa.Float(), nullable=False),
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english', description)", persisted=True),
+            nullable=True,
+        ),
+        sa.Column(
+            "imported_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("fdc_id"),
+    )
+    op.create_index(
+        op.f("ix_usda_foods_data_type"), "usda_foods", ["data_type"], unique=False
+    )
+    op.create_index(
+        "ix_usda_foods_search_vector",
+        "usda_foods",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_usda_foods_description_trgm",
+        "usda_foods",
+        ["description"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"description": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_usda_foods_description_trgm", table_name="usda_foods")
+    op.drop_index("ix_usda_foods_search_vector", table_name="usda_foods")
+    op.drop_index(op.f("ix_usda_foods_data_type"), table_name="usda_foods")
+    op.drop_table("usda_foods")
@@ -0,0 +1,61 @@
+"""add usda_ingredient_map table
+
+Revision ID: e8b2d4f6a1c3
+Revises: d5a7c9e1f3b2
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e8b2d4f6a1c3"
+down_revision: Union[str, Sequence[str], None] = "d5a7c9e1f3b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "usda_ingredient_map",
+        sa.Column("ingredient_key", sa.String(length=255), nullable=False),
+        sa.Column("name_en", sa.String(length=255), nullable=False),
+        sa.Column("cooking_method", sa.String(length=100), nullable=True),
+        sa.Column("fdc_id", sa.Integer(), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("data_type", sa.String(length=32), nullable=True),
+        sa.Column("match_score", sa.Float(), nullable=False),
+        sa.Column("nutrients", sa.JSON(), nullable=False),
+        sa.Column("matcher_version", sa.String(length=16), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("ingredient_key"),
+    )
+    op.create_index(
+        op.f("ix_usda_ingredient_map_fdc_id"),
+        "usda_ingredient_map",
+        ["fdc_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_usda_ingredient_map_fdc_id"), table_name="usda_ingredient_map"
+    )
+    op.drop_table("usda_ingredient_map")
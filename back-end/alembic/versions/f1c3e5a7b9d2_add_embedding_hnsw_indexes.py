@@ -0,0 +1,59 @@
+"""add nutrition_embeddings.content and HNSW embedding indexes
+
+Revision ID: f1c3e5a7b9d2
+Revises: e8b2d4f6a1c3
+Create Date: 2026-10-17 22:00:00.000000
+
+HNSW trên vector 3072 chiều phải qua cast halfvec (vector chỉ index được
+tối đa 2000 chiều) → cần pgvector >= 0.7
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f1c3e5a7b9d2"
+down_revision: Union[str, Sequence[str], None] = "e8b2d4f6a1c3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER EXTENSION vector UPDATE")
+
+    op.add_column(
+        "nutrition_embeddings",
+        sa.Column("content", sa.String(length=512), nullable=True),
+    )
+    op.create_unique_constraint(
+        "uq_nutrition_embeddings_ref_type_content",
+        "nutrition_embeddings",
+        ["ref_type", "content"],
+    )
+
+    op.execute(
+        "CREATE INDEX ix_nutrition_embeddings_vector_hnsw ON nutrition_embeddings "
+        "USING hnsw ((vector::halfvec(3072)) halfvec_cosine_ops)"
+    )
+    op.execute(
+        "CREATE INDEX ix_meal_items_embedding_hnsw ON meal_items "
+        "USING hnsw ((embedding_vector::halfvec(3072)) halfvec_cosine_ops)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_meal_items_embedding_hnsw", table_name="meal_items")
+    op.drop_index(
+        "ix_nutrition_embeddings_vector_hnsw", table_name="nutrition_embeddings"
+    )
+    op.drop_constraint(
+        "uq_nutrition_embeddings_ref_type_content",
+        "nutrition_embeddings",
+        type_="unique",
+    )
+    op.drop_column("nutrition_embeddings", "content")
@@ -0,0 +1,51 @@
+"""
+Standalone analysis job worker (scale ngang, tách khỏi API process)
+
+Usage (thư mục back-end):
+    python analysis_worker.py
+
+Đặt ANALYSIS_WORKER_ENABLED=false cho API nếu chỉ muốn worker riêng xử lý job.
+"""
+
+import asyncio
+import signal
+
+from config import settings
+from database.checkpointer import get_manager
+from database.connection import close_async_engine
+from models.factory import ModelFactory
+from services.analysis_job_service import get_analysis_worker, stop_analysis_worker
+from services.cloudinary_service import close_cloudinary_service
+from services.usda_service import close_usda_service
+from utils.image_executor import shutdown_image_executor
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+async def main() -> None:
+    ModelFactory.load_config(settings.MODEL_CONFIG_PATH)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    get_analysis_worker().start()
+    logger.info("Analysis worker running - Ctrl+C to stop")
+
+    await stop.wait()
+
+    await stop_analysis_worker()
+    await close_cloudinary_service()
+    await close_usda_service()
+    await close_async_engine()
+    shutdown_image_executor()
+
+    manager = get_manager()
+    if manager:
+        await manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
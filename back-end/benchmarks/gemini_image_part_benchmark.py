@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: CPU cho mỗi ảnh khi build Gemini request part
+
+- reencode: base64 → PIL decode → SDK re-encode JPEG (đường cũ)
+- passthrough: base64 → inline blob bytes gốc (chỉ đọc header)
+
+Usage (chạy từ thư mục back-end, cần .env hợp lệ):
+    python benchmarks/gemini_image_part_benchmark.py
+    python benchmarks/gemini_image_part_benchmark.py --image path/to/photo.jpg -n 200
+"""
+
+import argparse
+import base64
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def normalized_jpeg(size=(1024, 768)) -> bytes:
+    """Ảnh giống output của upload helper (JPEG 1024px, quality 85)"""
+    from PIL import Image
+
+    noise = Image.effect_noise(size, 40)
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (noise, gradient, gradient.rotate(180)))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+
+def run(base64_data: str, passthrough: bool, iterations: int) -> dict:
+    from google.generativeai.types import content_types
+    from models.providers.gemini import to_image_part
+
+    cpu, payload = [], 0
+    for _ in range(iterations):
+        start = time.process_time()
+        part = to_image_part(base64.b64decode(base64_data), "image/jpeg", passthrough)
+        # SDK chuyển part → protobuf (PIL Image bị encode lại ở bước này)
+        proto = content_types.to_part(part)
+        cpu.append(time.process_time() - start)
+        payload = len(proto.inline_data.data)
+
+    return {
+        "avg_ms": statistics.mean(cpu) * 1000,
+        "p95_ms": sorted(cpu)[max(int(len(cpu) * 0.95) - 1, 0)] * 1000,
+        "payload_kb": payload / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--image", type=Path, help="Ảnh JPEG (mặc định: ảnh tổng hợp)")
+    parser.add_argument("-n", "--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    content = args.image.read_bytes() if args.image else normalized_jpeg()
+    base64_data = base64.b64encode(content).decode("utf-8")
+    print(f"Image: {len(content) / 1024:.1f}KB, {args.iterations} iterations")
+
+    results = {
+        "reencode": run(base64_data, False, args.iterations),
+        "passthrough": run(base64_data, True, args.iterations),
+    }
+
+    print(f"\n{'mode':<14}{'avg CPU ms':>12}{'p95 CPU ms':>12}{'payload KB':>12}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<14}{r['avg_ms']:>12.2f}{r['p95_ms']:>12.2f}"
+            f"{r['payload_kb']:>12.1f}"
+        )
+
+    saved = results["reencode"]["avg_ms"] - results["passthrough"]["avg_ms"]
+    print(f"\nCPU saved per image: {saved:.2f} ms "
+          f"({results['reencode']['avg_ms'] / results['passthrough']['avg_ms']:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark: full decode vs reduced decode (JPEG draft / DCT scaling)
+cho utils.image_base64_helper._optimize_image
+
+Mỗi mode chạy trong một subprocess riêng để đo peak RSS chính xác.
+
+Usage (chạy từ thư mục back-end, cần .env hợp lệ để import config):
+    # Corpus ảnh thật
+    python benchmarks/image_decode_benchmark.py --corpus path/to/food_photos
+
+    # Sinh 20 ảnh tổng hợp 4000x3000
+    python benchmarks/image_decode_benchmark.py --generate 20
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+MODES = {"full": False, "reduced": True}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def generate_corpus(directory: Path, count: int, size=(4000, 3000)) -> list[Path]:
+    """Sinh ảnh JPEG giả lập ảnh chụp điện thoại (gradient + noise)"""
+    from PIL import Image
+
+    paths = []
+    for i in range(count):
+        noise = Image.effect_noise(size, 40 + i % 20)
+        gradient = Image.linear_gradient("L").resize(size)
+        image = Image.merge("RGB", (noise, gradient, gradient.rotate(180)))
+        path = directory / f"food_{i:03d}.jpg"
+        image.save(path, format="JPEG", quality=92)
+        paths.append(path)
+    return paths
+
+
+def _read_status_mb(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024  # kB → MB
+    return 0.0
+
+
+def _reset_peak_rss() -> None:
+    # Linux >= 4.0: ghi "5" vào clear_refs để reset VmHWM (peak RSS)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def run_worker(mode: str, files: list[str], max_dimension: int) -> dict:
+    """
+    Chạy trong subprocess: optimize từng ảnh, đo wall time + peak RSS
+
+    Peak RSS được reset trước mỗi ảnh nên rss_growth_mb là mức RSS tăng thêm
+    lớn nhất khi xử lý một ảnh (không tính import và buffer input)
+    """
+    from utils.image_base64_helper import _optimize_image
+
+    durations = []
+    growths = []
+    decode_modes = {}
+    for path in files:
+        content = Path(path).read_bytes()
+
+        _reset_peak_rss()
+        baseline_rss = _read_status_mb("VmRSS:")
+        start = time.perf_counter()
+        _, _, _, info = _optimize_image(content, max_dimension, MODES[mode])
+        durations.append(time.perf_counter() - start)
+        growths.append(_read_status_mb("VmHWM:") - baseline_rss)
+
+        decode_mode = info["decode_mode"]
+        decode_modes[decode_mode] = decode_modes.get(decode_mode, 0) + 1
+
+    durations.sort()
+    p95 = durations[max(int(len(durations) * 0.95) - 1, 0)]
+    return {
+        "mode": mode,
+        "images": len(durations),
+        "total_s": round(sum(durations), 3),
+        "avg_ms": round(statistics.mean(durations) * 1000, 1),
+        "p95_ms": round(p95 * 1000, 1),
+        "rss_growth_mb": round(max(growths), 1),
+        "decode_modes": decode_modes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", type=Path, help="Thư mục chứa ảnh")
+    parser.add_argument("--generate", type=int, default=10, help="Số ảnh tổng hợp")
+    parser.add_argument("--max-dimension", type=int, default=1024)
+    parser.add_argument("--worker", choices=MODES.keys(), help=argparse.SUPPRESS)
+    parser.add_argument("files", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.files, args.max_dimension)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            files = sorted(
+                p for p in args.corpus.iterdir()
+                if p.suffix.lower() in IMAGE_EXTENSIONS
+            )
+        else:
+            print(f"Generating {args.generate} synthetic 4000x3000 photos...")
+            files = generate_corpus(Path(tmp), args.generate)
+
+        if not files:
+            sys.exit("No images found")
+
+        results = []
+        for mode in MODES:
+            output = subprocess.run(
+                [
+                    sys.executable, __file__,
+                    "--worker", mode,
+                    "--max-dimension", str(args.max_dimension),
+                    *map(str, files),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"\n{'mode':<10}{'images':>8}{'total s':>10}{'avg ms':>10}"
+          f"{'p95 ms':>10}{'RSS +MB/image':>16}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['images']:>8}{r['total_s']:>10}{r['avg_ms']:>10}"
+              f"{r['p95_ms']:>10}{r['rss_growth_mb']:>16}")
+
+    full, reduced = results
+    print(f"\nSpeedup: {full['total_s'] / reduced['total_s']:.1f}x, "
+          f"RSS growth: {full['rss_growth_mb']} MB → {reduced['rss_growth_mb']} MB")
+    print(f"Decode modes (reduced): {reduced['decode_modes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Benchmark: recall@k và latency của ANN search trên embedding halfvec
+
+- exact: quét toàn bộ, cosine trên halfvec đầy đủ (ground truth)
+- truncated-N: HNSW trên N chiều đầu (Matryoshka), re-rank trên vector đầy đủ
+- binary: HNSW hamming trên binary_quantize, re-rank trên vector đầy đủ
+- full (--full-index): HNSW trên halfvec đầy đủ, không re-rank
+
+Dữ liệu nằm trong bảng UNLOGGED riêng (embedding_benchmark), không đụng
+bảng của app. Embedding tổng hợp: cụm quanh centroid, năng lượng dồn về các
+chiều đầu như embedding Matryoshka; --seed-from-db lấy centroid từ
+nutrition_embeddings thật.
+
+Usage (chạy từ thư mục back-end, cần .env hợp lệ, pgvector >= 0.7):
+    python benchmarks/pgvector_quantization_benchmark.py              # 1M rows
+    python benchmarks/pgvector_quantization_benchmark.py --rows 100000 \\
+        --truncate 256,512,768,1024 --rerank 1,4,10 --queries 200
+
+1M x 3072 chiều: ~6 GB dữ liệu + index, build index mất hàng chục phút
+(tăng maintenance_work_mem để build nhanh hơn).
+"""
+
+import argparse
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+TABLE = "embedding_benchmark"
+
+
+def vector_literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{x:.5f}" for x in vector) + "]"
+
+
+def spectrum(dimensions: int) -> np.ndarray:
+    """Độ lớn giảm dần theo chiều → prefix giữ phần lớn thông tin"""
+    return 1 / np.sqrt(np.arange(1, dimensions + 1))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def make_centroids(
+    engine, count: int, dimensions: int, seed_from_db: bool, rng
+) -> np.ndarray:
+    from sqlalchemy import text
+
+    if seed_from_db:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT vector::text FROM nutrition_embeddings "
+                    "WHERE vector IS NOT NULL LIMIT :n"
+                ),
+                {"n": count},
+            ).all()
+        if rows:
+            print(f"Seeding {len(rows)} centroids from nutrition_embeddings")
+            return np.array([r[0][1:-1].split(",") for r in rows], dtype=float)
+        print("nutrition_embeddings is empty, using synthetic centroids")
+    return normalize(rng.standard_normal((count, dimensions)) * spectrum(dimensions))
+
+
+def sample(centroids: np.ndarray, count: int, noise: float, rng) -> np.ndarray:
+    dimensions = centroids.shape[1]
+    picks = centroids[rng.integers(0, len(centroids), count)]
+    jitter = rng.standard_normal((count, dimensions)) * spectrum(dimensions)
+    return normalize(picks + noise * normalize(jitter))
+
+
+def load(engine, centroids, rows: int, noise: float, batch_size: int, rng) -> float:
+    from sqlalchemy import text
+
+    dimensions = centroids.shape[1]
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(
+            text(
+                f"CREATE UNLOGGED TABLE {TABLE} "
+                f"(id bigint PRIMARY KEY, embedding halfvec({dimensions}))"
+            )
+        )
+
+    start = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for offset in range(0, rows, batch_size):
+            batch = sample(centroids, min(batch_size, rows - offset), noise, rng)
+            buffer = io.StringIO()
+            for i, vector in enumerate(batch):
+                buffer.write(f"{offset + i}\t{vector_literal(vector)}\n")
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {TABLE} (id, embedding) FROM STDIN", buffer)
+            raw.commit()
+            print(f"\r  loaded {offset + len(batch):,}/{rows:,}", end="", flush=True)
+        print()
+        cursor.execute(f"ANALYZE {TABLE}")
+        raw.commit()
+    finally:
+        raw.close()
+    return time.perf_counter() - start
+
+
+def build_index(engine, name: str, expression: str) -> dict:
+    from sqlalchemy import text
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"CREATE INDEX IF NOT EXISTS {name} "
+                f"ON {TABLE} USING hnsw ({expression})"
+            )
+        )
+    elapsed = time.perf_counter() - start
+    with engine.connect() as conn:
+        size = conn.execute(
+            text("SELECT pg_relation_size(:name)"), {"name": name}
+        ).scalar()
+    return {"build_s": elapsed, "index_mb": size / 2**20}
+
+
+def search_sql(mode: str, dimensions: int, truncate: int = 0) -> str:
+    full = f"embedding <=> CAST(:q AS halfvec({dimensions}))"
+    if mode == "exact" or mode == "full":
+        return f"SELECT id FROM {TABLE} ORDER BY {full} LIMIT :k"
+    if mode == "truncated":
+        candidate = (
+            f"subvector(embedding, 1, {truncate})::halfvec({truncate}) "
+            f"<=> CAST(:q_prefix AS halfvec({truncate}))"
+        )
+    else:
+        candidate = (
+            f"binary_quantize(embedding)::bit({dimensions}) "
+            f"<~> binary_quantize(CAST(:q AS halfvec({dimensions})))"
+        )
+    return (
+        f"SELECT id FROM (SELECT id, embedding FROM {TABLE} "
+        f"ORDER BY {candidate} LIMIT :candidates) c ORDER BY {full} LIMIT :k"
+    )
+
+
+def run_queries(
+    engine, sql: str, queries, k: int, candidates: int, truncate: int, exact: bool
+):
+    from sqlalchemy import text
+
+    results, durations = [], []
+    with engine.connect() as conn:
+        for query in queries:
+            params = {"q": vector_literal(query), "k": k, "candidates": candidates}
+            if truncate:
+                params["q_prefix"] = vector_literal(query[:truncate])
+            with conn.begin():
+                if exact:
+                    conn.execute(text("SET LOCAL enable_indexscan = off"))
+                else:
+                    conn.execute(
+                        text(f"SET LOCAL hnsw.ef_search = {max(40, candidates)}")
+                    )
+                start = time.perf_counter()
+                ids = conn.execute(text(sql), params).scalars().all()
+                durations.append(time.perf_counter() - start)
+            results.append(set(ids))
+    return results, durations
+
+
+def summarize(label, results, truth, durations, k, index=None) -> dict:
+    recall = statistics.mean(len(r & t) / k for r, t in zip(results, truth))
+    durations = sorted(durations)
+    return {
+        "label": label,
+        "recall": recall,
+        "p50_ms": statistics.median(durations) * 1000,
+        "p95_ms": durations[max(int(len(durations) * 0.95) - 1, 0)] * 1000,
+        "index_mb": index["index_mb"] if index else 0.0,
+        "build_s": index["build_s"] if index else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--clusters", type=int, default=5000)
+    parser.add_argument(
+        "--noise", type=float, default=0.6, help="Độ lệch khỏi centroid"
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument(
+        "--truncate", default="768", help="Số chiều prefix, phân cách bằng dấu phẩy"
+    )
+    parser.add_argument("--rerank", default="1,4,10", help="Hệ số ứng viên re-rank")
+    parser.add_argument(
+        "--full-index", action="store_true", help="Build cả HNSW 3072 chiều"
+    )
+    parser.add_argument("--seed-from-db", action="store_true")
+    parser.add_argument("--reuse", action="store_true", help="Dùng lại bảng đã nạp")
+    parser.add_argument(
+        "--keep", action="store_true", help="Không xoá bảng sau khi chạy"
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    from config import settings
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(settings.DATABASE_URL)
+    rng = np.random.default_rng(42)
+    dimensions = args.dimensions
+    truncations = [int(x) for x in args.truncate.split(",") if x]
+    rerank_factors = [int(x) for x in args.rerank.split(",") if x]
+
+    centroids = make_centroids(
+        engine, args.clusters, dimensions, args.seed_from_db, rng
+    )
+    dimensions = centroids.shape[1]
+    if not args.reuse:
+        print(f"Loading {args.rows:,} x {dimensions} halfvec rows...")
+        elapsed = load(engine, centroids, args.rows, args.noise, args.batch_size, rng)
+        print(f"  {elapsed:.0f}s")
+
+    with engine.connect() as conn:
+        table_mb = (
+            conn.execute(text(f"SELECT pg_table_size('{TABLE}')")).scalar() / 2**20
+        )
+        halfvec_b, vector_b = conn.execute(
+            text(
+                "SELECT avg(pg_column_size(embedding)), "
+                "avg(pg_column_size(embedding::vector)) "
+                f"FROM (SELECT embedding FROM {TABLE} LIMIT 1000) s"
+            )
+        ).one()
+    print(
+        f"Table {table_mb:.0f} MB; "
+        f"per row halfvec {halfvec_b:.0f} B vs vector {vector_b:.0f} B"
+    )
+
+    queries = sample(centroids, args.queries, args.noise, rng)
+    truth, exact_durations = run_queries(
+        engine, search_sql("exact", dimensions), queries, args.k, args.k, 0, exact=True
+    )
+    rows = [summarize("exact", truth, truth, exact_durations, args.k)]
+
+    configs = [
+        (
+            f"truncated-{n}",
+            "truncated",
+            n,
+            f"ix_{TABLE}_trunc_{n}",
+            f"(subvector(embedding, 1, {n})::halfvec({n})) halfvec_cosine_ops",
+        )
+        for n in truncations
+    ]
+    configs.append(
+        (
+            "binary",
+            "binary",
+            0,
+            f"ix_{TABLE}_binary",
+            f"(binary_quantize(embedding)::bit({dimensions})) bit_hamming_ops",
+        )
+    )
+
+    for label, mode, truncate, index_name, expression in configs:
+        print(f"Building {index_name}...")
+        index = build_index(engine, index_name, expression)
+        for factor in rerank_factors:
+            results, durations = run_queries(
+                engine,
+                search_sql(mode, dimensions, truncate),
+                queries,
+                args.k,
+                args.k * factor,
+                truncate,
+                exact=False,
+            )
+            rows.append(
+                summarize(
+                    f"{label} x{factor}", results, truth, durations, args.k, index
+                )
+            )
+
+    if args.full_index:
+        print("Building full-dimension HNSW index...")
+        index = build_index(engine, f"ix_{TABLE}_full", "embedding halfvec_cosine_ops")
+        results, durations = run_queries(
+            engine,
+            search_sql("full", dimensions),
+            queries,
+            args.k,
+            args.k,
+            0,
+            exact=False,
+        )
+        rows.append(summarize("full", results, truth, durations, args.k, index))
+
+    print(
+        f"\n{'mode':<20}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'index MB':>10}{'build s':>10}"
+    )
+    for r in rows:
+        print(
+            f"{r['label']:<20}{r['recall']:>10.3f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+            f"{r['index_mb']:>10.0f}{r['build_s']:>10.0f}"
+        )
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
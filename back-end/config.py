@@ -2,7 +2,7 @@ from pathlib import Path
 from typing import Optional
 
 import yaml
-from pydantic import ConfigDict, Field
+from pydantic import ConfigDict, Field, model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -17,9 +17,52 @@ class Settings(BaseSettings):
     DATABASE_USER: str = "postgres"
     DATABASE_PASSWORD: str = ""
     DATABASE_NAME: str = "macro_mate"
+    DATABASE_POOL_SIZE: int = Field(
+        default=10, ge=1, description="Persistent connections in the async engine pool"
+    )
+    DATABASE_MAX_OVERFLOW: int = Field(
+        default=10,
+        ge=0,
+        description="Extra connections allowed above DATABASE_POOL_SIZE",
+    )
+    DATABASE_POOL_TIMEOUT: float = Field(
+        default=10, description="Seconds to wait for a free pooled connection"
+    )
+    DATABASE_SYNC_POOL_SIZE: int = Field(
+        default=5, ge=1, description="Persistent connections in the sync engine pool"
+    )
+    DATABASE_SYNC_MAX_OVERFLOW: int = Field(
+        default=5,
+        ge=0,
+        description="Extra connections allowed above DATABASE_SYNC_POOL_SIZE",
+    )
+    CHECKPOINT_POOL_MIN_SIZE: int = Field(
+        default=2,
+        ge=1,
+        description="Minimum connections kept by the LangGraph checkpointer pool",
+    )
+    CHECKPOINT_POOL_MAX_SIZE: int = Field(
+        default=5,
+        ge=1,
+        description="Maximum connections of the LangGraph checkpointer pool "
+        "(>= CHECKPOINT_POOL_MIN_SIZE)",
+    )
+    DATABASE_MAX_CONNECTIONS: int = Field(
+        default=35,
+        ge=1,
+        description="Per-process connection budget shared by the async, sync and "
+        "checkpointer pools (pools are scaled down to fit)",
+    )
+    DATABASE_STATEMENT_TIMEOUT: float = Field(
+        default=30, description="Postgres statement_timeout in seconds (0 = disabled)"
+    )
 
     # ===== API Settings =====
     API_V1_PREFIX: str = "/api/v1"
+    DEBUG: bool = Field(
+        default=False, description="Dev mode: uvicorn reload and SQL statement logging"
+    )
+    LOG_LEVEL: str = Field(default="INFO", description="Uvicorn log level")
 
     # ===== CORS =====
     ALLOWED_ORIGINS: list[str] = Field(
@@ -55,6 +98,29 @@ class Settings(BaseSettings):
         default=True, description="Auto fallback to alternative providers on failure"
     )
 
+    MODEL_WARMUP_CALL: bool = Field(
+        default=False,
+        description="Send a tiny stub request to each model during startup warm-up",
+    )
+    MODEL_WARMUP_TIMEOUT: float = Field(
+        default=15.0, description="Timeout (seconds) for each warm-up model call"
+    )
+
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = Field(
+        default=False,
+        description="Cache static prompt prefixes with Gemini explicit context caching",
+    )
+    GEMINI_CONTEXT_CACHE_TTL: int = Field(
+        default=3600, description="TTL (seconds) of cached prompt prefixes"
+    )
+    GEMINI_CONTEXT_CACHE_REFRESH_MARGIN: int = Field(
+        default=300, description="Extend a cached prefix this long before it expires"
+    )
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS: int = Field(
+        default=4096,
+        description="Smallest prefix (tokens) the model accepts for explicit caching",
+    )
+
     # ===== Paths =====
     MODEL_CONFIG_PATH: str = Field(
         default="model_config.yaml", description="Path to model configuration YAML"
@@ -76,6 +142,111 @@ class Settings(BaseSettings):
         ...,
         description="USDA FoodData Central API key"
     )
+    USDA_LOCAL_MIRROR: bool = Field(
+        default=False,
+        description="Search the local usda_foods mirror (usda_import.py) before "
+        "the live API",
+    )
+    USDA_API_FALLBACK: bool = Field(
+        default=True,
+        description="Call api.nal.usda.gov when the local mirror has no match",
+    )
+    USDA_SPECULATIVE_PREFETCH: bool = Field(
+        default=True,
+        description="Dispatch USDA lookups while the VLM is still streaming its JSON",
+    )
+    USDA_REQUEST_TIMEOUT: float = Field(
+        default=5.0, description="Timeout of a single USDA API request in seconds"
+    )
+    USDA_BATCH_BUDGET: float = Field(
+        default=8.0,
+        description="Total seconds nutrition lookup may spend on USDA before "
+        "using estimates",
+    )
+    USDA_MAX_CONCURRENCY: int = Field(
+        default=4, description="Concurrent USDA API requests per worker"
+    )
+    USDA_RATE_LIMIT_PER_HOUR: int = Field(
+        default=1000, description="USDA API key limit (requests per hour)"
+    )
+    USDA_RATE_LIMIT_BURST: int = Field(
+        default=20, description="Token bucket capacity for USDA requests"
+    )
+    USDA_RATE_LIMIT_DISTRIBUTED: bool = Field(
+        default=False, description="Share the USDA rate limit across workers via Redis"
+    )
+    USDA_HEDGE_AFTER: float = Field(
+        default=1.5, description="Send a hedged USDA request after this many seconds"
+    )
+    USDA_MAX_RETRIES: int = Field(
+        default=2, description="Retries for timeouts, 429 and 5xx from USDA"
+    )
+    USDA_BREAKER_FAILURES: int = Field(
+        default=5, description="Consecutive USDA failures before the circuit opens"
+    )
+    USDA_BREAKER_RESET_SECONDS: float = Field(
+        default=30.0, description="Seconds the USDA circuit stays open before a probe"
+    )
+    USDA_CACHE_L1_SIZE: int = Field(
+        default=1024, description="In-process LRU entries for USDA lookups"
+    )
+    USDA_CACHE_L1_TTL: int = Field(
+        default=3600, description="In-process USDA cache TTL in seconds"
+    )
+    USDA_CACHE_TTL: int = Field(
+        default=604800, description="Redis USDA cache TTL in seconds (7 days)"
+    )
+    USDA_NEGATIVE_CACHE_TTL: int = Field(
+        default=600, description="TTL for cached 'no USDA match' results in seconds"
+    )
+    USDA_MATCH_MIN_SCORE: float = Field(
+        default=0.35, description="Minimum matcher score (0-1) to accept a USDA food"
+    )
+    USDA_INGREDIENT_MAP_ENABLED: bool = Field(
+        default=True,
+        description="Persist resolved ingredient → fdc_id mappings and reuse them "
+        "before searching",
+    )
+
+    # ===== Embeddings (pgvector) =====
+    EMBEDDING_PROVIDER: str = Field(
+        default="gemini",
+        description="Embedding backend: gemini or local (hashing, no API)",
+    )
+    EMBEDDING_MODEL: str = Field(
+        default="models/gemini-embedding-001", description="Gemini embedding model"
+    )
+    EMBEDDING_BATCH_SIZE: int = Field(
+        default=100, description="Texts per embedding request"
+    )
+    EMBEDDING_CACHE_SIZE: int = Field(
+        default=2048, description="In-process cache of embedded texts"
+    )
+    EMBEDDING_LOOKUP_ENABLED: bool = Field(
+        default=False,
+        description="Resolve name_vi to the nearest verified USDA match (ANN) "
+        "before text search",
+    )
+    EMBEDDING_MATCH_MAX_DISTANCE: float = Field(
+        default=0.12, description="Max cosine distance for an ANN ingredient match"
+    )
+    EMBEDDING_LOOKUP_TIMEOUT: float = Field(
+        default=1.5,
+        description="Timeout for embedding + ANN query per ingredient (seconds)",
+    )
+    EMBEDDING_HNSW_EF_SEARCH: int = Field(
+        default=40,
+        description="hnsw.ef_search for ANN queries (higher = better recall, slower)",
+    )
+    EMBEDDING_SEARCH_MODE: str = Field(
+        default="truncated",
+        description="ANN candidate search: truncated (768-dim prefix), "
+        "binary (quantized) or exact",
+    )
+    EMBEDDING_RERANK_FACTOR: int = Field(
+        default=4,
+        description="Candidates per result re-ranked on full-precision vectors",
+    )
 
     # ===== Pydantic Config =====
     model_config = ConfigDict(
@@ -112,10 +283,122 @@ class Settings(BaseSettings):
     CLOUDINARY_MAX_FILE_SIZE: int = Field(
         default=10 * 1024 * 1024, description="Max file size in bytes"  # 10MB
     )
+    CLOUDINARY_MAX_CONCURRENCY: int = Field(
+        default=4, ge=1, description="Max concurrent Cloudinary API calls per worker"
+    )
+    CLOUDINARY_MAX_RETRIES: int = Field(
+        default=3, ge=0, description="Retries on network errors / 429 / 5xx"
+    )
+    CLOUDINARY_TIMEOUT: float = Field(
+        default=30.0, description="Cloudinary HTTP timeout in seconds"
+    )
+    CLOUDINARY_UPLOAD_PREFIX: Optional[str] = Field(
+        default=None,
+        description="Override Cloudinary API base URL (e.g. local stand-in for tests)",
+    )
+
+    # ===== Image Processing =====
+    IMAGE_PROCESS_WORKERS: int = Field(
+        default=2, ge=1, description="Number of image processing worker processes"
+    )
+    IMAGE_QUEUE_DEPTH: int = Field(
+        default=8,
+        ge=0,
+        description="Max image jobs waiting for a worker before returning 429",
+    )
+    UPLOAD_SPOOL_THRESHOLD: int = Field(
+        default=1024 * 1024,
+        description="Uploads larger than this (bytes) are spooled to a temp file",
+    )
+    IMAGE_FETCH_TIMEOUT: float = Field(
+        default=10.0, description="HTTP timeout for URL-based vision inputs"
+    )
+    IMAGE_FETCH_MAX_BYTES: int = Field(
+        default=10 * 1024 * 1024,
+        description="Abort image downloads larger than this (bytes)",
+    )
+    IMAGE_FETCH_CACHE_DIR: Optional[str] = Field(
+        default=None,
+        description="On-disk cache for fetched images (default: system temp dir)",
+    )
+    IMAGE_FETCH_CACHE_MAX_BYTES: int = Field(
+        default=200 * 1024 * 1024,
+        ge=0,
+        description="Max size of the fetched image disk cache (0 = disabled)",
+    )
+    IMAGE_FETCH_CACHE_FRESH_SECONDS: int = Field(
+        default=300,
+        description="Serve cached images without revalidating (ETag) for this long",
+    )
+
+    # ===== SSE =====
+    SSE_FLUSH_INTERVAL_MS: int = Field(
+        default=40, description="Max time tokens are buffered before an SSE flush"
+    )
+    SSE_FLUSH_BYTES: int = Field(
+        default=512, description="Flush buffered tokens once they exceed this size"
+    )
+
+    # ===== Thread Locks =====
+    THREAD_LOCK_DISTRIBUTED: bool = Field(
+        default=False,
+        description="Serialize requests per chat thread across workers via Redis",
+    )
+    THREAD_LOCK_LEASE_SECONDS: float = Field(
+        default=60.0, description="Redis thread lock lease (renewed while held)"
+    )
+    THREAD_LOCK_ACQUIRE_TIMEOUT: float = Field(
+        default=30.0, description="Max wait for a busy thread before failing"
+    )
+
+    # ===== Analysis Job Queue =====
+    ANALYSIS_WORKER_ENABLED: bool = Field(
+        default=True,
+        description="Run analysis job workers inside the API process",
+    )
+    ANALYSIS_WORKER_CONCURRENCY: int = Field(
+        default=2, ge=1, description="Concurrent analysis jobs per process"
+    )
+    ANALYSIS_JOB_POLL_INTERVAL: float = Field(
+        default=1.0, description="Seconds between job queue polls when idle"
+    )
+    ANALYSIS_JOB_LEASE_SECONDS: int = Field(
+        default=120,
+        description="RUNNING jobs not renewed within this window are re-claimed",
+    )
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = Field(
+        default=3, ge=1, description="Attempts before a job is marked failed"
+    )
+
+    # ===== Analysis Result Cache =====
+    ANALYSIS_CACHE_ENABLED: bool = Field(
+        default=True, description="Cache image analysis results by image hash"
+    )
+    ANALYSIS_CACHE_TTL: int = Field(
+        default=30 * 24 * 3600, description="Redis TTL for cached analyses (seconds)"
+    )
+    ANALYSIS_CACHE_PHASH_DISTANCE: int = Field(
+        default=3,
+        ge=0,
+        le=3,
+        description="Max perceptual-hash Hamming distance for near-duplicate hits",
+    )
+    ANALYSIS_CACHE_VERSION: str = Field(
+        default="1", description="Bump to invalidate all cached analyses"
+    )
 
     # ===== YAML Config Cache =====
     _yaml_config: dict = {}
 
+    @model_validator(mode="after")
+    def _check_pool_sizes(self) -> "Settings":
+        if self.CHECKPOINT_POOL_MAX_SIZE < self.CHECKPOINT_POOL_MIN_SIZE:
+            raise ValueError(
+                f"CHECKPOINT_POOL_MAX_SIZE ({self.CHECKPOINT_POOL_MAX_SIZE}) must be "
+                f">= CHECKPOINT_POOL_MIN_SIZE ({self.CHECKPOINT_POOL_MIN_SIZE})"
+            )
+        return self
+
     def model_post_init(self, __context) -> None:
         self._load_yaml_config()
 
@@ -238,6 +521,11 @@ class Settings(BaseSettings):
             f"@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.DATABASE_NAME}"
         )
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """psycopg 3 (async) driver cho AsyncEngine"""
+        return self.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
+
     # class Config:
     #     env_file = ".env"
 
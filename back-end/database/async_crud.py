@@ -0,0 +1,545 @@
+"""
+CRUD async (AsyncSession): user, food, meal, analysis job
+
+Dùng bởi router và analysis worker. Lưu ý:
+- Không có lazy load trong AsyncSession → relationship được load sẵn
+  bằng selectinload (FoodDB.direction, UserMealDB.items)
+- Session tạo với expire_on_commit=False → object đọc được sau commit
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from database.models import (
+    AnalysisJobDB,
+    AnalysisJobStatusDB,
+    AnalysisStatusDB,
+    FoodDB,
+    MealItemDB,
+    MealTypeDB,
+    NutritionAnalysisLogDB,
+    UserDB,
+    UserMealDB,
+)
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[UserDB]:
+    """Get user by email"""
+    result = await db.execute(select(UserDB).where(UserDB.email == email))
+    return result.scalars().first()
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[UserDB]:
+    """Get user by ID"""
+    return await db.get(UserDB, user_id)
+
+
+async def create_user(db: AsyncSession, email: str, hashed_password: str) -> UserDB:
+    """Create new user - username tự động lấy từ email"""
+    username = email.split("@")[0]
+
+    db_user = UserDB(
+        email=email, username=username, hashed_password=hashed_password, is_active=True
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def update_user_profile(
+    db: AsyncSession, user_id: int, profile_data: Dict
+) -> Optional[UserDB]:
+    """Update user profile"""
+    user = await get_user_by_id(db, user_id)
+    if not user:
+        return None
+
+    # Update only provided fields
+    for key, value in profile_data.items():
+        if hasattr(user, key) and value is not None:
+            setattr(user, key, value)
+
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def create_user_profile(
+    db: AsyncSession, user_id: int, profile_data: Dict
+) -> Optional[UserDB]:
+    """Create/Update user profile - alias for update_user_profile"""
+    return await update_user_profile(db, user_id, profile_data)
+
+
+# ============= Food CRUD Operations =============
+
+
+async def get_foods(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    meal_type: Optional[str] = None,
+    equipment: Optional[str] = None,
+    max_complexity: Optional[int] = None,
+    search: Optional[str] = None,
+) -> List[FoodDB]:
+    """Get list of foods with optional filters (xem crud.get_foods)"""
+    query = select(FoodDB)
+
+    # Filter by meal type
+    if meal_type:
+        meal_type_map = {
+            "breakfast": FoodDB.is_breakfast,
+            "lunch": FoodDB.is_lunch,
+            "dinner": FoodDB.is_dinner,
+            "snack": FoodDB.is_snack,
+            "dessert": FoodDB.is_dessert,
+        }
+        if meal_type in meal_type_map:
+            query = query.where(meal_type_map[meal_type])
+
+    # Filter by equipment
+    if equipment:
+        equipment_map = {
+            "blender": FoodDB.needs_blender,
+            "oven": FoodDB.needs_oven,
+            "stove": FoodDB.needs_stove,
+            "slow_cooker": FoodDB.needs_slow_cooker,
+            "toaster": FoodDB.needs_toaster,
+            "food_processor": FoodDB.needs_food_processor,
+            "microwave": FoodDB.needs_microwave,
+            "grill": FoodDB.needs_grill,
+        }
+        if equipment in equipment_map:
+            query = query.where(equipment_map[equipment])
+
+    # Filter by complexity
+    if max_complexity is not None:
+        query = query.where(FoodDB.complexity <= max_complexity)
+
+    # Search by name
+    if search:
+        query = query.where(FoodDB.name.ilike(f"%{search}%"))
+
+    # selectinload: LIMIT áp dụng lên food, không bị nhân bản theo direction
+    query = query.options(selectinload(FoodDB.direction)).offset(skip).limit(limit)
+
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def get_food_by_id(db: AsyncSession, food_id: int) -> Optional[FoodDB]:
+    """Get food by ID with directions"""
+    result = await db.execute(
+        select(FoodDB)
+        .options(selectinload(FoodDB.direction))
+        .where(FoodDB.id == food_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def create_food(db: AsyncSession, food_data: Dict) -> FoodDB:
+    """Create new food"""
+    db_food = FoodDB(**food_data)
+    db.add(db_food)
+    await db.commit()
+    return await get_food_by_id(db, db_food.id)
+
+
+async def update_food(
+    db: AsyncSession, food_id: int, food_data: Dict
+) -> Optional[FoodDB]:
+    """Update food"""
+    food = await get_food_by_id(db, food_id)
+    if not food:
+        return None
+
+    # Update only provided fields
+    for key, value in food_data.items():
+        if hasattr(food, key) and value is not None:
+            setattr(food, key, value)
+
+    await db.commit()
+    return await get_food_by_id(db, food_id)
+
+
+async def delete_food(db: AsyncSession, food_id: int) -> bool:
+    """Delete food"""
+    food = await get_food_by_id(db, food_id)
+    if not food:
+        return False
+
+    await db.delete(food)
+    await db.commit()
+    return True
+
+
+# ============= User Meal CRUD Operations =============
+
+
+async def create_user_meal(
+    db: AsyncSession,
+    user_id: int,
+    image_url: str,
+    meal_type: MealTypeDB = MealTypeDB.SNACK,
+    meal_name: Optional[str] = None,
+    meal_time: Optional[datetime] = None,
+) -> UserMealDB:
+    """Create a new user meal record (PENDING)"""
+    db_meal = UserMealDB(
+        user_id=user_id,
+        image_url=image_url,
+        meal_type=meal_type,
+        meal_time=meal_time,
+        meal_name=meal_name,
+        analysis_status=AnalysisStatusDB.PENDING,
+    )
+    db.add(db_meal)
+    await db.commit()
+    await db.refresh(db_meal)
+    return db_meal
+
+
+async def update_meal_analysis(
+    db: AsyncSession,
+    meal_id: int,
+    analysis_data: Dict,
+    model_name: Optional[str] = None,
+) -> Optional[UserMealDB]:
+    """
+    Update meal with analysis results: tạo meal items, tính tổng dinh dưỡng,
+    ghi analysis log
+
+    Returns:
+        Meal đã cập nhật (kèm items) hoặc None nếu không tồn tại
+    """
+    meal = await db.get(UserMealDB, meal_id)
+    if not meal:
+        return None
+
+    # Update meal name if available
+    if analysis_data.get("dish_name"):
+        meal.meal_name = analysis_data["dish_name"]
+
+    # Phân tích lại (job retry / claim lại) thay thế items cũ, không cộng dồn
+    await db.execute(delete(MealItemDB).where(MealItemDB.meal_id == meal_id))
+
+    totals = dict.fromkeys(
+        ("calories", "protein", "fat", "carbs", "fiber", "sodium"), 0.0
+    )
+
+    # Create meal items from ingredients
+    for ingredient in analysis_data.get("ingredients", []):
+        nutrition = ingredient.get("nutrition", {})
+        for key in totals:
+            totals[key] += nutrition.get(key, 0) or 0
+
+        db.add(
+            MealItemDB(
+                meal_id=meal_id,
+                name=ingredient.get("name"),
+                estimated_weight=ingredient.get("estimated_weight"),
+                calories=nutrition.get("calories"),
+                protein=nutrition.get("protein"),
+                fat=nutrition.get("fat"),
+                carbs=nutrition.get("carbs"),
+                fiber=nutrition.get("fiber"),
+                sodium=nutrition.get("sodium"),
+                nutrition_json=nutrition,
+            )
+        )
+
+    # Update meal totals
+    meal.total_calories = totals["calories"]
+    meal.total_protein = totals["protein"]
+    meal.total_fat = totals["fat"]
+    meal.total_carbs = totals["carbs"]
+    meal.total_fiber = totals["fiber"]
+    meal.total_sodium = totals["sodium"]
+    meal.analysis_status = AnalysisStatusDB.SUCCESS
+
+    # Create analysis log
+    db.add(
+        NutritionAnalysisLogDB(
+            meal_id=meal_id,
+            model_name=model_name,
+            raw_response=analysis_data,
+            confidence=analysis_data.get("confidence"),
+        )
+    )
+
+    await db.commit()
+    return await get_user_meal_by_id(db, meal_id)
+
+
+async def get_user_meal_by_id(db: AsyncSession, meal_id: int) -> Optional[UserMealDB]:
+    """Get user meal by ID with all related data"""
+    result = await db.execute(
+        select(UserMealDB)
+        .options(selectinload(UserMealDB.items))
+        .where(UserMealDB.id == meal_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def update_meal_image_url(
+    db: AsyncSession, meal_id: int, image_url: str
+) -> Optional[UserMealDB]:
+    """Update meal's image_url after async Cloudinary upload completes"""
+    meal = await db.get(UserMealDB, meal_id)
+    if not meal:
+        return None
+
+    meal.image_url = image_url
+    await db.commit()
+    await db.refresh(meal)
+    return meal
+
+
+async def get_user_meals(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    meal_type: Optional[MealTypeDB] = None,
+) -> List[UserMealDB]:
+    """Get list of user meals (mới nhất trước)"""
+    query = (
+        select(UserMealDB)
+        .options(selectinload(UserMealDB.items))
+        .where(UserMealDB.user_id == user_id)
+    )
+
+    if meal_type:
+        query = query.where(UserMealDB.meal_type == meal_type)
+
+    result = await db.execute(
+        query.order_by(UserMealDB.meal_time.desc()).offset(skip).limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def mark_meal_failed(
+    db: AsyncSession, meal_id: int, error_message: str
+) -> Optional[UserMealDB]:
+    """Mark meal analysis as failed"""
+    meal = await db.get(UserMealDB, meal_id)
+    if not meal:
+        return None
+
+    meal.analysis_status = AnalysisStatusDB.FAILED
+
+    # Create analysis log with error
+    db.add(
+        NutritionAnalysisLogDB(
+            meal_id=meal_id,
+            raw_response={"error": error_message},
+        )
+    )
+
+    await db.commit()
+    await db.refresh(meal)
+    return meal
+
+
+async def get_user_meals_by_date_range(
+    db: AsyncSession,
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    meal_type: Optional[MealTypeDB] = None,
+) -> List[UserMealDB]:
+    """Các bữa ăn phân tích thành công trong khoảng [start_date, end_date], kèm items"""
+    query = (
+        select(UserMealDB)
+        .options(selectinload(UserMealDB.items))
+        .where(
+            UserMealDB.user_id == user_id,
+            UserMealDB.meal_time >= start_date,
+            UserMealDB.meal_time <= end_date,
+            UserMealDB.analysis_status == AnalysisStatusDB.SUCCESS,
+        )
+    )
+
+    if meal_type:
+        query = query.where(UserMealDB.meal_type == meal_type)
+
+    result = await db.execute(query.order_by(UserMealDB.meal_time.asc()))
+    return list(result.scalars().all())
+
+
+# ============= Analysis Job Operations =============
+
+
+async def enqueue_analysis_job(
+    db: AsyncSession,
+    meal_id: int,
+    user_id: int,
+    image_data: bytes,
+    content_type: str,
+) -> AnalysisJobDB:
+    """Tạo job QUEUED cho meal (ảnh đã optimize lưu kèm job)"""
+    job = AnalysisJobDB(
+        meal_id=meal_id,
+        user_id=user_id,
+        image_data=image_data,
+        content_type=content_type,
+        status=AnalysisJobStatusDB.QUEUED,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def claim_analysis_job(
+    db: AsyncSession, worker_id: str, lease_seconds: int, max_attempts: int
+) -> Optional[AnalysisJobDB]:
+    """
+    Claim job tiếp theo: QUEUED, hoặc RUNNING nhưng lease đã hết hạn
+    (worker cũ crash) và còn lượt retry
+
+    Job hết lease đã dùng hết max_attempts (worker crash / quá lease mỗi lần)
+    được đánh dấu FAILED thay vì claim lại mãi
+
+    FOR UPDATE SKIP LOCKED → nhiều worker claim song song không trùng job
+    """
+    now = datetime.now(timezone.utc)
+    expired = and_(
+        AnalysisJobDB.status == AnalysisJobStatusDB.RUNNING,
+        AnalysisJobDB.locked_at < now - timedelta(seconds=lease_seconds),
+    )
+
+    result = await db.execute(
+        select(AnalysisJobDB)
+        .where(expired, AnalysisJobDB.attempts >= max_attempts)
+        .with_for_update(skip_locked=True)
+    )
+    exhausted = list(result.scalars().all())
+    for job in exhausted:
+        job.status = AnalysisJobStatusDB.FAILED
+        job.image_data = None
+        job.locked_by = None
+        job.last_error = f"Lease expired after {job.attempts} attempts"
+    for job in exhausted:
+        await mark_meal_failed(db, job.meal_id, job.last_error)
+
+    result = await db.execute(
+        select(AnalysisJobDB)
+        .where(
+            or_(
+                AnalysisJobDB.status == AnalysisJobStatusDB.QUEUED,
+                and_(expired, AnalysisJobDB.attempts < max_attempts),
+            )
+        )
+        .order_by(AnalysisJobDB.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = result.scalars().first()
+    if not job:
+        await db.rollback()
+        return None
+
+    job.status = AnalysisJobStatusDB.RUNNING
+    job.locked_by = worker_id
+    job.locked_at = now
+    job.attempts += 1
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def renew_analysis_job_lease(
+    db: AsyncSession, job_id: int, worker_id: str
+) -> bool:
+    """Gia hạn lease; False nếu job đã bị worker khác claim lại"""
+    result = await db.execute(
+        update(AnalysisJobDB)
+        .where(
+            AnalysisJobDB.id == job_id,
+            AnalysisJobDB.locked_by == worker_id,
+            AnalysisJobDB.status == AnalysisJobStatusDB.RUNNING,
+        )
+        .values(locked_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return bool(result.rowcount)
+
+
+async def _get_owned_job(
+    db: AsyncSession, job_id: int, worker_id: str
+) -> Optional[AnalysisJobDB]:
+    """Job RUNNING còn do worker_id giữ lease (khóa row tới khi commit)"""
+    result = await db.execute(
+        select(AnalysisJobDB)
+        .where(
+            AnalysisJobDB.id == job_id,
+            AnalysisJobDB.locked_by == worker_id,
+            AnalysisJobDB.status == AnalysisJobStatusDB.RUNNING,
+        )
+        .with_for_update()
+    )
+    return result.scalars().first()
+
+
+async def complete_analysis_job(db: AsyncSession, job_id: int, worker_id: str) -> bool:
+    """
+    Đánh dấu job SUCCEEDED và xóa ảnh đã lưu
+
+    False nếu worker_id không còn giữ lease (job đã bị worker khác claim lại)
+    """
+    job = await _get_owned_job(db, job_id, worker_id)
+    if not job:
+        await db.rollback()
+        return False
+
+    job.status = AnalysisJobStatusDB.SUCCEEDED
+    job.image_data = None
+    job.locked_by = None
+    job.last_error = None
+    await db.commit()
+    return True
+
+
+async def fail_analysis_job(
+    db: AsyncSession, job_id: int, worker_id: str, error_message: str, max_attempts: int
+) -> Optional[AnalysisJobDB]:
+    """
+    Ghi nhận lỗi: còn lượt retry → QUEUED lại, hết lượt → FAILED
+
+    None nếu worker_id không còn giữ lease (không ghi đè trạng thái của
+    worker đang xử lý job)
+    """
+    job = await _get_owned_job(db, job_id, worker_id)
+    if not job:
+        await db.rollback()
+        return None
+
+    job.last_error = error_message
+    job.locked_by = None
+    if job.attempts >= max_attempts:
+        job.status = AnalysisJobStatusDB.FAILED
+        job.image_data = None
+    else:
+        job.status = AnalysisJobStatusDB.QUEUED
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def get_analysis_job_by_meal_id(
+    db: AsyncSession, meal_id: int
+) -> Optional[AnalysisJobDB]:
+    """Get job theo meal ID"""
+    result = await db.execute(
+        select(AnalysisJobDB).where(AnalysisJobDB.meal_id == meal_id)
+    )
+    return result.scalars().first()
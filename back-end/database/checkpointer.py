@@ -2,6 +2,11 @@ import logging
 from typing import Optional
 
 from config import settings
+from database.pool import (
+    connection_options,
+    instrumented_connection_pool,
+    pool_budget,
+)
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from psycopg_pool import AsyncConnectionPool
 
@@ -27,14 +32,19 @@ class AsyncPostgresCheckpointerManager:
             connection_kwargs = {
                 "autocommit": True,
                 "prepare_threshold": 0,
-                "options": f"-c search_path={self.schema},public",
+                "options": (
+                    f"-c search_path={self.schema},public {connection_options()}"
+                ).strip(),
             }
 
             # ✅ Create pool WITHOUT opening it
-            self._pool = AsyncConnectionPool(
+            # Kích thước lấy từ budget chung với ORM engine (database/pool.py)
+            limits = pool_budget()["checkpointer"]
+            self._pool = instrumented_connection_pool("checkpointer")(
                 self.database_url,
-                min_size=2,
-                max_size=10,
+                min_size=limits.size,
+                max_size=limits.max_size,
+                timeout=settings.DATABASE_POOL_TIMEOUT,
                 kwargs=connection_kwargs,
                 open=False,
             )
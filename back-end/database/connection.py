@@ -1,14 +1,30 @@
 from config import settings
+from database.pool import engine_kwargs
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+# Sync engine: analysis cache, USDA mirror/mapping, embedding index (gọi qua
+# asyncio.to_thread), init_db và các script CLI.
+# Pool size, timeout, echo (DEBUG): xem database/pool.py
 engine = create_engine(
-    settings.DATABASE_URL, pool_pre_ping=True, pool_recycle=3600, echo=True
+    settings.DATABASE_URL, **engine_kwargs("orm_sync", is_async=False)
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: router và analysis worker (không block event loop khi chờ DB)
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL, **engine_kwargs("orm_async", is_async=True)
+)
+
+# expire_on_commit=False: đọc attribute sau commit không phát sinh lazy load
+# (lazy load trong AsyncSession raise MissingGreenlet)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
@@ -18,3 +34,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def close_async_engine() -> None:
+    await async_engine.dispose()
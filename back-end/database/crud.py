@@ -1,425 +1,346 @@
-from datetime import datetime
+"""
+CRUD sync (Session) cho service chạy qua asyncio.to_thread và CLI:
+analysis cache, USDA mirror / ingredient map, embedding
+
+User, food, meal, analysis job: xem database/async_crud.py
+"""
+
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
 
 from database.models import (
-    AnalysisStatusDB,
-    FoodDB,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_SEARCH_DIMENSIONS,
+    AnalysisCacheDB,
     MealItemDB,
-    MealTypeDB,
-    NutritionAnalysisLogDB,
-    UserDB,
-    UserMealDB,
+    NutritionEmbeddingDB,
+    UsdaFoodDB,
+    UsdaIngredientMapDB,
 )
-from sqlalchemy.orm import Session, joinedload
+from pgvector.sqlalchemy import BIT, HALFVEC
+from sqlalchemy import cast, func, literal_column, or_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, defer
 
+# ============= Analysis Cache Operations =============
 
-def get_user_by_email(db: Session, email: str) -> Optional[UserDB]:
-    """Get user by email"""
-    return db.query(UserDB).filter(UserDB.email == email).first()
 
+def get_analysis_cache_entry(
+    db: Session, cache_version: str, content_hash: str
+) -> Optional[AnalysisCacheDB]:
+    """Exact match theo content hash"""
+    return (
+        db.query(AnalysisCacheDB)
+        .filter(
+            AnalysisCacheDB.cache_version == cache_version,
+            AnalysisCacheDB.content_hash == content_hash,
+        )
+        .first()
+    )
 
-def get_user_by_id(db: Session, user_id: int) -> Optional[UserDB]:
-    """Get user by ID"""
-    return db.query(UserDB).filter(UserDB.id == user_id).first()
 
+def find_analysis_cache_candidates(
+    db: Session, cache_version: str, bands: List[int], limit: int = 20
+) -> List[AnalysisCacheDB]:
+    """Các entry trùng ít nhất một phash band (ứng viên near-duplicate)"""
+    band_columns = [
+        AnalysisCacheDB.phash_band_0,
+        AnalysisCacheDB.phash_band_1,
+        AnalysisCacheDB.phash_band_2,
+        AnalysisCacheDB.phash_band_3,
+    ]
+    return (
+        db.query(AnalysisCacheDB)
+        .filter(
+            AnalysisCacheDB.cache_version == cache_version,
+            or_(*(column == band for column, band in zip(band_columns, bands))),
+        )
+        .order_by(AnalysisCacheDB.id.desc())
+        .limit(limit)
+        .all()
+    )
 
-def create_user(db: Session, email: str, hashed_password: str) -> UserDB:
-    """Create new user - username tự động lấy từ email"""
-    username = email.split("@")[0]
 
-    db_user = UserDB(
-        email=email, username=username, hashed_password=hashed_password, is_active=True
+def create_analysis_cache_entry(
+    db: Session,
+    cache_version: str,
+    content_hash: str,
+    phash: int,
+    bands: List[int],
+    result: Dict,
+    component_detection: Optional[Dict] = None,
+    estimated_tokens: int = 0,
+) -> Optional[AnalysisCacheDB]:
+    """Lưu entry mới (bỏ qua nếu request khác đã lưu cùng key)"""
+    entry = AnalysisCacheDB(
+        cache_version=cache_version,
+        content_hash=content_hash,
+        phash=phash,
+        phash_band_0=bands[0],
+        phash_band_1=bands[1],
+        phash_band_2=bands[2],
+        phash_band_3=bands[3],
+        result=result,
+        component_detection=component_detection,
+        estimated_tokens=estimated_tokens,
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    db.add(entry)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(entry)
+    return entry
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    """Get list of users"""
-    return db.query(UserDB).offset(skip).limit(limit).all()
+def touch_analysis_cache_entry(db: Session, entry_id: int) -> None:
+    """Tăng hit_count + cập nhật last_hit_at"""
+    db.query(AnalysisCacheDB).filter(AnalysisCacheDB.id == entry_id).update(
+        {
+            AnalysisCacheDB.hit_count: AnalysisCacheDB.hit_count + 1,
+            AnalysisCacheDB.last_hit_at: datetime.now(timezone.utc),
+        }
+    )
+    db.commit()
 
 
-def update_user_profile(
-    db: Session, user_id: int, profile_data: Dict
-) -> Optional[UserDB]:
-    """Update user profile"""
-    user = get_user_by_id(db, user_id)
-    if not user:
-        return None
+# ============= USDA Mirror Operations =============
 
-    # Update only provided fields
-    for key, value in profile_data.items():
-        if hasattr(user, key) and value is not None:
-            setattr(user, key, value)
 
+def upsert_usda_foods(db: Session, foods: List[Dict]) -> int:
+    """Insert/update theo fdc_id (import lại dump mới không tạo bản trùng)"""
+    if not foods:
+        return 0
+    stmt = pg_insert(UsdaFoodDB).values(foods)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UsdaFoodDB.fdc_id],
+        set_={
+            column: stmt.excluded[column]
+            for column in foods[0]
+            if column != "fdc_id"
+        },
+    )
+    db.execute(stmt)
     db.commit()
-    db.refresh(user)
-    return user
+    return len(foods)
 
 
-def create_user_profile(
-    db: Session, user_id: int, profile_data: Dict
-) -> Optional[UserDB]:
-    """Create/Update user profile - alias for update_user_profile"""
-    return update_user_profile(db, user_id, profile_data)
+def count_usda_foods(db: Session) -> int:
+    return db.query(func.count(UsdaFoodDB.fdc_id)).scalar() or 0
 
 
-# ============= Food CRUD Operations =============
-
-
-def get_foods(
+def search_usda_foods(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
-    meal_type: Optional[str] = None,
-    equipment: Optional[str] = None,
-    max_complexity: Optional[int] = None,
-    search: Optional[str] = None,
-) -> List[FoodDB]:
-    """
-    Get list of foods with optional filters
-
-    Args:
-        db: Database session
-        skip: Number of records to skip (pagination)
-        limit: Maximum number of records to return
-        meal_type: Filter by meal type (breakfast, lunch, dinner, snack, dessert)
-        equipment: Filter by required equipment
-        max_complexity: Filter by maximum complexity level
-        search: Search by food name
+    terms: List[str],
+    name: str,
+    data_types: List[str],
+    limit: int = 10,
+) -> List[UsdaFoodDB]:
     """
-    query = db.query(FoodDB)
-
-    # Filter by meal type
-    if meal_type:
-        if meal_type == "breakfast":
-            query = query.filter(FoodDB.is_breakfast)
-        elif meal_type == "lunch":
-            query = query.filter(FoodDB.is_lunch)
-        elif meal_type == "dinner":
-            query = query.filter(FoodDB.is_dinner)
-        elif meal_type == "snack":
-            query = query.filter(FoodDB.is_snack)
-        elif meal_type == "dessert":
-            query = query.filter(FoodDB.is_dessert)
-
-    # Filter by equipment
-    if equipment:
-        equipment_map = {
-            "blender": FoodDB.needs_blender,
-            "oven": FoodDB.needs_oven,
-            "stove": FoodDB.needs_stove,
-            "slow_cooker": FoodDB.needs_slow_cooker,
-            "toaster": FoodDB.needs_toaster,
-            "food_processor": FoodDB.needs_food_processor,
-            "microwave": FoodDB.needs_microwave,
-            "grill": FoodDB.needs_grill,
-        }
-        if equipment in equipment_map:
-            query = query.filter(equipment_map[equipment])
-
-    # Filter by complexity
-    if max_complexity is not None:
-        query = query.filter(FoodDB.complexity <= max_complexity)
+    Full-text (OR các từ, giống requireAllWords=false của FDC API) hoặc
+    trigram gần đúng với `name`, xếp theo ts_rank + similarity
 
-    # Search by name
-    if search:
-        query = query.filter(FoodDB.name.ilike(f"%{search}%"))
-
-    # Eager load directions and order them by 'order' field
-    query = query.options(joinedload(FoodDB.direction))
-
-    return query.offset(skip).limit(limit).all()
+    terms chỉ chứa [a-z0-9] (đã lọc ở caller) → ghép thẳng vào to_tsquery
+    """
+    if not terms:
+        return []
+    ts_query = func.to_tsquery("english", " | ".join(terms))
+    score = func.ts_rank(UsdaFoodDB.search_vector, ts_query) + func.similarity(
+        UsdaFoodDB.description, name
+    )
+    return (
+        db.query(UsdaFoodDB)
+        .options(defer(UsdaFoodDB.search_vector))
+        .filter(
+            UsdaFoodDB.data_type.in_(data_types),
+            or_(
+                UsdaFoodDB.search_vector.op("@@")(ts_query),
+                UsdaFoodDB.description.op("%")(name),
+            ),
+        )
+        .order_by(score.desc())
+        .limit(limit)
+        .all()
+    )
 
 
-def get_food_by_id(db: Session, food_id: int) -> Optional[FoodDB]:
-    """Get food by ID with directions"""
+def get_usda_ingredient_mapping(
+    db: Session, ingredient_key: str, matcher_version: str
+) -> Optional[UsdaIngredientMapDB]:
     return (
-        db.query(FoodDB)
-        .options(joinedload(FoodDB.direction))
-        .filter(FoodDB.id == food_id)
+        db.query(UsdaIngredientMapDB)
+        .filter(
+            UsdaIngredientMapDB.ingredient_key == ingredient_key,
+            UsdaIngredientMapDB.matcher_version == matcher_version,
+        )
         .first()
     )
 
 
-def get_food_by_raw_id(db: Session, raw_id: int) -> Optional[FoodDB]:
-    """Get food by raw_id"""
-    return db.query(FoodDB).filter(FoodDB.raw_id == raw_id).first()
-
-
-def create_food(db: Session, food_data: Dict) -> FoodDB:
-    """Create new food"""
-    db_food = FoodDB(**food_data)
-    db.add(db_food)
-    db.commit()
-    db.refresh(db_food)
-    return db_food
-
-
-def update_food(db: Session, food_id: int, food_data: Dict) -> Optional[FoodDB]:
-    """Update food"""
-    food = get_food_by_id(db, food_id)
-    if not food:
-        return None
-
-    # Update only provided fields
-    for key, value in food_data.items():
-        if hasattr(food, key) and value is not None:
-            setattr(food, key, value)
-
-    db.commit()
-    db.refresh(food)
-    return food
-
-
-def delete_food(db: Session, food_id: int) -> bool:
-    """Delete food"""
-    food = get_food_by_id(db, food_id)
-    if not food:
-        return False
-
-    db.delete(food)
+def save_usda_ingredient_mapping(db: Session, mapping: Dict) -> None:
+    """Upsert theo ingredient_key (kết quả mới / matcher_version mới ghi đè)"""
+    stmt = pg_insert(UsdaIngredientMapDB).values(**mapping)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UsdaIngredientMapDB.ingredient_key],
+        set_={
+            **{
+                column: stmt.excluded[column]
+                for column in mapping
+                if column != "ingredient_key"
+            },
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
     db.commit()
-    return True
 
 
-# ============= User Meal CRUD Operations =============
+def get_usda_ingredient_mappings(
+    db: Session, after_key: Optional[str] = None, limit: int = 500
+) -> List[UsdaIngredientMapDB]:
+    """Keyset pagination theo ingredient_key (backfill embedding)"""
+    query = db.query(UsdaIngredientMapDB)
+    if after_key is not None:
+        query = query.filter(UsdaIngredientMapDB.ingredient_key > after_key)
+    return query.order_by(UsdaIngredientMapDB.ingredient_key).limit(limit).all()
+
+
+def get_existing_embedding_contents(
+    db: Session, ref_type: str, contents: List[str]
+) -> set:
+    rows = (
+        db.query(NutritionEmbeddingDB.content)
+        .filter(
+            NutritionEmbeddingDB.ref_type == ref_type,
+            NutritionEmbeddingDB.content.in_(contents),
+        )
+        .all()
+    )
+    return {row.content for row in rows}
 
 
-def create_user_meal(
-    db: Session,
-    user_id: int,
-    image_url: str,
-    meal_type: MealTypeDB = MealTypeDB.SNACK,
-    meal_name: Optional[str] = None,
-    meal_time: Optional[datetime] = None,
-) -> UserMealDB:
+def save_nutrition_embeddings(db: Session, rows: List[Dict]) -> None:
     """
-    Create a new user meal record
-
-    Args:
-        db: Database session
-        user_id: User ID
-        image_url: URL of the uploaded image
-        meal_type: Type of meal (breakfast, lunch, dinner, snack)
-        meal_name: Optional name of the meal
-        meal_time: Optional datetime of the meal;\
-            defaults to current time if not provided
+    Upsert theo (ref_type, content): rows gồm ref_type, ref_id, content,
+    vector, extra_metadata
     """
-    db_meal = UserMealDB(
-        user_id=user_id,
-        image_url=image_url,
-        meal_type=meal_type,
-        meal_time=meal_time,
-        meal_name=meal_name,
-        analysis_status=AnalysisStatusDB.PENDING,
+    if not rows:
+        return
+    stmt = pg_insert(NutritionEmbeddingDB).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_nutrition_embeddings_ref_type_content",
+        set_={
+            "ref_id": stmt.excluded.ref_id,
+            "vector": stmt.excluded.vector,
+            "extra_metadata": stmt.excluded.extra_metadata,
+        },
     )
-    db.add(db_meal)
+    db.execute(stmt)
     db.commit()
-    db.refresh(db_meal)
-    return db_meal
 
 
-def update_meal_analysis(
-    db: Session,
-    meal_id: int,
-    analysis_data: Dict,
-    model_name: Optional[str] = None,
-) -> Optional[UserMealDB]:
+def embedding_search_distance(column, vector: List[float], mode: str):
     """
-    Update meal with analysis results
+    Biểu thức khoảng cách dùng được index ANN của column (xem
+    database.models._embedding_indexes)
 
-    Args:
-        db: Database session
-        meal_id: Meal ID
-        analysis_data: Analysis result containing dish_name, ingredients, etc.
-        model_name: Name of the model used for analysis
+    mode: 'exact' (cosine trên vector đầy đủ, không index), 'truncated'
+    (cosine trên EMBEDDING_SEARCH_DIMENSIONS chiều đầu), 'binary' (hamming
+    trên binary_quantize)
     """
-    meal = db.query(UserMealDB).filter(UserMealDB.id == meal_id).first()
-    if not meal:
-        return None
-
-    # Update meal name if available
-    if "dish_name" in analysis_data and analysis_data["dish_name"]:
-        meal.meal_name = analysis_data["dish_name"]
-
-    # Calculate total nutrition from ingredients
-    total_calories = 0.0
-    total_protein = 0.0
-    total_fat = 0.0
-    total_carbs = 0.0
-    total_fiber = 0.0
-    total_sodium = 0.0
-
-    ingredients = analysis_data.get("ingredients", [])
-
-    # Create meal items from ingredients
-    for ingredient in ingredients:
-        nutrition = ingredient.get("nutrition", {})
-
-        # Add to totals
-        total_calories += nutrition.get("calories", 0) or 0
-        total_protein += nutrition.get("protein", 0) or 0
-        total_fat += nutrition.get("fat", 0) or 0
-        total_carbs += nutrition.get("carbs", 0) or 0
-        total_fiber += nutrition.get("fiber", 0) or 0
-        total_sodium += nutrition.get("sodium", 0) or 0
-
-        # Create meal item
-        meal_item = MealItemDB(
-            meal_id=meal_id,
-            name=ingredient.get("name"),
-            estimated_weight=ingredient.get("estimated_weight"),
-            calories=nutrition.get("calories"),
-            protein=nutrition.get("protein"),
-            fat=nutrition.get("fat"),
-            carbs=nutrition.get("carbs"),
-            fiber=nutrition.get("fiber"),
-            sodium=nutrition.get("sodium"),
-            nutrition_json=nutrition,
+    if mode == "exact":
+        return column.cosine_distance(vector)
+    if mode == "truncated":
+        dims = EMBEDDING_SEARCH_DIMENSIONS
+        # Cosine không phụ thuộc độ dài → prefix không cần chuẩn hoá lại
+        # Hằng số inline (không bind param) để khớp biểu thức của index
+        prefix = func.subvector(column, literal_column("1"), literal_column(str(dims)))
+        return cast(prefix, HALFVEC(dims)).cosine_distance(
+            cast(vector[:dims], HALFVEC(dims))
         )
-        db.add(meal_item)
-
-    # Update meal totals
-    meal.total_calories = total_calories
-    meal.total_protein = total_protein
-    meal.total_fat = total_fat
-    meal.total_carbs = total_carbs
-    meal.total_fiber = total_fiber
-    meal.total_sodium = total_sodium
-    meal.analysis_status = AnalysisStatusDB.SUCCESS
-
-    # Create analysis log
-    analysis_log = NutritionAnalysisLogDB(
-        meal_id=meal_id,
-        model_name=model_name,
-        raw_response=analysis_data,
-        confidence=analysis_data.get("confidence"),
-    )
-    db.add(analysis_log)
-
-    db.commit()
-    db.refresh(meal)
-    return meal
-
-
-def get_user_meal_by_id(db: Session, meal_id: int) -> Optional[UserMealDB]:
-    """Get user meal by ID with all related data"""
-    return (
-        db.query(UserMealDB)
-        .options(joinedload(UserMealDB.items))
-        .filter(UserMealDB.id == meal_id)
-        .first()
-    )
+    if mode == "binary":
+        dims = EMBEDDING_DIMENSIONS
+        return cast(func.binary_quantize(column), BIT(dims)).hamming_distance(
+            cast(func.binary_quantize(cast(vector, HALFVEC(dims))), BIT(dims))
+        )
+    raise ValueError(f"Unknown embedding search mode: {mode}")
 
 
-def update_meal_image_url(
-    db: Session, meal_id: int, image_url: str
-) -> Optional[UserMealDB]:
+def nearest_nutrition_embeddings(
+    db: Session,
+    ref_type: str,
+    vector: List[float],
+    limit: int = 5,
+    ef_search: Optional[int] = None,
+    mode: str = "truncated",
+    rerank_factor: int = 4,
+) -> List[tuple]:
     """
-    Update meal's image_url after async Cloudinary upload completes
-
-    Args:
-        db: Database session
-        meal_id: Meal ID
-        image_url: Cloudinary secure_url
+    ANN → [(NutritionEmbeddingDB, cosine distance đầy đủ)], gần nhất trước
 
-    Returns:
-        Updated meal record or None if not found
+    mode != 'exact': lấy limit × rerank_factor ứng viên qua index HNSW của
+    biểu thức nén, rồi re-rank bằng cosine distance trên vector halfvec đầy đủ
     """
-    meal = db.query(UserMealDB).filter(UserMealDB.id == meal_id).first()
-    if not meal:
-        return None
+    full_distance = NutritionEmbeddingDB.vector.cosine_distance(vector)
 
-    meal.image_url = image_url
-    db.commit()
-    db.refresh(meal)
-    return meal
-
-
-def get_user_meals(
-    db: Session,
-    user_id: int,
-    skip: int = 0,
-    limit: int = 100,
-    meal_type: Optional[MealTypeDB] = None,
-) -> List[UserMealDB]:
-    """
-    Get list of user meals
-
-    Args:
-        db: Database session
-        user_id: User ID
-        skip: Number of records to skip
-        limit: Maximum number of records to return
-        meal_type: Optional filter by meal type
-    """
-    query = (
-        db.query(UserMealDB)
-        .options(joinedload(UserMealDB.items))
-        .filter(UserMealDB.user_id == user_id)
+    query = db.query(NutritionEmbeddingDB, full_distance.label("distance")).options(
+        defer(NutritionEmbeddingDB.vector)
     )
+    if mode == "exact":
+        return (
+            query.filter(NutritionEmbeddingDB.ref_type == ref_type)
+            .order_by(full_distance)
+            .limit(limit)
+            .all()
+        )
 
-    if meal_type:
-        query = query.filter(UserMealDB.meal_type == meal_type)
-
-    return query.order_by(UserMealDB.meal_time.desc()).offset(skip).limit(limit).all()
-
-
-def mark_meal_failed(
-    db: Session, meal_id: int, error_message: str
-) -> Optional[UserMealDB]:
-    """Mark meal analysis as failed"""
-    meal = db.query(UserMealDB).filter(UserMealDB.id == meal_id).first()
-    if not meal:
-        return None
-
-    meal.analysis_status = AnalysisStatusDB.FAILED
-
-    # Create analysis log with error
-    analysis_log = NutritionAnalysisLogDB(
-        meal_id=meal_id,
-        raw_response={"error": error_message},
+    candidates_limit = limit * max(rerank_factor, 1)
+    # HNSW trả về tối đa ef_search kết quả → phải >= số ứng viên cần re-rank
+    ef_search = max(ef_search or 40, candidates_limit)
+    # SET không nhận bind param; chỉ áp dụng cho transaction hiện tại
+    db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+
+    candidates = (
+        db.query(NutritionEmbeddingDB.id)
+        .filter(NutritionEmbeddingDB.ref_type == ref_type)
+        .order_by(embedding_search_distance(NutritionEmbeddingDB.vector, vector, mode))
+        .limit(candidates_limit)
+        .subquery()
+    )
+    return (
+        query.join(candidates, NutritionEmbeddingDB.id == candidates.c.id)
+        .order_by(full_distance)
+        .limit(limit)
+        .all()
     )
-    db.add(analysis_log)
-
-    db.commit()
-    db.refresh(meal)
-    return meal
-
-
-def get_user_meals_by_date_range(
-    db: Session,
-    user_id: int,
-    start_date: datetime,
-    end_date: datetime,
-    meal_type: Optional[MealTypeDB] = None,
-) -> List[UserMealDB]:
-    """
-    Get user meals within a date range
 
-    Args:
-        db: Database session
-        user_id: User ID
-        start_date: Start date (inclusive)
-        end_date: End date (inclusive)
-        meal_type: Optional filter by meal type
 
-    Returns:
-        List of UserMealDB objects with their items loaded
-    """
-    query = (
-        db.query(UserMealDB)
-        .options(joinedload(UserMealDB.items))
-        .filter(UserMealDB.user_id == user_id)
-        .filter(UserMealDB.meal_time >= start_date)
-        .filter(UserMealDB.meal_time <= end_date)
-        .filter(UserMealDB.analysis_status == AnalysisStatusDB.SUCCESS)
+def get_meal_items_without_embedding(
+    db: Session, after_id: int = 0, limit: int = 500
+) -> List[MealItemDB]:
+    return (
+        db.query(MealItemDB)
+        .options(defer(MealItemDB.embedding_vector))
+        .filter(
+            MealItemDB.id > after_id,
+            MealItemDB.embedding_vector.is_(None),
+            MealItemDB.name.isnot(None),
+        )
+        .order_by(MealItemDB.id)
+        .limit(limit)
+        .all()
     )
 
-    if meal_type:
-        query = query.filter(UserMealDB.meal_type == meal_type)
 
-    return query.order_by(UserMealDB.meal_time.asc()).all()
+def set_meal_item_embeddings(db: Session, vectors: Dict[int, List[float]]) -> None:
+    """{meal_item_id: vector}"""
+    db.bulk_update_mappings(
+        MealItemDB,
+        [
+            {"id": item_id, "embedding_vector": vector}
+            for item_id, vector in vectors.items()
+        ],
+    )
+    db.commit()
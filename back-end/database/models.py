@@ -1,23 +1,29 @@
 from enum import Enum
 
 from database.connection import Base
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     Column,
+    Computed,
     DateTime,
 )
 from sqlalchemy import Enum as SQLEnum
 from sqlalchemy import (
     Float,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Text,
+    UniqueConstraint,
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 
 class UserDB(Base):
@@ -144,8 +150,195 @@ class UserMealDB(Base):
     )
 
 
+class AnalysisJobStatusDB(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class AnalysisJobDB(Base):
+    """
+    Job phân tích ảnh (job mode của /analyze/upload-and-analyze-image)
+
+    Worker claim bằng SELECT ... FOR UPDATE SKIP LOCKED → chạy được nhiều
+    worker process/host song song. Job RUNNING có locked_at quá lease
+    (worker crash) được claim lại.
+    """
+
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    meal_id = Column(
+        Integer,
+        ForeignKey("user_meals.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+        index=True,
+    )
+    user_id = Column(Integer, nullable=False)
+
+    status = Column(
+        SQLEnum(AnalysisJobStatusDB, name="analysis_job_status_enum"),
+        default=AnalysisJobStatusDB.QUEUED,
+        nullable=False,
+        index=True,
+    )
+
+    # JPEG đã optimize, xóa sau khi job xong
+    image_data = Column(LargeBinary, nullable=True)
+    content_type = Column(String(50), nullable=True)
+
+    attempts = Column(Integer, default=0, nullable=False)
+    locked_by = Column(String(255), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), onupdate=func.now(), server_default=func.now()
+    )
+
+    meal = relationship("UserMealDB")
+
+
+class AnalysisCacheDB(Base):
+    """
+    Postgres tier của analysis cache (Redis là tier chính)
+
+    Key: cache_version (prompt + model) + content_hash (SHA-256)
+    phash_band_*: 4 band 16-bit của dHash → tra cứu ảnh gần trùng
+    """
+
+    __tablename__ = "analysis_cache"
+    __table_args__ = (
+        UniqueConstraint("cache_version", "content_hash", name="uq_analysis_cache_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_version = Column(String(64), nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False)
+
+    # dHash 64-bit lưu dạng signed BIGINT
+    phash = Column(BigInteger, nullable=False)
+    phash_band_0 = Column(Integer, nullable=False, index=True)
+    phash_band_1 = Column(Integer, nullable=False, index=True)
+    phash_band_2 = Column(Integer, nullable=False, index=True)
+    phash_band_3 = Column(Integer, nullable=False, index=True)
+
+    component_detection = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=False)
+    estimated_tokens = Column(Integer, default=0, nullable=False)
+
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class UsdaFoodDB(Base):
+    """
+    Mirror local của USDA FoodData Central (Foundation + SR Legacy)
+
+    Nạp bằng usda_import.py từ bulk dump. Nutrient per 100 g tính sẵn lúc
+    import, cùng đơn vị với USDAService (calories: kcal, còn lại: gram).
+    Tra cứu: full-text (search_vector) + trigram (pg_trgm) trên description
+    """
+
+    __tablename__ = "usda_foods"
+    __table_args__ = (
+        Index("ix_usda_foods_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_usda_foods_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ),
+    )
+
+    fdc_id = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(Text, nullable=False)
+    data_type = Column(String(32), nullable=False, index=True)
+    food_category = Column(String(255), nullable=True)
+
+    calories = Column(Float, default=0, nullable=False)
+    protein = Column(Float, default=0, nullable=False)
+    carbs = Column(Float, default=0, nullable=False)
+    fat = Column(Float, default=0, nullable=False)
+    fiber = Column(Float, default=0, nullable=False)
+    sodium = Column(Float, default=0, nullable=False)
+
+    search_vector = Column(
+        TSVECTOR, Computed("to_tsvector('english', description)", persisted=True)
+    )
+    imported_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UsdaIngredientMapDB(Base):
+    """
+    Nguyên liệu (name_en + cooking_method đã chuẩn hoá) → food USDA đã chọn
+
+    USDAService đọc bảng này trước khi search → nguyên liệu đã resolve một
+    lần không phải search lại. Row có matcher_version khác phiên bản hiện
+    tại (services.usda_matcher.MATCHER_VERSION) bị bỏ qua và ghi đè
+    """
+
+    __tablename__ = "usda_ingredient_map"
+
+    ingredient_key = Column(String(255), primary_key=True)
+    name_en = Column(String(255), nullable=False)
+    cooking_method = Column(String(100), nullable=True)
+
+    fdc_id = Column(Integer, nullable=False, index=True)
+    description = Column(Text, nullable=True)
+    data_type = Column(String(32), nullable=True)
+    match_score = Column(Float, default=0, nullable=False)
+    # nutrients_per_100g (cùng dạng kết quả USDAService)
+    nutrients = Column(JSON, nullable=False)
+    matcher_version = Column(String(16), nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), onupdate=func.now(), server_default=func.now()
+    )
+
+
+# Embedding lưu dạng halfvec (float16, 6 KB/row thay vì 12 KB) - vẫn đủ
+# chính xác để re-rank. ANN search không chạy trên vector đầy đủ (HNSW chỉ
+# index được halfvec tối đa 4000 chiều, và index 3072 chiều rất lớn) mà trên
+# hai biểu thức nhỏ hơn (crud.nearest_nutrition_embeddings):
+# - truncated: EMBEDDING_SEARCH_DIMENSIONS chiều đầu (gemini-embedding-001 là
+#   Matryoshka → prefix vẫn là embedding hợp lệ)
+# - binary: binary_quantize (1 bit/chiều, hamming distance)
+# rồi re-rank ứng viên bằng cosine distance trên vector đầy đủ.
+# Query phải dùng đúng biểu thức của index. Cần pgvector >= 0.7
+EMBEDDING_DIMENSIONS = 3072
+EMBEDDING_SEARCH_DIMENSIONS = 768
+
+
+def _embedding_indexes(prefix: str, column: str) -> tuple:
+    return (
+        Index(
+            f"{prefix}_trunc_hnsw",
+            text(
+                f"((subvector({column}, 1, {EMBEDDING_SEARCH_DIMENSIONS}))"
+                f"::halfvec({EMBEDDING_SEARCH_DIMENSIONS})) halfvec_cosine_ops"
+            ),
+            postgresql_using="hnsw",
+        ),
+        Index(
+            f"{prefix}_binary_hnsw",
+            text(
+                f"((binary_quantize({column}))::bit({EMBEDDING_DIMENSIONS})) "
+                "bit_hamming_ops"
+            ),
+            postgresql_using="hnsw",
+        ),
+    )
+
+
 class MealItemDB(Base):
     __tablename__ = "meal_items"
+    __table_args__ = _embedding_indexes("ix_meal_items_embedding", "embedding_vector")
 
     id = Column(Integer, primary_key=True, index=True)
     meal_id = Column(
@@ -166,20 +359,33 @@ class MealItemDB(Base):
     sodium = Column(Float, nullable=True)
 
     nutrition_json = Column(JSON, nullable=True)
-    embedding_vector = Column(Vector(3072), nullable=True)
+    embedding_vector = Column(HALFVEC(EMBEDDING_DIMENSIONS), nullable=True)
 
     # Relationships
     meal = relationship("UserMealDB", back_populates="items")
 
 
 class NutritionEmbeddingDB(Base):
+    """
+    ref_type='ingredient': content = tên nguyên liệu đã chuẩn hoá (+ cách chế
+    biến), ref_id = fdc_id, extra_metadata = kết quả USDA đã xác minh
+    (services.ingredient_index)
+    """
+
     __tablename__ = "nutrition_embeddings"
+    __table_args__ = (
+        UniqueConstraint(
+            "ref_type", "content", name="uq_nutrition_embeddings_ref_type_content"
+        ),
+        *_embedding_indexes("ix_nutrition_embeddings_vector", "vector"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     ref_type = Column(String(50), nullable=False)  # 'food', 'meal', 'ingredient'
     ref_id = Column(Integer, nullable=False, index=True)
+    content = Column(String(512), nullable=True)
 
-    vector = Column(Vector(3072), nullable=True)
+    vector = Column(HALFVEC(EMBEDDING_DIMENSIONS), nullable=True)
     extra_metadata = Column(JSON, default=dict)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
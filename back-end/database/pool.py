@@ -0,0 +1,177 @@
+"""
+Cấu hình connection pool dùng chung cho mọi kết nối Postgres của một process
+
+Ba pool cùng trỏ vào một database:
+- orm_async: AsyncEngine (router, analysis worker)
+- orm_sync: Engine sync (service gọi qua asyncio.to_thread, CLI)
+- checkpointer: psycopg_pool của LangGraph checkpointer
+
+Tổng max connection của ba pool bị giới hạn bởi DATABASE_MAX_CONNECTIONS;
+cấu hình vượt budget thì mỗi pool bị thu nhỏ theo tỷ lệ (cắt overflow trước).
+
+Metrics (xem /metrics):
+- db.<pool>.checked_out, db.<pool>.waiting (gauge)
+- db.<pool>.wait (timing chờ lấy connection), db.<pool>.timeouts (counter)
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict
+
+from config import settings
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+@dataclass(frozen=True)
+class PoolLimits:
+    size: int
+    overflow: int
+
+    @property
+    def max_size(self) -> int:
+        return self.size + self.overflow
+
+
+def fit_budget(pools: Dict[str, PoolLimits], budget: int) -> Dict[str, PoolLimits]:
+    """Thu nhỏ các pool theo tỷ lệ để tổng max_size <= budget (mỗi pool >= 1)"""
+    requested = sum(limits.max_size for limits in pools.values())
+    if requested <= budget:
+        return pools
+
+    fitted = {}
+    for name, limits in pools.items():
+        max_size = max(1, limits.max_size * budget // requested)
+        size = min(limits.size, max_size)
+        fitted[name] = PoolLimits(size=size, overflow=max_size - size)
+    logger.warning(
+        f"Database pools request {requested} connections, budget is {budget}: "
+        + ", ".join(f"{name}={limits.max_size}" for name, limits in fitted.items())
+    )
+    return fitted
+
+
+@lru_cache
+def pool_budget() -> Dict[str, PoolLimits]:
+    return fit_budget(
+        {
+            "orm_async": PoolLimits(
+                settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW
+            ),
+            "orm_sync": PoolLimits(
+                settings.DATABASE_SYNC_POOL_SIZE, settings.DATABASE_SYNC_MAX_OVERFLOW
+            ),
+            "checkpointer": PoolLimits(
+                settings.CHECKPOINT_POOL_MIN_SIZE,
+                settings.CHECKPOINT_POOL_MAX_SIZE - settings.CHECKPOINT_POOL_MIN_SIZE,
+            ),
+        },
+        settings.DATABASE_MAX_CONNECTIONS,
+    )
+
+
+def connection_options() -> str:
+    """libpq `options` áp dụng cho mọi connection (statement_timeout)"""
+    if settings.DATABASE_STATEMENT_TIMEOUT <= 0:
+        return ""
+    return f"-c statement_timeout={int(settings.DATABASE_STATEMENT_TIMEOUT * 1000)}"
+
+
+class _PoolGauges:
+    """Số caller đang chờ connection (thread-safe: pool sync dùng từ nhiều thread)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    def wait(self, delta: int) -> None:
+        with self._lock:
+            self._waiting += delta
+            metrics.set_gauge(f"db.{self.name}.waiting", self._waiting)
+
+
+def instrumented_pool(base: type, name: str) -> type:
+    """Subclass QueuePool ghi metrics khi lấy / trả connection"""
+    gauges = _PoolGauges(name)
+
+    class InstrumentedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            gauges.wait(1)
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.incr(f"db.{name}.timeouts")
+                raise
+            finally:
+                gauges.wait(-1)
+                metrics.observe(f"db.{name}.wait", time.perf_counter() - start)
+            metrics.set_gauge(f"db.{name}.checked_out", self.checkedout())
+            return connection
+
+        def _do_return_conn(self, record):
+            super()._do_return_conn(record)
+            metrics.set_gauge(f"db.{name}.checked_out", self.checkedout())
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+def instrumented_connection_pool(name: str) -> type:
+    """Subclass psycopg_pool AsyncConnectionPool ghi cùng metrics với QueuePool"""
+    gauges = _PoolGauges(name)
+
+    class InstrumentedConnectionPool(AsyncConnectionPool):
+        def _set_checked_out(self) -> None:
+            stats = self.get_stats()
+            metrics.set_gauge(
+                f"db.{name}.checked_out",
+                stats.get("pool_size", 0) - stats.get("pool_available", 0),
+            )
+
+        async def getconn(self, timeout=None):
+            start = time.perf_counter()
+            gauges.wait(1)
+            try:
+                connection = await super().getconn(timeout)
+            except PoolTimeout:
+                metrics.incr(f"db.{name}.timeouts")
+                raise
+            finally:
+                gauges.wait(-1)
+                metrics.observe(f"db.{name}.wait", time.perf_counter() - start)
+            self._set_checked_out()
+            return connection
+
+        async def putconn(self, conn) -> None:
+            await super().putconn(conn)
+            self._set_checked_out()
+
+    return InstrumentedConnectionPool
+
+
+def engine_kwargs(name: str, is_async: bool) -> dict:
+    """Tham số create_engine / create_async_engine cho pool `name`"""
+    limits = pool_budget()[name]
+    base = AsyncAdaptedQueuePool if is_async else QueuePool
+    kwargs = {
+        "poolclass": instrumented_pool(base, name),
+        "pool_size": limits.size,
+        "max_overflow": limits.overflow,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+        "pool_recycle": 3600,
+        "echo": settings.DEBUG,
+    }
+    options = connection_options()
+    if options:
+        kwargs["connect_args"] = {"options": options}
+    return kwargs
@@ -0,0 +1,123 @@
+"""
+Tính embedding còn thiếu cho meal_items và nutrition_embeddings (nguyên liệu)
+
+- meal_items.embedding_vector: tên món của các bữa ăn đã lưu
+- nutrition_embeddings (ref_type='ingredient'): name_en + cooking_method của
+  các mapping trong usda_ingredient_map (name_vi được index dần khi
+  USDAService chạy với EMBEDDING_LOOKUP_ENABLED=true)
+
+Usage (thư mục back-end, sau `alembic upgrade head`):
+    python embedding_backfill.py                 # cả hai
+    python embedding_backfill.py --meals --batch-size 200
+    EMBEDDING_PROVIDER=local python embedding_backfill.py --ingredients
+
+Chạy lại an toàn: chỉ embed row chưa có vector.
+"""
+
+import argparse
+import asyncio
+import time
+
+from database import crud
+from database.connection import SessionLocal
+from services.embedding_service import EmbeddingService, get_embedding_service
+from services.ingredient_index import (
+    REF_TYPE,
+    IngredientEmbeddingIndex,
+    cooking_key,
+    ingredient_text,
+)
+from services.usda_matcher import MATCHER_VERSION
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+async def backfill_meal_items(embedder: EmbeddingService, batch_size: int) -> int:
+    total = 0
+    after_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            items = crud.get_meal_items_without_embedding(db, after_id, batch_size)
+            if not items:
+                return total
+            after_id = items[-1].id
+            vectors = await embedder.embed([item.name for item in items])
+            crud.set_meal_item_embeddings(
+                db, {item.id: vector.tolist() for item, vector in zip(items, vectors)}
+            )
+        finally:
+            db.close()
+        total += len(items)
+        logger.info(f"meal_items: {total} embedded")
+
+
+async def backfill_ingredient_mappings(
+    index: IngredientEmbeddingIndex, batch_size: int
+) -> int:
+    total = 0
+    after_key = None
+    while True:
+        db = SessionLocal()
+        try:
+            mappings = crud.get_usda_ingredient_mappings(db, after_key, batch_size)
+            if not mappings:
+                return total
+            after_key = mappings[-1].ingredient_key
+            mappings = [m for m in mappings if m.matcher_version == MATCHER_VERSION]
+            existing = crud.get_existing_embedding_contents(
+                db,
+                REF_TYPE,
+                [ingredient_text(m.name_en, m.cooking_method) for m in mappings],
+            )
+        finally:
+            db.close()
+
+        docs = [
+            {
+                "content": ingredient_text(m.name_en, m.cooking_method),
+                "ingredient_key": m.ingredient_key,
+                "cooking_method": cooking_key(m.cooking_method),
+                "result": {
+                    "fdc_id": m.fdc_id,
+                    "name": m.description,
+                    "nutrients_per_100g": m.nutrients,
+                    "data_source": m.data_type,
+                    "match_score": m.match_score,
+                },
+            }
+            for m in mappings
+        ]
+        docs = [doc for doc in docs if doc["content"] not in existing]
+        total += await index.add(docs)
+        logger.info(f"ingredients: {total} embedded")
+
+
+async def run(meals: bool, ingredients: bool, batch_size: int) -> None:
+    embedder = get_embedding_service()
+    if meals:
+        start = time.perf_counter()
+        count = await backfill_meal_items(embedder, batch_size)
+        logger.info(f"meal_items: {count} rows in {time.perf_counter() - start:.1f}s")
+    if ingredients:
+        start = time.perf_counter()
+        count = await backfill_ingredient_mappings(
+            IngredientEmbeddingIndex(embedder), batch_size
+        )
+        logger.info(f"ingredients: {count} rows in {time.perf_counter() - start:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--meals", action="store_true", help="Chỉ meal_items")
+    parser.add_argument("--ingredients", action="store_true", help="Chỉ nguyên liệu")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    both = not (args.meals or args.ingredients)
+    asyncio.run(run(args.meals or both, args.ingredients or both, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
-from typing import Literal
+from typing import List, Literal, Union
 
 from langgraph.graph import END, StateGraph
 from langgraph_flow.nodes import (
+    advisor_context_node,
     image_advisor_node,
     image_advisor_node_v2,
     router_node,
@@ -89,9 +90,16 @@ logger = setup_logger(__name__)
 #     logger.info("✅ Workflow V2 compiled (Real USDA API integration)")
 #     return workflow
 
-def route_after_router(state: GraphState) -> Literal["vision", "text_advisor"]:
-    """Has image → vision, no image → text advisor"""
-    return "vision" if state["has_image"] else "text_advisor"
+def route_after_router(
+    state: GraphState,
+) -> Union[List[Literal["vision", "advisor_context"]], Literal["text_advisor"]]:
+    """
+    Has image → vision + advisor_context (song song, cùng superstep),
+    no image → text advisor
+    """
+    if state["has_image"]:
+        return ["vision", "advisor_context"]
+    return "text_advisor"
 
 
 def route_after_vision(state: GraphState) -> Literal["nutrition_lookup", "end"]:
@@ -138,13 +146,18 @@ def build_workflow() -> StateGraph:
     
     Flow:
     router → vision_v2 → nutrition_lookup → image_advisor_v2 → END
+           ↘ advisor_context (song song với vision) → END
            ↘ text_advisor → END
+
+    vision_v2 stream JSON và prefetch USDA cho từng component ngay khi
+    parse được, nutrition_lookup dùng lại các lookup đang chạy/đã xong
     """
     workflow = StateGraph(GraphState)
 
     # Add nodes
     workflow.add_node("router", router_node)
     workflow.add_node("vision", vision_node_v2)
+    workflow.add_node("advisor_context", advisor_context_node)
     workflow.add_node("nutrition_lookup", nutrition_lookup_node)
     workflow.add_node("image_advisor", image_advisor_node_v2)
     workflow.add_node("text_advisor", text_advisor_node)
@@ -158,6 +171,7 @@ def build_workflow() -> StateGraph:
         route_after_router,
         {
             "vision": "vision",
+            "advisor_context": "advisor_context",
             "text_advisor": "text_advisor"
         },
     )
@@ -183,6 +197,7 @@ def build_workflow() -> StateGraph:
     )
     
     # Terminal edges
+    workflow.add_edge("advisor_context", END)
     workflow.add_edge("image_advisor", END)
     workflow.add_edge("text_advisor", END)
     
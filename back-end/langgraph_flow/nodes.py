@@ -1,25 +1,34 @@
 import re
+import time
 import traceback
 
+from config import settings
 from langchain_core.exceptions import OutputParserException
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.output_parsers import PydanticOutputParser
 from langgraph_flow.state import GraphState
 from models.factory import ModelFactory
-from prompt import image_advisor_prompt, text_advisor_prompt, vision_extract_prompt
-from prompt.advisor_prompt import get_image_advisor_prompt_v2
-from prompt.vision_prompt_v2 import get_component_detection_prompt
+from prompt import image_advisor_prompt, vision_extract_prompt
+from prompt.registry import (
+    COMPONENT_DETECTION,
+    IMAGE_ADVISOR,
+    TEXT_ADVISOR,
+    prompt_registry,
+)
 from schema.food_components import ComponentDetectionResult
 from schema.recognition_food import RecognitionWithSafety
 from schema.safety_check import SafetyCheck
 from schema.food_ingredients import FoodIngredient
 from schema.nutrition_info import NutritionInfo
 from services.usda_service import get_usda_service
+from utils.json_repair import repair_json, strip_json_fences
+from utils.json_stream import JsonArrayStreamScanner
 from utils.logger import setup_logger
+from utils.metrics import metrics
 
 # Factory Method : Gọi mô hình
-vlm = ModelFactory.create_vlm()
-llm = ModelFactory.create_llm()
+# Instance được cache trong ModelFactory và tạo sẵn ở startup (main.lifespan),
+# import module này không khởi tạo SDK
 
 logger = setup_logger(__name__)
 
@@ -89,7 +98,7 @@ def vision_node(state: GraphState):
             ])
 
         # Invoke vào VLM
-        raw = vlm.invoke([message])
+        raw = ModelFactory.create_vlm().invoke([message])
         raw_text = raw if isinstance(raw, str) else getattr(raw, "content", str(raw))
 
         logger.info(f"VLM raw response type: {type(raw)}")
@@ -108,7 +117,9 @@ def vision_node(state: GraphState):
             Return ONLY the fixed JSON, no explanation, no markdown code blocks.
             """
 
-            fixed_response = llm.invoke([HumanMessage(content=fix_prompt)])
+            fixed_response = ModelFactory.create_llm().invoke(
+                [HumanMessage(content=fix_prompt)]
+            )
             fixed_text = (
                 fixed_response.content
                 if hasattr(fixed_response, "content")
@@ -164,7 +175,7 @@ def image_advisor_node(state: GraphState) -> GraphState:
 
         # Build chain
         prompt = image_advisor_prompt.get_image_advisor_prompt()
-        chain = prompt | llm
+        chain = prompt | ModelFactory.create_llm()
 
         # Invoke - trả về AIMessage (có thể stream)
         response = chain.invoke(
@@ -197,21 +208,121 @@ def image_advisor_node(state: GraphState) -> GraphState:
         return {"messages": [AIMessage(content=f"Lỗi: {str(e)}")]}
 
 
+async def parse_structured_output(raw_text, parser, format_instructions, schema):
+    """
+    Parse output JSON của VLM: parse trực tiếp → repair local → repair bằng model
+
+    Repair bằng model (thêm một lần gọi VLM) chỉ là phương án cuối cùng
+    """
+    metrics.incr("structured_output.attempts")
+    try:
+        return parser.parse(strip_json_fences(raw_text))
+    except OutputParserException:
+        metrics.incr("structured_output.parse_failures")
+
+    try:
+        repaired = repair_json(raw_text)
+        if repaired is not None:
+            result = parser.parse(repaired)
+            metrics.incr("structured_output.repaired.local")
+            logger.info("🔧 Repaired malformed JSON locally")
+            return result
+    except OutputParserException:
+        pass
+
+    # Self-healing
+    fix_prompt = f"""Fix this malformed JSON to match schema:
+    {format_instructions}
+
+    Malformed JSON:
+    {raw_text}
+
+    Return ONLY valid JSON, no explanation."""
+
+    fixed = await ModelFactory.create_vlm().ainvoke(
+        [HumanMessage(content=fix_prompt)], response_schema=schema
+    )
+    fixed_text = fixed.content if hasattr(fixed, 'content') else str(fixed)
+    try:
+        result = parser.parse(repair_json(fixed_text) or strip_json_fences(fixed_text))
+    except OutputParserException:
+        metrics.incr("structured_output.unrepaired")
+        raise
+    metrics.incr("structured_output.repaired.model")
+    return result
+
+
+def _prefetch_component(usda_service, item: dict, complete: bool) -> bool:
+    """
+    Dispatch lookup khi đã biết name_en và cooking_method (hoặc object đã
+    đóng mà không có cooking_method) → cùng key với nutrition_lookup_node
+    """
+    name_en = item.get("name_en")
+    if not isinstance(name_en, str) or not name_en:
+        return False
+    if not complete and "cooking_method" not in item:
+        return False
+    name_vi = item.get("name_vi")
+    usda_service.prefetch(
+        name_en,
+        item.get("cooking_method"),
+        name_vi if isinstance(name_vi, str) else None,
+    )
+    return True
+
+
+async def _stream_components_with_prefetch(messages, **kwargs) -> str:
+    """
+    Gọi VLM dạng stream, parse JSON tăng dần và prefetch USDA cho từng
+    component ngay khi đủ thông tin
+
+    Returns:
+        Toàn bộ text model trả về (parse/repair như ainvoke)
+    """
+    vlm = ModelFactory.create_vlm()
+    if not settings.USDA_SPECULATIVE_PREFETCH:
+        response = await vlm.ainvoke(messages, **kwargs)
+        return response.content if hasattr(response, "content") else str(response)
+
+    usda_service = get_usda_service()
+    scanner = JsonArrayStreamScanner("components")
+    dispatched = set()
+    started_at = time.perf_counter()
+
+    async for chunk in vlm.astream(messages, **kwargs):
+        content = chunk.content if isinstance(chunk.content, str) else ""
+        if not content:
+            continue
+        for index, item, complete in scanner.feed(content):
+            if index in dispatched:
+                continue
+            if _prefetch_component(usda_service, item, complete):
+                dispatched.add(index)
+                if len(dispatched) == 1:
+                    metrics.observe(
+                        "vision.first_component", time.perf_counter() - started_at
+                    )
+
+    if dispatched:
+        logger.info(f"⚡ USDA prefetch dispatched for {len(dispatched)} components")
+    return scanner.text
+
+
 async def vision_node_v2(state: GraphState) -> GraphState:
     """
     🔄 V2: Component detection ONLY (no nutrition calculation)
 
     Input: state["image_url"] (base64 data URI or URL)
-    Output: state["component_detection"]
+    Output: {"component_detection"} hoặc {"error"} - chỉ trả phần update vì
+    chạy song song với advisor_context (cùng superstep)
     """
     try:
-        parser = PydanticOutputParser(pydantic_object=ComponentDetectionResult)
-        format_instructions = parser.get_format_instructions().replace("```json", "").replace("```", "")
-
-        vision_prompt = get_component_detection_prompt(format_instructions)
-        prompt_text = vision_prompt.format(
-            query="Phân tích các thành phần có trong món ăn. CHỈ detect components, KHÔNG tính nutrition."
-        )
+        # Prompt + format instructions render sẵn (prompt registry)
+        rendered = prompt_registry.get(COMPONENT_DETECTION)
+        parser = rendered.parser
+        format_instructions = rendered.format_instructions
+        # System prompt tách riêng để Gemini cache được (context caching)
+        prompt_text = rendered.user_text
 
         # Parse base64 data URI to extract data
         image_data = state["image_url"]  # Expected: "data:image/jpeg;base64,..."
@@ -254,44 +365,30 @@ async def vision_node_v2(state: GraphState) -> GraphState:
 
         logger.info("🚀 Calling Gemini VLM for component detection...")
 
-        # Call Gemini
-        raw_response = vlm.invoke([message])
-        raw_text = raw_response.content if hasattr(raw_response, 'content') else str(raw_response)
-        raw_text = re.sub(r"```json\s*|\s*```", "", raw_text).strip()
+        # Stream JSON (mode native theo schema ComponentDetectionResult): mỗi
+        # component có name_en là bắt đầu tra USDA luôn, không chờ hết output
+        raw_text = await _stream_components_with_prefetch(
+            [SystemMessage(content=rendered.system_text), message],
+            response_schema=ComponentDetectionResult,
+            context_cache=rendered.context_cache,
+        )
 
         # Parse result
-        try:
-            result: ComponentDetectionResult = parser.parse(raw_text)
-        except OutputParserException:
-            # Self-healing
-            fix_prompt = f"""Fix this malformed JSON to match schema:
-            {format_instructions}
-
-            Malformed JSON:
-            {raw_text}
-
-            Return ONLY valid JSON, no explanation."""
-
-            fixed = vlm.invoke([HumanMessage(content=fix_prompt)])
-            fixed_text = re.sub(r"```json\s*|\s*```", "",
-                              fixed.content if hasattr(fixed, 'content') else str(fixed)).strip()
-            result = parser.parse(fixed_text)
+        result: ComponentDetectionResult = await parse_structured_output(
+            raw_text, parser, format_instructions, ComponentDetectionResult
+        )
 
         # Safety check
         if not result.is_food or not result.is_safe or result.safety_confidence < 0.7:
-            state["error"] = result.warnings or "Không thể phân tích ảnh này"
-            return state
+            return {"error": result.warnings or "Không thể phân tích ảnh này"}
 
-        # Store result
-        state["component_detection"] = result
         logger.info(f"✅ Detected {len(result.components)} components")
 
-        return state
+        return {"component_detection": result}
 
     except Exception as e:
         logger.error(f"vision_node_v2 error: {traceback.format_exc()}")
-        state["error"] = f"Lỗi phân tích ảnh: {str(e)}"
-        return state
+        return {"error": f"Lỗi phân tích ảnh: {str(e)}"}
 
 async def image_advisor_node_v2(state: GraphState) -> GraphState:
     """
@@ -527,7 +624,29 @@ async def nutrition_lookup_node(state: GraphState) -> GraphState:
         return state
 
 
-def image_advisor_node_v2(state: GraphState) -> GraphState:
+def format_profile_context(user_profile: dict) -> dict:
+    """Biến profile dùng chung cho prompt của image/text advisor"""
+    user_profile = user_profile or {}
+    return {
+        "age": user_profile.get("age", "N/A"),
+        "weight": user_profile.get("weight", "N/A"),
+        "bmi": user_profile.get("bmi", "N/A"),
+        "bodyShape": user_profile.get("bodyShape", "bình thường"),
+        "description": user_profile.get("description", "Duy trì sức khỏe"),
+        "health_conditions": user_profile.get("health_conditions") or "Không có",
+    }
+
+
+def advisor_context_node(state: GraphState) -> GraphState:
+    """
+    Nhánh song song với vision: chuẩn bị biến profile cho image advisor
+
+    Chỉ ghi key riêng (profile_context) vì chạy cùng superstep với vision
+    """
+    return {"profile_context": format_profile_context(state.get("user_profile"))}
+
+
+async def image_advisor_node_v2(state: GraphState) -> GraphState:
     """
     🔄 V2: Generate advice với REAL USDA data
     """
@@ -538,7 +657,10 @@ def image_advisor_node_v2(state: GraphState) -> GraphState:
         enriched = state.get("enriched_components", [])
         totals = state.get("nutrition_totals", {})
         quality = state.get("data_quality", 0)
-        user_profile = state["user_profile"]
+        # Đã format ở nhánh advisor_context (song song với vision)
+        profile_context = state.get("profile_context") or format_profile_context(
+            state.get("user_profile")
+        )
 
         # Format components breakdown
         components_lines = []
@@ -599,10 +721,12 @@ def image_advisor_node_v2(state: GraphState) -> GraphState:
             disclaimers.append("✅ Tất cả thành phần có USDA verified data")
 
         # Generate advice
-        prompt = get_image_advisor_prompt_v2()
-        chain = prompt | llm
+        rendered = prompt_registry.get(IMAGE_ADVISOR)
+        chain = rendered.template | ModelFactory.create_llm().bind(
+            context_cache=rendered.context_cache
+        )
 
-        response = chain.invoke({
+        response = await chain.ainvoke({
             "dish_name": state["component_detection"].dish_name or "Không xác định",
             "components_breakdown": components_breakdown,
             "total_calories": round(totals.get("calories", 0)),
@@ -612,12 +736,7 @@ def image_advisor_node_v2(state: GraphState) -> GraphState:
             "total_fiber": round(totals.get("fiber", 0), 1),
             "data_quality_percent": round(quality * 100),
             "data_disclaimers": "\n".join(disclaimers),
-            "age": user_profile.get("age", "N/A"),
-            "weight": user_profile.get("weight", "N/A"),
-            "bmi": user_profile.get("bmi", "N/A"),
-            "bodyShape": user_profile.get("bodyShape", "bình thường"),
-            "description": user_profile.get("description", "Duy trì sức khỏe"),
-            "health_conditions": user_profile.get("health_conditions") or "Không có",
+            **profile_context,
             "additional_query": f"\n{state.get('user_query', '')}" if state.get('user_query') else "",
             "messages": state["messages"]
         })
@@ -629,7 +748,7 @@ def image_advisor_node_v2(state: GraphState) -> GraphState:
         logger.error(f"image_advisor_node_v2 error: {traceback.format_exc()}")
         return {"messages": [AIMessage(content=f"Lỗi: {str(e)}")]}
 
-def text_advisor_node(state: GraphState) -> GraphState:
+async def text_advisor_node(state: GraphState) -> GraphState:
     """
     Node 2b: Text-only Q&A
     """
@@ -643,18 +762,14 @@ def text_advisor_node(state: GraphState) -> GraphState:
         #     "diabetic": "Kiểm soát đường huyết"
         # }
 
-        prompt = text_advisor_prompt.get_text_advisor_prompt()
-        chain = prompt | llm
+        rendered = prompt_registry.get(TEXT_ADVISOR)
+        chain = rendered.template | ModelFactory.create_llm().bind(
+            context_cache=rendered.context_cache
+        )
 
-        response = chain.invoke(
+        response = await chain.ainvoke(
             {
-                "age": user_profile.get("age", "N/A"),
-                "weight": user_profile.get("weight", "N/A"),
-                "bmi": user_profile.get("bmi", "N/A"),
-                "bodyShape": user_profile.get("bodyShape", "bình thường"),
-                "description": user_profile.get("description", "Duy trì sức khỏe"),
-                "health_conditions": user_profile.get("health_conditions")
-                or "Không có",
+                **format_profile_context(user_profile),
                 "messages": state["messages"],  # ← Chat history
             }
         )
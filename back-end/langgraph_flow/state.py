@@ -24,5 +24,6 @@ class GraphState(TypedDict):
     enriched_components: Optional[List[Dict]]  # 🆕 NEW
     nutrition_totals: Optional[Dict]  # 🆕 NEW
     data_quality: Optional[float]  # 🆕 NEW (0-1)
+    profile_context: Optional[Dict]  # Biến profile cho advisor (nhánh song song)
     # Output
     error: Optional[str]
@@ -1,18 +1,54 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 import uvicorn
 from config import settings
 from database.checkpointer import get_async_checkpointer, get_manager
+from database.connection import close_async_engine
 from database.init_db import init_db
+from dependencies import get_workflow_service
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from models.factory import ModelFactory
 from routers import advice, analys, auth, food, profile
+from services.analysis_job_service import get_analysis_worker, stop_analysis_worker
+from services.cloudinary_service import close_cloudinary_service
+from services.usda_service import close_usda_service
+from utils.image_executor import get_image_executor, shutdown_image_executor
+from utils.image_fetcher import close_image_fetcher
 from utils.logger import setup_logger
+from utils.metrics import metrics
 from utils.redis_client import RedisCache
+from utils.thread_locks import close_thread_lock_manager
 
 logger = setup_logger(__name__)
 
+WARM_UP_RETRY_MAX_DELAY = 60.0
+
+
+async def warm_up(app: FastAPI) -> bool:
+    """Warm-up workflow; thành công → mark ready (/ready trả 200)"""
+    try:
+        await get_workflow_service().warm_up(call_models=settings.MODEL_WARMUP_CALL)
+    except Exception as e:
+        metrics.incr("startup.warm_up_failures")
+        logger.error(f"Workflow warm-up failed: {e}")
+        return False
+    app.state.ready = True
+    return True
+
+
+async def retry_warm_up(app: FastAPI) -> None:
+    """Retry warm-up nền (backoff) - /ready giữ 503 tới khi thành công"""
+    delay = 1.0
+    while True:
+        logger.info(f"Retrying workflow warm-up in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        if await warm_up(app):
+            return
+        delay = min(delay * 2, WARM_UP_RETRY_MAX_DELAY)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -21,7 +57,8 @@ async def lifespan(app: FastAPI):
 
     Startup:
     - Load model config
-    - Warm up models (optional)
+    - Build models, compile graph, render prompts (warm-up)
+    - Mark ready (/ready) khi warm-up xong
 
     Shutdown:
     - Close database connections
@@ -32,6 +69,9 @@ async def lifespan(app: FastAPI):
     print("Loading model configuration...")
     ModelFactory.load_config(settings.MODEL_CONFIG_PATH)
 
+    print("Starting image processing executor...")
+    get_image_executor().start()
+
     if settings.REDIS_URL and settings.REDIS_ENABLED:
         print("Connecting to Redis...")
         try:
@@ -67,10 +107,33 @@ async def lifespan(app: FastAPI):
 
         logger.error(traceback.format_exc())
 
+    if settings.ANALYSIS_WORKER_ENABLED:
+        print("Starting analysis job worker...")
+        get_analysis_worker().start()
+
+    # Warm-up lỗi không chặn startup (/health 200) nhưng /ready giữ 503,
+    # retry nền tới khi thành công
+    print("Warming up workflow...")
+    app.state.ready = False
+    warm_up_task = None
+    if not await warm_up(app):
+        warm_up_task = asyncio.create_task(retry_warm_up(app))
+
     yield
 
     # Shutdown
     print("Shutting down...")
+    app.state.ready = False
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await stop_analysis_worker()
+    shutdown_image_executor()
+    await close_cloudinary_service()
+    await close_image_fetcher()
+    await close_thread_lock_manager()
+    await close_usda_service()
+    await close_async_engine()
+
     manager = get_manager()
     if manager:
         await manager.close()
@@ -109,6 +172,20 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness cho load balancer: chỉ 200 sau khi startup warm-up xong"""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process metrics (counters, gauges, per-stage timings)"""
+    return metrics.snapshot()
+
+
 if __name__ == "__main__":
 
     uvicorn.run(
@@ -73,6 +73,10 @@ class ModelFactory:
         llm_config = settings.get_llm_config()
         api_key = settings.get_api_key(provider)
 
+        cache_key = f"llm_{provider}_{llm_config['model']}"
+        if cache_key in cls._instances:
+            return cls._instances[cache_key]
+
         if provider == "gemini":
 
             model = Gemini(model_name=llm_config["model"], api_key=api_key)
@@ -83,6 +87,7 @@ class ModelFactory:
                     f"⚠️ Model {llm_config['model']} does not support native streaming"
                 )
 
+            cls._instances[cache_key] = model
             return model
 
         else:
@@ -0,0 +1,254 @@
+import asyncio
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Protocol, Set, Tuple
+
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class CachedPrefix:
+    """Handle của một prompt prefix đã cache phía provider"""
+
+    name: str
+    token_count: int
+    expires_at: float  # time.time()
+    resource: Any = None  # Object của SDK (genai.caching.CachedContent)
+
+
+class ContextCacheBackend(Protocol):
+    """API cache phía provider (blocking - được gọi qua asyncio.to_thread)"""
+
+    def count_tokens(self, model_name: str, text: str) -> int:
+        """Số token của text theo tokenizer của model"""
+
+    def create(
+        self, model_name: str, system_instruction: str, ttl: float
+    ) -> CachedPrefix:
+        """Tạo cached content cho system instruction, sống ttl giây"""
+
+    def refresh(self, handle: CachedPrefix, ttl: float) -> CachedPrefix:
+        """Gia hạn handle thêm ttl giây"""
+
+    def model_for(
+        self, handle: CachedPrefix, generation_config, safety_settings
+    ) -> Any:
+        """Model dùng cached content của handle làm prefix"""
+
+
+def _model_path(model_name: str) -> str:
+    return model_name if model_name.startswith("models/") else f"models/{model_name}"
+
+
+class GeminiContextCacheBackend:
+    """Explicit context caching của Gemini API (google.generativeai.caching)"""
+
+    def count_tokens(self, model_name: str, text: str) -> int:
+        import google.generativeai as genai
+
+        return (
+            genai.GenerativeModel(_model_path(model_name))
+            .count_tokens(text)
+            .total_tokens
+        )
+
+    def create(
+        self, model_name: str, system_instruction: str, ttl: float
+    ) -> CachedPrefix:
+        from google.generativeai import caching
+
+        cached = caching.CachedContent.create(
+            model=_model_path(model_name),
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        return CachedPrefix(
+            name=cached.name,
+            token_count=cached.usage_metadata.total_token_count,
+            expires_at=cached.expire_time.timestamp(),
+            resource=cached,
+        )
+
+    def refresh(self, handle: CachedPrefix, ttl: float) -> CachedPrefix:
+        handle.resource.update(ttl=datetime.timedelta(seconds=ttl))
+        handle.expires_at = handle.resource.expire_time.timestamp()
+        return handle
+
+    def model_for(
+        self, handle: CachedPrefix, generation_config, safety_settings
+    ) -> Any:
+        import google.generativeai as genai
+
+        return genai.GenerativeModel.from_cached_content(
+            cached_content=handle.resource,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+        )
+
+
+class FakeContextCacheBackend:
+    """
+    Backend giả cho test/local: không gọi API, ~4 ký tự/token
+
+    model_for trả về `model` truyền vào constructor (fake GenerativeModel)
+    """
+
+    def __init__(self, model: Any = None, fail: bool = False):
+        self.model = model
+        self.fail = fail
+        self.created: Dict[str, str] = {}
+        self.refreshed = 0
+
+    def count_tokens(self, model_name: str, text: str) -> int:
+        return len(text) // 4
+
+    def create(
+        self, model_name: str, system_instruction: str, ttl: float
+    ) -> CachedPrefix:
+        if self.fail:
+            raise RuntimeError("Context caching not available")
+        name = f"cachedContents/fake-{len(self.created)}"
+        self.created[name] = system_instruction
+        return CachedPrefix(
+            name=name,
+            token_count=self.count_tokens(model_name, system_instruction),
+            expires_at=time.time() + ttl,
+        )
+
+    def refresh(self, handle: CachedPrefix, ttl: float) -> CachedPrefix:
+        self.refreshed += 1
+        handle.expires_at = time.time() + ttl
+        return handle
+
+    def model_for(
+        self, handle: CachedPrefix, generation_config, safety_settings
+    ) -> Any:
+        return self.model
+
+
+class ContextCacheManager:
+    """
+    Quản lý cached prefix theo (model, prompt version hash)
+
+    - prepare(): tạo / gia hạn cache (gọi ở warm-up hoặc chạy nền)
+    - get(): dùng trên request path, không gọi API. Chưa có handle hoặc
+      handle sắp hết hạn → prepare() chạy nền, request gửi prompt đầy đủ
+    - Prefix dưới min_tokens (ngưỡng tối thiểu của explicit caching) →
+      không cache được vĩnh viễn cho version hash đó, không thử lại
+    - Lỗi tạo/gia hạn (model không hỗ trợ, quota...) → thử lại sau
+      retry_after giây
+    """
+
+    def __init__(
+        self,
+        backend: ContextCacheBackend,
+        ttl: float = 3600,
+        refresh_margin: float = 300,
+        retry_after: float = 600,
+        min_tokens: int = 4096,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.min_tokens = min_tokens
+        self._handles: Dict[Tuple[str, str], CachedPrefix] = {}
+        self._unavailable_until: Dict[Tuple[str, str], float] = {}
+        self._uncacheable: Set[Tuple[str, str]] = set()
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _needs_refresh(self, handle: Optional[CachedPrefix]) -> bool:
+        return handle is None or handle.expires_at - time.time() <= self.refresh_margin
+
+    def _skip(self, cache_key: Tuple[str, str]) -> bool:
+        return cache_key in self._uncacheable or time.monotonic() < (
+            self._unavailable_until.get(cache_key, 0)
+        )
+
+    def get(self, model_name: str, key: str, prefix: str) -> Optional[CachedPrefix]:
+        """Handle còn hạn (không chờ API); None → caller gửi prompt đầy đủ"""
+        cache_key = (model_name, key)
+        if cache_key in self._uncacheable:
+            return None
+
+        handle = self._handles.get(cache_key)
+        if self._needs_refresh(handle):
+            self._schedule(model_name, key, prefix)
+        if handle is not None and handle.expires_at > time.time():
+            return handle
+        return None
+
+    def _schedule(self, model_name: str, key: str, prefix: str) -> None:
+        cache_key = (model_name, key)
+        task = self._tasks.get(cache_key)
+        if self._skip(cache_key) or (task is not None and not task.done()):
+            return
+        self._tasks[cache_key] = asyncio.create_task(
+            self.prepare(model_name, key, prefix)
+        )
+
+    async def prepare(
+        self, model_name: str, key: str, prefix: str
+    ) -> Optional[CachedPrefix]:
+        """Tạo cache (hoặc gia hạn nếu sắp hết hạn); lỗi chỉ log, trả None"""
+        cache_key = (model_name, key)
+        lock = self._locks.setdefault(cache_key, asyncio.Lock())
+        async with lock:
+            if self._skip(cache_key):
+                return None
+
+            handle = self._handles.get(cache_key)
+            if not self._needs_refresh(handle):
+                return handle
+
+            try:
+                if handle is not None and handle.expires_at > time.time():
+                    handle = await asyncio.to_thread(
+                        self.backend.refresh, handle, self.ttl
+                    )
+                    metrics.incr("context_cache.refreshed")
+                else:
+                    tokens = await asyncio.to_thread(
+                        self.backend.count_tokens, model_name, prefix
+                    )
+                    if tokens < self.min_tokens:
+                        self._uncacheable.add(cache_key)
+                        metrics.incr("context_cache.too_small")
+                        logger.info(
+                            f"Prefix {key} on {model_name} has {tokens} tokens "
+                            f"(< {self.min_tokens}), not caching"
+                        )
+                        return None
+
+                    handle = await asyncio.to_thread(
+                        self.backend.create, model_name, prefix, self.ttl
+                    )
+                    metrics.incr("context_cache.created")
+                    logger.info(
+                        f"Context cache created for {key} on {model_name}: "
+                        f"{handle.name} ({handle.token_count} tokens)"
+                    )
+            except Exception as e:
+                self._handles.pop(cache_key, None)
+                self._unavailable_until[cache_key] = time.monotonic() + self.retry_after
+                metrics.incr("context_cache.unavailable")
+                logger.warning(f"Context caching unavailable for {key}: {e}")
+                return None
+
+            self._handles[cache_key] = handle
+            return handle
+
+    def invalidate(self, model_name: str, key: str) -> None:
+        """Handle bị provider từ chối (đã xoá/hết hạn) → tạo lại lần sau"""
+        self._handles.pop((model_name, key), None)
+
+    async def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
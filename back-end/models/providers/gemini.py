@@ -1,20 +1,40 @@
+import asyncio
 import base64
 import io
+import mimetypes
 import os
 import re
-from typing import Any, Iterator, List, Optional
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Type
 
 import google.generativeai as genai
+from config import settings
 from google.generativeai.types import HarmBlockThreshold, HarmCategory
 from dotenv import load_dotenv
 import httpx
-from langchain_core.callbacks import CallbackManagerForLLMRun
-from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    SystemMessage,
+)
 from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
 from models.base.base_llm import BaseReasoningModel
 from models.base.base_vlm import BaseVisionLanguageModel
-from pydantic import Field, PrivateAttr
+from models.providers.context_cache import (
+    ContextCacheManager,
+    GeminiContextCacheBackend,
+)
+from pydantic import BaseModel, Field, PrivateAttr
+from utils.image_fetcher import get_image_fetcher
 from utils.logger import setup_logger
+from utils.metrics import metrics
 
 from PIL import Image
 
@@ -22,6 +42,117 @@ load_dotenv()
 
 logger = setup_logger(__name__)
 
+_in_flight = 0
+
+
+@contextmanager
+def _track_in_flight():
+    """Gauge gemini.in_flight: số request async đang chờ Gemini"""
+    global _in_flight
+    _in_flight += 1
+    metrics.set_gauge("gemini.in_flight", _in_flight)
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+        metrics.set_gauge("gemini.in_flight", _in_flight)
+
+
+# MIME types Gemini nhận trực tiếp dạng inline blob
+_INLINE_IMAGE_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "image/heic",
+    "image/heif",
+}
+# Gemini's max dimension
+_MAX_IMAGE_DIMENSION = 3072
+
+
+def to_image_part(image_bytes: bytes, mime_type: str, passthrough: bool = True):
+    """
+    Bytes ảnh → part cho Gemini SDK
+
+    Pass-through (mặc định): ảnh đã là JPEG/PNG/WebP hợp lệ và không quá lớn
+    → gửi nguyên bytes dạng inline blob {"mime_type", "data"}.
+    Không decode pixel (PIL chỉ đọc header để lấy kích thước), không re-encode.
+
+    Fallback (format khác, ảnh quá lớn, passthrough=False): decode bằng PIL,
+    convert/resize → SDK re-encode khi gửi.
+    """
+    mime_type = "image/jpeg" if mime_type == "image/jpg" else mime_type
+
+    with Image.open(io.BytesIO(image_bytes)) as probe:
+        size = probe.size
+
+    if (
+        passthrough
+        and mime_type in _INLINE_IMAGE_TYPES
+        and max(size) <= _MAX_IMAGE_DIMENSION
+    ):
+        metrics.incr("gemini.image.passthrough")
+        return {"mime_type": mime_type, "data": image_bytes}
+
+    metrics.incr("gemini.image.reencoded")
+    image = Image.open(io.BytesIO(image_bytes))
+    logger.info(f"✅ Decoded image: {image.format} {image.size} {image.mode}")
+
+    # Convert to RGB if needed (Gemini works best with RGB)
+    if image.mode not in ('RGB', 'RGBA'):
+        logger.info(f"🔄 Converting image from {image.mode} to RGB")
+        image = image.convert('RGB')
+
+    # Resize if too large (Gemini has size limits)
+    if max(image.size) > _MAX_IMAGE_DIMENSION:
+        ratio = _MAX_IMAGE_DIMENSION / max(image.size)
+        new_size = tuple(int(dim * ratio) for dim in image.size)
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+        logger.info(f"🔄 Resized image to {new_size}")
+
+    return image
+
+
+# Các key OpenAPI mà response_schema của Gemini chấp nhận
+_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "required"}
+
+
+@lru_cache(maxsize=None)
+def gemini_response_schema(model: Type[BaseModel]) -> dict:
+    """
+    Pydantic model → response_schema cho Gemini JSON mode
+
+    Gemini chỉ nhận một tập con OpenAPI: inline $ref, Optional (anyOf null)
+    → nullable, bỏ title/default/minimum/maximum...
+    """
+    json_schema = model.model_json_schema()
+    definitions = json_schema.get("$defs", {})
+
+    def convert(node: dict) -> dict:
+        if "$ref" in node:
+            ref = definitions[node["$ref"].split("/")[-1]]
+            node = {**ref, **{k: v for k, v in node.items() if k != "$ref"}}
+
+        if "anyOf" in node:
+            options = [o for o in node["anyOf"] if o.get("type") != "null"]
+            converted = convert(options[0])
+            if "description" in node:
+                converted["description"] = node["description"]
+            if len(options) < len(node["anyOf"]):
+                converted["nullable"] = True
+            return converted
+
+        converted = {k: v for k, v in node.items() if k in _SCHEMA_KEYS}
+        if "properties" in node:
+            converted["properties"] = {
+                name: convert(prop) for name, prop in node["properties"].items()
+            }
+        if "items" in node:
+            converted["items"] = convert(node["items"])
+        return converted
+
+    return convert(json_schema)
+
 
 class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
     """
@@ -41,6 +172,7 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
     _gemini_model: Any = PrivateAttr()
     _generation_config: Any = PrivateAttr()
     _safety_settings: Any = PrivateAttr()
+    _context_cache: Optional[ContextCacheManager] = PrivateAttr(default=None)
 
     def __init__(
         self,
@@ -49,6 +181,7 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
         temperature: float = 0.7,
         top_p: float = 0.95,
         max_output_tokens: int = 8192,
+        context_cache: Optional[ContextCacheManager] = None,
         **kwargs
     ):
         # ✅ Call super().__init__() FIRST
@@ -87,8 +220,37 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
             safety_settings=self._safety_settings
         )
 
+        # Explicit context caching cho prompt prefix tĩnh (inject được để test)
+        if context_cache is None and settings.GEMINI_CONTEXT_CACHE_ENABLED:
+            context_cache = ContextCacheManager(
+                backend=GeminiContextCacheBackend(),
+                ttl=settings.GEMINI_CONTEXT_CACHE_TTL,
+                refresh_margin=settings.GEMINI_CONTEXT_CACHE_REFRESH_MARGIN,
+                min_tokens=settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+            )
+        self._context_cache = context_cache
+
         logger.info(f"✅ Gemini initialized: {self.model_name}")
 
+    def _get_generation_config(self, response_schema: Optional[Type[BaseModel]] = None):
+        """
+        Generation config cho một lần gọi
+
+        response_schema → JSON mode native (response_mime_type + schema),
+        output luôn là JSON đúng schema, không cần strip fence/repair
+        """
+        if response_schema is None:
+            return self._generation_config
+
+        return genai.types.GenerationConfig(
+            temperature=self.temperature,
+            top_p=self.top_p,
+            top_k=40,
+            max_output_tokens=self.max_output_tokens,
+            response_mime_type="application/json",
+            response_schema=gemini_response_schema(response_schema),
+        )
+
     @property
     def _llm_type(self) -> str:
         return "gemini"
@@ -134,13 +296,20 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
                     logger.info(f"  Part {i}: text ({len(part)} chars)")
                 elif isinstance(part, Image.Image):
                     logger.info(f"  Part {i}: PIL Image ({part.size})")
+                elif isinstance(part, dict):
+                    logger.info(
+                        f"  Part {i}: inline {part['mime_type']} "
+                        f"({len(part['data'])} bytes)"
+                    )
                 else:
                     logger.info(f"  Part {i}: {type(part)}")
 
             # Send multimodal message (list of parts)
             response = chat.send_message(
                 last_message_parts,  # ✅ FIX: Send ALL parts, not just parts[0]
-                generation_config=self._generation_config,
+                generation_config=self._get_generation_config(
+                    kwargs.get("response_schema")
+                ),
             )
 
             return ChatResult(
@@ -183,16 +352,7 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
 
             # Yield chunks
             for chunk in response:
-                text_content = ""
-
-                try:
-                    if hasattr(chunk, "text") and chunk.text:
-                        text_content = chunk.text
-                except (ValueError, AttributeError):
-                    if hasattr(chunk, "parts") and chunk.parts:
-                        for part in chunk.parts:
-                            if hasattr(part, "text") and part.text:
-                                text_content += part.text
+                text_content = self._chunk_text(chunk)
 
                 if text_content:
                     yield ChatGenerationChunk(
@@ -206,7 +366,220 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
             logger.error(f"❌ Gemini streaming error: {e}")
             raise ValueError(f"Gemini streaming error: {str(e)}")
 
-    def _prepare_messages(self, messages: List[BaseMessage]) -> List[dict]:
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """
+        ✅ Async generation (ainvoke) - không block event loop
+
+        Ảnh URL tải song song qua ImageFetcher, _prepare_messages (CPU) chạy
+        trong thread, request dùng send_message_async của SDK (grpc.aio)
+
+        kwargs:
+            response_schema: Pydantic model → JSON mode
+            context_cache: (version_hash, static system prefix) → dùng
+                cached content thay vì gửi lại prefix
+        """
+        try:
+            with _track_in_flight():
+                response = await self._send_async(messages, kwargs)
+
+            return ChatResult(
+                generations=[ChatGeneration(message=AIMessage(content=response.text))]
+            )
+
+        except Exception as e:
+            logger.error(f"❌ Gemini async generation error: {e}")
+            raise ValueError(f"Gemini error: {str(e)}")
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """
+        ✅ Async streaming generation (astream)
+        """
+        try:
+            with _track_in_flight():
+                start = time.perf_counter()
+                first_token = True
+                response = await self._send_async(messages, kwargs, stream=True)
+
+                async for chunk in response:
+                    text_content = self._chunk_text(chunk)
+                    if text_content:
+                        if first_token:
+                            first_token = False
+                            metrics.observe("gemini.ttft", time.perf_counter() - start)
+                        yield ChatGenerationChunk(
+                            message=AIMessageChunk(content=text_content)
+                        )
+
+                        if run_manager:
+                            await run_manager.on_llm_new_token(text_content)
+
+        except Exception as e:
+            logger.error(f"❌ Gemini async streaming error: {e}")
+            raise ValueError(f"Gemini streaming error: {str(e)}")
+
+    async def _send_async(
+        self, messages: List[BaseMessage], kwargs: Dict[str, Any], stream: bool = False
+    ):
+        """
+        Gửi request qua cached content nếu có; cache bị từ chối (hết hạn,
+        bị xoá phía server) → invalidate và gửi lại với prompt đầy đủ
+        """
+        model, request_messages = await self._resolve_context_cache(messages, kwargs)
+        try:
+            return await self._send_with_model(model, request_messages, kwargs, stream)
+        except Exception as e:
+            if model is self._gemini_model:
+                raise
+            logger.warning(f"Cached content rejected, retrying without cache: {e}")
+            self._context_cache.invalidate(
+                self.model_name, kwargs["context_cache"][0]
+            )
+            metrics.incr("context_cache.fallbacks")
+            return await self._send_with_model(
+                self._gemini_model, messages, kwargs, stream
+            )
+
+    async def _send_with_model(
+        self, model, messages: List[BaseMessage], kwargs: Dict[str, Any], stream: bool
+    ):
+        gemini_messages = await self._aprepare_messages(messages)
+
+        chat = model.start_chat(
+            history=gemini_messages[:-1] if len(gemini_messages) > 1 else []
+        )
+        return await chat.send_message_async(
+            gemini_messages[-1]["parts"],
+            generation_config=self._get_generation_config(
+                kwargs.get("response_schema")
+            ),
+            stream=stream,
+        )
+
+    async def prepare_context_cache(self, context_cache: Tuple[str, str]) -> None:
+        """
+        Warm-up: tạo sẵn cached content cho (version_hash, prefix) để request
+        không phải chờ API tạo cache
+        """
+        if self._context_cache is not None:
+            key, prefix = context_cache
+            await self._context_cache.prepare(self.model_name, key, prefix)
+
+    async def _resolve_context_cache(
+        self, messages: List[BaseMessage], kwargs: Dict[str, Any]
+    ) -> Tuple[Any, List[BaseMessage]]:
+        """
+        (model, messages) cho request
+
+        Với context_cache=(key, prefix) và system message bắt đầu bằng prefix:
+        prefix nằm trong cached content (system_instruction), phần còn lại
+        của system message (biến theo request) gửi như bình thường
+        """
+        spec = kwargs.get("context_cache")
+        if (
+            spec is None
+            or self._context_cache is None
+            or not messages
+            or messages[0].type != "system"
+        ):
+            return self._gemini_model, messages
+
+        key, prefix = spec
+        system_content = messages[0].content
+        if not isinstance(system_content, str) or not system_content.startswith(prefix):
+            metrics.incr("context_cache.prefix_mismatch")
+            return self._gemini_model, messages
+
+        handle = self._context_cache.get(self.model_name, key, prefix)
+        if handle is None:
+            metrics.incr("context_cache.fallbacks")
+            return self._gemini_model, messages
+
+        metrics.incr("context_cache.hits")
+        metrics.incr("context_cache.saved_tokens", handle.token_count)
+
+        remainder = system_content[len(prefix):].strip()
+        remaining = list(messages[1:])
+        if remainder:
+            remaining.insert(0, SystemMessage(content=remainder))
+
+        model = self._context_cache.backend.model_for(
+            handle, self._generation_config, self._safety_settings
+        )
+        return model, remaining
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """Text của một stream chunk (chunk bị block → đọc từng part)"""
+        try:
+            if hasattr(chunk, "text") and chunk.text:
+                return chunk.text
+        except (ValueError, AttributeError):
+            if hasattr(chunk, "parts") and chunk.parts:
+                return "".join(
+                    part.text for part in chunk.parts
+                    if hasattr(part, "text") and part.text
+                )
+        return ""
+
+    async def _aprepare_messages(self, messages: List[BaseMessage]) -> List[dict]:
+        """
+        Async _prepare_messages: tải trước các ảnh HTTP(S) song song qua
+        ImageFetcher (pooled client + disk cache) thay vì httpx.get blocking
+        """
+        urls = list(
+            dict.fromkeys(
+                url
+                for url in self._collect_image_urls(messages)
+                if url.startswith("http")
+            )
+        )
+        prefetched: Dict[str, Optional[Tuple[bytes, str]]] = {}
+
+        if urls:
+            fetcher = get_image_fetcher()
+            results = await asyncio.gather(
+                *(fetcher.fetch(url) for url in urls), return_exceptions=True
+            )
+            for url, result in zip(urls, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"❌ Image fetch error: {result}")
+                    prefetched[url] = None
+                else:
+                    prefetched[url] = result
+
+        return await asyncio.to_thread(self._prepare_messages, messages, prefetched)
+
+    @staticmethod
+    def _collect_image_urls(messages: List[BaseMessage]) -> List[str]:
+        urls = []
+        for msg in messages:
+            if not isinstance(msg.content, list):
+                continue
+            for item in msg.content:
+                if item.get("type") == "image_url":
+                    field = item["image_url"]
+                    urls.append(field["url"] if isinstance(field, dict) else field)
+                elif item.get("type") == "image" and item.get("url"):
+                    urls.append(item["url"])
+        return urls
+
+    def _prepare_messages(
+        self,
+        messages: List[BaseMessage],
+        prefetched: Optional[Dict[str, Optional[Tuple[bytes, str]]]] = None,
+    ) -> List[dict]:
         """
         ✅ COMPLETE: Convert LangChain messages to Gemini chat format
 
@@ -214,6 +587,8 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
         - Text-only messages
         - Multimodal messages (text + image)
         - System message merging
+
+        prefetched: ảnh URL đã tải sẵn {url: (bytes, mime) | None}
         """
         gemini_messages = []
 
@@ -238,7 +613,7 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
                         else:
                             image_url = image_url_field
 
-                        image_part = self._process_image_url(image_url)
+                        image_part = self._process_image_url(image_url, prefetched)
                         if image_part:
                             parts.append(image_part)
 
@@ -258,9 +633,9 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
                                 logger.error(f"Missing 'data' or 'base64' field in base64 image block: {item}")
                                 continue
 
-                            # Reconstruct data URI for processing
-                            data_uri = f"data:{mime_type};base64,{base64_data}"
-                            image_part = self._process_image_url(data_uri)
+                            image_part = self._process_base64_image(
+                                base64_data, mime_type
+                            )
                             if image_part:
                                 parts.append(image_part)
 
@@ -270,7 +645,7 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
                                 logger.error(f"Missing 'url' field in url image block: {item}")
                                 continue
 
-                            image_part = self._process_image_url(image_url)
+                            image_part = self._process_image_url(image_url, prefetched)
                             if image_part:
                                 parts.append(image_part)
 
@@ -292,75 +667,73 @@ class Gemini(BaseReasoningModel, BaseVisionLanguageModel):
             system_content = messages[0].content
 
             if len(messages) > 1:
-                # Merge system into first user message
-                first_user_content = messages[1].content
-                merged_content = f"{system_content}\n\n{first_user_content}"
+                # Merge system into first user message (giữ nguyên part ảnh)
+                first_parts = gemini_messages[1]["parts"]
+                if len(first_parts) == 1 and isinstance(first_parts[0], str):
+                    merged_parts = [f"{system_content}\n\n{first_parts[0]}"]
+                else:
+                    merged_parts = [system_content, *first_parts]
 
                 gemini_messages = [
-                    {"role": "user", "parts": [merged_content]}
-                ] + [
-                    {
-                        "role": "user" if m.type in ["human", "user"] else "model",
-                        "parts": [m.content] if isinstance(m.content, str) else m.content
-                    }
-                    for m in messages[2:]
-                ]
+                    {"role": "user", "parts": merged_parts}
+                ] + gemini_messages[2:]
             else:
                 gemini_messages = [{"role": "user", "parts": [system_content]}]
 
         return gemini_messages
 
-    def _process_image_url(self, image_url: str):
+    def _process_base64_image(self, base64_data: str, mime_type: str):
+        """Base64 content block → part, không dựng lại data URI"""
+        try:
+            return to_image_part(base64.b64decode(base64_data), mime_type)
+        except Exception as e:
+            logger.error(f"❌ Image processing error: {e}")
+            return None
+
+    def _process_image_url(
+        self,
+        image_url: str,
+        prefetched: Optional[Dict[str, Optional[Tuple[bytes, str]]]] = None,
+    ):
         """
-        Process image URL for Gemini (using PIL Image)
+        Process image URL for Gemini
 
         Supports:
         - Base64 data URI
         - HTTP/HTTPS URL
         - Local file path
 
-        Returns: PIL Image object optimized for Gemini
+        Returns: Inline blob part (pass-through) hoặc PIL Image (fallback)
         """
         try:
-            image = None
-
             # Base64 data URI
             if image_url.startswith("data:image"):
-                match = re.search(r"base64,(.+)", image_url)
-                if match:
-                    base64_data = match.group(1)
-                    image_bytes = base64.b64decode(base64_data)
-                    image = Image.open(io.BytesIO(image_bytes))
-                    logger.info(f"✅ Decoded base64 image: {image.format} {image.size} {image.mode}")
+                match = re.search(r"data:([^;]+);base64,(.+)", image_url)
+                if not match:
+                    return None
+                mime_type = match.group(1)
+                image_bytes = base64.b64decode(match.group(2))
+
+            # HTTP/HTTPS URL đã tải sẵn (async path)
+            elif prefetched is not None and image_url in prefetched:
+                if prefetched[image_url] is None:
+                    return None
+                image_bytes, mime_type = prefetched[image_url]
 
             # HTTP/HTTPS URL
             elif image_url.startswith("http"):
                 response = httpx.get(image_url, timeout=10.0)
-                image = Image.open(io.BytesIO(response.content))
-                logger.info(f"✅ Downloaded image from URL: {image.format} {image.size} {image.mode}")
+                mime_type = response.headers.get("content-type", "").split(";")[0]
+                image_bytes = response.content
+                logger.info(f"✅ Downloaded image from URL ({len(image_bytes)} bytes)")
 
             # Local file path
             else:
-                image = Image.open(image_url)
-                logger.info(f"✅ Loaded local image: {image.format} {image.size} {image.mode}")
-
-            if image:
-                # Convert to RGB if needed (Gemini works best with RGB)
-                if image.mode not in ('RGB', 'RGBA'):
-                    logger.info(f"🔄 Converting image from {image.mode} to RGB")
-                    image = image.convert('RGB')
+                mime_type = mimetypes.guess_type(image_url)[0] or ""
+                with open(image_url, "rb") as f:
+                    image_bytes = f.read()
 
-                # Resize if too large (Gemini has size limits)
-                max_dimension = 3072  # Gemini's max dimension
-                if max(image.size) > max_dimension:
-                    ratio = max_dimension / max(image.size)
-                    new_size = tuple(int(dim * ratio) for dim in image.size)
-                    image = image.resize(new_size, Image.Resampling.LANCZOS)
-                    logger.info(f"🔄 Resized image to {new_size}")
-
-                return image
-
-            return None
+            return to_image_part(image_bytes, mime_type)
 
         except Exception as e:
             logger.error(f"❌ Image processing error: {e}")
@@ -309,4 +309,15 @@ class OpenRouterVLM(BaseVisionLanguageModel):
         if max_tokens is not None:
             payload["max_tokens"] = max_tokens
 
+        # Structured output: Pydantic model → JSON schema response_format
+        response_schema = kwargs.get("response_schema")
+        if response_schema is not None:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": response_schema.__name__,
+                    "schema": response_schema.model_json_schema(),
+                },
+            }
+
         return payload
@@ -0,0 +1,175 @@
+"""
+Prompt registry: render prompt tĩnh + format instructions một lần, dùng lại
+
+Mỗi prompt được build một lần cho mỗi (PROMPT_VERSION, schema) và có
+version_hash tính từ nội dung đã render → dùng làm key cho result cache
+(analysis cache) và context cache phía provider.
+"""
+import hashlib
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple, Type
+
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+from prompt.advisor_prompt import get_image_advisor_prompt_v2
+from prompt.text_advisor_prompt import get_text_advisor_prompt
+from prompt.vision_prompt_v2 import get_component_detection_prompt
+from schema.food_components import ComponentDetectionResult
+
+# Tăng khi đổi cách build prompt mà nội dung render không đổi
+PROMPT_VERSION = "2"
+
+COMPONENT_DETECTION = "component_detection"
+IMAGE_ADVISOR = "image_advisor_v2"
+TEXT_ADVISOR = "text_advisor"
+
+_VARIABLE_RE = re.compile(r"(?<!\{)\{[A-Za-z_]\w*\}")
+
+_COMPONENT_DETECTION_QUERY = (
+    "Phân tích các thành phần có trong món ăn. "
+    "CHỈ detect components, KHÔNG tính nutrition."
+)
+
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    name: str
+    template: ChatPromptTemplate
+    # System prompt đã render (phần tĩnh, không phụ thuộc request)
+    system_text: str
+    version_hash: str
+    parser: Optional[PydanticOutputParser] = None
+    format_instructions: Optional[str] = None
+    # Prompt render đầy đủ (chỉ với prompt không có biến theo request)
+    text: Optional[str] = None
+    # Phần user message tĩnh (component detection query)
+    user_text: Optional[str] = None
+    # Đầu system prompt không chứa biến → cache được phía provider
+    cache_prefix: str = ""
+
+    @property
+    def context_cache(self) -> Tuple[str, str]:
+        """kwarg context_cache cho Gemini: (version_hash, cache_prefix)"""
+        return self.version_hash, self.cache_prefix
+
+
+def _format_instructions(schema: Type[BaseModel]) -> Tuple[PydanticOutputParser, str]:
+    parser = PydanticOutputParser(pydantic_object=schema)
+    instructions = (
+        parser.get_format_instructions().replace("```json", "").replace("```", "")
+    )
+    return parser, instructions
+
+
+def _system_text(template: ChatPromptTemplate) -> str:
+    """Render system message với partial variables (format_instructions...)"""
+    system = template.messages[0]
+    prompt = system.prompt
+    return prompt.format(**{**template.partial_variables, **prompt.partial_variables})
+
+
+def _static_prefix(template_text: str) -> str:
+    """Phần system template trước biến đầu tiên, đã unescape {{ }}"""
+    match = _VARIABLE_RE.search(template_text)
+    prefix = template_text[: match.start()] if match else template_text
+    return prefix.replace("{{", "{").replace("}}", "}")
+
+
+def _version_hash(name: str, *parts: Optional[str]) -> str:
+    raw = "|".join([PROMPT_VERSION, name, *(p or "" for p in parts)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _build_component_detection(schema: Type[BaseModel]) -> RenderedPrompt:
+    parser, instructions = _format_instructions(schema)
+    template = get_component_detection_prompt(instructions)
+    text = template.format(query=_COMPONENT_DETECTION_QUERY)
+    system_text = _system_text(template)
+    return RenderedPrompt(
+        name=COMPONENT_DETECTION,
+        template=template,
+        system_text=system_text,
+        version_hash=_version_hash(COMPONENT_DETECTION, text),
+        parser=parser,
+        format_instructions=instructions,
+        text=text,
+        user_text=_COMPONENT_DETECTION_QUERY,
+        # System prompt không có biến theo request → cache toàn bộ
+        cache_prefix=system_text,
+    )
+
+
+def _build_template(name: str, factory: Callable[[], ChatPromptTemplate]):
+    def build(schema: Optional[Type[BaseModel]]) -> RenderedPrompt:
+        template = factory()
+        system_text = template.messages[0].prompt.template
+        return RenderedPrompt(
+            name=name,
+            template=template,
+            system_text=system_text,
+            version_hash=_version_hash(name, system_text),
+            cache_prefix=_static_prefix(system_text),
+        )
+
+    return build
+
+
+class PromptRegistry:
+    """
+    Memoize RenderedPrompt theo (name, PROMPT_VERSION, schema)
+
+    ChatPromptTemplate không bị mutate khi format/invoke nên dùng chung
+    được giữa các request
+    """
+
+    def __init__(self):
+        self._builders: Dict[str, Tuple[Callable, Optional[Type[BaseModel]]]] = {}
+        self._rendered: Dict[Tuple[str, str, str], RenderedPrompt] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        builder: Callable[[Optional[Type[BaseModel]]], RenderedPrompt],
+        schema: Optional[Type[BaseModel]] = None,
+    ) -> None:
+        self._builders[name] = (builder, schema)
+
+    def get(
+        self, name: str, schema: Optional[Type[BaseModel]] = None
+    ) -> RenderedPrompt:
+        builder, default_schema = self._builders[name]
+        schema = schema or default_schema
+        key = (name, PROMPT_VERSION, schema.__name__ if schema else "")
+
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            with self._lock:
+                rendered = self._rendered.get(key)
+                if rendered is None:
+                    rendered = builder(schema)
+                    self._rendered[key] = rendered
+        return rendered
+
+    def version_hash(self, name: str) -> str:
+        return self.get(name).version_hash
+
+    def warm_up(self) -> Dict[str, str]:
+        """Render tất cả prompt đã đăng ký (startup) → {name: version_hash}"""
+        return {name: self.version_hash(name) for name in self._builders}
+
+
+# Singleton
+prompt_registry = PromptRegistry()
+prompt_registry.register(
+    COMPONENT_DETECTION, _build_component_detection, schema=ComponentDetectionResult
+)
+prompt_registry.register(
+    IMAGE_ADVISOR, _build_template(IMAGE_ADVISOR, get_image_advisor_prompt_v2)
+)
+prompt_registry.register(
+    TEXT_ADVISOR, _build_template(TEXT_ADVISOR, get_text_advisor_prompt)
+)
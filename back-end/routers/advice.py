@@ -1,9 +1,8 @@
-import json
 import uuid
 from typing import Optional
 
-from database.connection import get_db
-from database.crud import get_user_by_email
+from database.connection import get_async_db
+from database.async_crud import get_user_by_email
 from dependencies import get_workflow_service
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 from fastapi.responses import StreamingResponse
@@ -13,9 +12,11 @@ from services.cloudinary_service import CloudinaryService, get_cloudinary_servic
 from services.user_service import UserProfileService
 from services.workflow_service import WorkflowService, get_profile_service
 from utils.image_base64_helper import upload_file_to_base64, validate_image_file
+from utils.image_executor import ImageQueueFullError
+from utils.sse import SSEFormat, SSEWriter
 from utils.logger import setup_logger
 from utils.auth import get_current_user
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from utils.auth import get_current_user
 from utils.logger import setup_logger
 
@@ -79,16 +80,17 @@ async def stream_advice(
     thread_id: Optional[str] = Form(None),
     user_query: str = Form(..., min_length=1),
     img_file: Optional[UploadFile] = File(None),
+    stream_format: SSEFormat = Form("json"),
     # user_id: str = Header(..., alias="X-User-ID"),
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     service: WorkflowService = Depends(get_workflow_service),
     profile_service: UserProfileService = Depends(get_profile_service),
     # cloudinary_service: CloudinaryService = Depends(get_cloudinary_service)
 ):
 
     # Get user from database
-    user = get_user_by_email(db, current_user_email)
+    user = await get_user_by_email(db, current_user_email)
     print("USER=====>:", user)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -124,6 +126,10 @@ async def stream_advice(
             
             logger.info(f"Image → base64 ({len(image_data_uri)} bytes)")
             
+        except ImageQueueFullError as e:
+            raise HTTPException(
+                status_code=429, detail=str(e), headers={"Retry-After": "1"}
+            )
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
@@ -144,34 +150,40 @@ async def stream_advice(
     user_profile = format_user_profile(user_profile)
     print("=====>FORMATTED USER PROFILE:", user_profile)
 
+    writer = SSEWriter(format=stream_format)
+
+    async def events():
+        if image_data_uri:
+            yield {
+                "type": "image_received",
+                "content": {"size": len(image_data_uri), "format": "base64"},
+            }
+
+        async for event in service.process_request_stream(
+            thread_id=thread_id,
+            image_url=image_data_uri,
+            user_query=user_query,
+            user_profile=user_profile,
+        ):
+            yield event
+
     async def event_generator():
         try:
-            yield f"thread_id: {thread_id}\n\n"
-            if image_data_uri:
-                yield f"data: {json.dumps({
-                    'type': 'image_received',
-                    'content': {
-                        'size': len(image_data_uri),
-                        'format': 'base64'
-                    }
-                }, ensure_ascii=False)}\n\n"
-
-            async for event in service.process_request_stream(
-                thread_id=thread_id,
-                image_url=image_data_uri,
-                user_query=user_query,
-                user_profile=user_profile,
-            ):
-                # Format SSE
-                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            yield writer.raw(f"thread_id: {thread_id}\n\n")
+
+            # Token được gộp thành frame theo SSE_FLUSH_INTERVAL_MS / SSE_FLUSH_BYTES
+            async for frame in writer.stream(events()):
+                yield frame
 
             # End signal
-            yield "data: [DONE]\n\n"
+            yield writer.done()
 
         except Exception as e:
             # Global error handler
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
-            yield "data: [DONE]\n\n"
+            yield writer.encode({"type": "error", "content": str(e)})
+            yield writer.done()
+        finally:
+            writer.close()
 
     return StreamingResponse(
         event_generator(),
@@ -1,28 +1,38 @@
+import json
 from datetime import datetime, time
 from typing import Optional
 
-from database.connection import get_db
-from database.crud import (
+from database.connection import get_async_db
+from database.async_crud import (
     create_user_meal,
+    enqueue_analysis_job,
     get_user_by_email,
     get_user_by_id,
     get_user_meal_by_id,
     get_user_meals,
     get_user_meals_by_date_range,
     mark_meal_failed,
-    update_meal_analysis,
 )
-from database.models import MealTypeDB
+from database.models import AnalysisJobStatusDB, MealTypeDB
 from dependencies import get_workflow_service
 from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
-from fastapi.responses import JSONResponse
-from models.factory import ModelFactory
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from services.analysis_job_service import (
+    TERMINAL_JOB_STATUSES,
+    analyze_and_save_meal,
+    get_job_status,
+    notify_analysis_worker,
+    wait_for_job,
+)
 from services.cloudinary_service import CloudinaryService, get_cloudinary_service
 from services.workflow_service import WorkflowService
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from utils.auth import get_current_user
+from utils.image_base64_helper import ImageIngest
+from utils.image_executor import ImageQueueFullError
 from utils.logger import setup_logger
+from utils.metrics import metrics
 
 logger = setup_logger(__name__)
 
@@ -58,16 +68,19 @@ async def upload_and_analyze_image(
         "snack", description="Loại bữa ăn (breakfast, lunch, dinner, snack)"
     ),
     meal_time: Optional[str] = Form(None, description="Thời gian bữa ăn (ISO format)"),
+    async_job: bool = Form(
+        False, description="Trả 202 ngay, phân tích trong analysis worker"
+    ),
     cloudinary_service: CloudinaryService = Depends(get_cloudinary_service),
     workflow_service: WorkflowService = Depends(get_workflow_service),
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Upload ảnh lên Cloudinary và phân tích ngay, sau đó lưu vào database
 
     Workflow:
-    1. Upload ảnh lên Cloudinary
+    1. Đọc upload một lần, optimize + upload JPEG đã optimize lên Cloudinary
     2. Nhận URL
     3. Tạo record trong database với status PENDING
     4. Gọi vision analysis
@@ -79,11 +92,15 @@ async def upload_and_analyze_image(
     - meal_type: Loại bữa ăn (breakfast, lunch, dinner, snack) - default: snack
     - meal_time: Thời gian bữa ăn (ISO format, e.g., 2025-01-01T12:30:00) \
         - optional, defaults to current time
+    - async_job: true → lưu meal PENDING, enqueue job và trả 202 + meal_id;
+        theo dõi qua GET /analyze/jobs/{meal_id} (?wait=N long-poll)
+        hoặc SSE GET /analyze/jobs/{meal_id}/events
 
     """
     meal_id = None
+    ingest = None
     try:
-        user = get_user_by_email(db, current_user_email)
+        user = await get_user_by_email(db, current_user_email)
         if not user:
             raise HTTPException(
                 status_code=404,
@@ -118,36 +135,23 @@ async def upload_and_analyze_image(
 
         logger.info(f"Processing image for user {user_id}")
 
-        # 🚀 OPTIMIZATION: Convert to base64 immediately for Gemini (fast path)
-        from utils.image_base64_helper import upload_file_to_base64
-
+        # 🚀 OPTIMIZATION: Read upload ONCE, convert to base64 for Gemini (fast path)
         try:
-            image_base64 = await upload_file_to_base64(
-                file=file,
-                max_size_mb=10.0,
-                optimize=True,
-                max_dimension=1024
-            )
+            ingest = await ImageIngest.from_upload(file, max_size_mb=10.0)
+            image_base64 = await ingest.to_data_uri(optimize=True, max_dimension=1024)
             logger.info("✅ Image converted to base64 for Gemini")
+        except ImageQueueFullError as e:
+            raise HTTPException(
+                status_code=429, detail=str(e), headers={"Retry-After": "1"}
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=400,
                 detail=f"Failed to process image: {str(e)}"
             )
 
-        # 📤 Start Cloudinary upload in background (will complete async)
-        import asyncio
-        cloudinary_task = asyncio.create_task(
-            cloudinary_service.upload_image(
-                file=file,
-                user_id=user_id,
-                optimize=True,
-            )
-        )
-        logger.info("⏳ Cloudinary upload started in background")
-
         # Tạo record meal trong database với status PENDING (placeholder URL)
-        meal = create_user_meal(
+        meal = await create_user_meal(
             db=db,
             user_id=user_id,
             image_url="pending",  # Will be updated after Cloudinary upload
@@ -157,107 +161,173 @@ async def upload_and_analyze_image(
         meal_id = meal.id
         logger.info(f"Created meal record with ID: {meal_id}")
 
-        # 🔥 Phân tích ảnh NGAY với base64 (không chờ Cloudinary)
-        analysis_result = await workflow_service.analyze_image(image_base64)
-        analysis_dict = (
-            analysis_result.model_dump()
-            if hasattr(analysis_result, "model_dump")
-            else analysis_result.dict()
-        )
-
-        # Get model name from ModelFactory
-        vlm_model = ModelFactory.create_vlm()
-        model_name = getattr(vlm_model, "model_name", "unknown_model")
+        if async_job:
+            # Job mode: worker xử lý upload + phân tích, trả 202 ngay
+            await enqueue_analysis_job(
+                db=db,
+                meal_id=meal_id,
+                user_id=user_id,
+                image_data=ingest.upload_payload(),
+                content_type=ingest.optimized_content_type or ingest.content_type,
+            )
+            notify_analysis_worker()
+            metrics.incr("analysis_jobs.enqueued")
+            logger.info(f"Enqueued analysis job for meal ID: {meal_id}")
+
+            return JSONResponse(
+                content={
+                    "meal_id": meal_id,
+                    "status": AnalysisJobStatusDB.QUEUED.value,
+                    "status_url": f"/analyze/jobs/{meal_id}",
+                    "events_url": f"/analyze/jobs/{meal_id}/events",
+                },
+                status_code=202,
+            )
 
-        # ⏳ Wait for Cloudinary upload to complete
+        # 🔥 Upload Cloudinary song song + phân tích ảnh NGAY với base64
         try:
-            upload_result = await cloudinary_task
-            image_url = upload_result.get("secure_url")
-            logger.info(f"✅ Cloudinary upload completed: {image_url}")
-        except Exception as e:
-            logger.error(f"⚠️ Cloudinary upload failed: {e}")
-            # Continue with analysis, use placeholder
-            upload_result = {
-                "secure_url": "upload_failed",
-                "thumbnail_url": None,
-                "public_id": "none",
-                "width": 0,
-                "height": 0,
-                "format": "unknown",
-                "size": 0,
-            }
-            image_url = "upload_failed"
-
-        # Lưu kết quả phân tích vào database
-        updated_meal = update_meal_analysis(
-            db=db,
-            meal_id=meal_id,
-            analysis_data=analysis_dict,
-            model_name=model_name,
-        )
-
-        if not updated_meal:
-            raise HTTPException(
-                status_code=500, detail="Failed to save analysis results"
+            response = await analyze_and_save_meal(
+                db=db,
+                meal_id=meal_id,
+                user_id=user_id,
+                image_data_uri=image_base64,
+                upload_payload=ingest.upload_payload(),
+                workflow_service=workflow_service,
+                cloudinary_service=cloudinary_service,
             )
-
-        # Update meal with real Cloudinary URL
-        from database.crud import update_meal_image_url
-        if image_url and image_url != "upload_failed":
-            update_meal_image_url(db, meal_id, image_url)
-            logger.info(f"Updated meal {meal_id} with Cloudinary URL")
-
-        logger.info(f"Analysis results saved for meal ID: {meal_id}")
-
-        response = {
-            "meal_id": meal_id,
-            "upload": {
-                "url": upload_result["secure_url"],
-                "thumbnail_url": upload_result.get("thumbnail_url"),
-                "public_id": upload_result["public_id"],
-                "width": upload_result["width"],
-                "height": upload_result["height"],
-                "format": upload_result["format"],
-                "size": upload_result["size"],
-            },
-            "analysis": analysis_dict,
-            "nutrition_summary": {
-                "total_calories": round(updated_meal.total_calories, 2),
-                "total_protein": round(updated_meal.total_protein, 2),
-                "total_fat": round(updated_meal.total_fat, 2),
-                "total_carbs": round(updated_meal.total_carbs, 2),
-                "total_fiber": round(updated_meal.total_fiber, 2),
-                "total_sodium": round(updated_meal.total_sodium, 2),
-            },
-        }
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
         return JSONResponse(content=response, status_code=200)
 
     except HTTPException:
         # Re-raise HTTP exceptions
         if meal_id:
-            mark_meal_failed(db, meal_id, "HTTP error occurred")
+            await mark_meal_failed(db, meal_id, "HTTP error occurred")
         raise
     except Exception as e:
         logger.error(f"Failed to process image: {e}")
         if meal_id:
-            mark_meal_failed(db, meal_id, str(e))
+            await mark_meal_failed(db, meal_id, str(e))
         raise HTTPException(
             status_code=500, detail=f"Image processing failed: {str(e)}"
         )
+    finally:
+        if ingest is not None:
+            ingest.close()
+
+
+def _job_response(job: dict) -> dict:
+    return {
+        "meal_id": job["meal_id"],
+        "status": job["status"].value,
+        "attempts": job["attempts"],
+        "error": job["error"]
+        if job["status"] == AnalysisJobStatusDB.FAILED
+        else None,
+    }
+
+
+async def _get_owned_job(
+    meal_id: int, current_user_email: str, db: AsyncSession
+) -> dict:
+    user = await get_user_by_email(db, current_user_email)
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail=f"User with email {current_user_email} not found. \
+                Please ensure user exists in database.",
+        )
+
+    job = await get_job_status(meal_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+
+    # Verify ownership
+    if job["user_id"] != user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    return job
+
+
+@router.get("/jobs/{meal_id}")
+async def get_analysis_job(
+    meal_id: int,
+    wait: float = Query(
+        0, ge=0, le=30, description="Long-poll: chờ tối đa N giây tới khi job xong"
+    ),
+    current_user_email: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Trạng thái job phân tích (queued, running, succeeded, failed)
+
+    Khi succeeded → lấy kết quả chi tiết qua GET /analyze/meals/{meal_id}
+    """
+    job = await _get_owned_job(meal_id, current_user_email, db)
+
+    if wait and job["status"] not in TERMINAL_JOB_STATUSES:
+        job = await wait_for_job(meal_id, timeout=wait) or job
+
+    return JSONResponse(content=_job_response(job), status_code=200)
+
+
+@router.get("/jobs/{meal_id}/events")
+async def stream_analysis_job(
+    meal_id: int,
+    current_user_email: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    SSE: phát event mỗi khi trạng thái job thay đổi, đóng stream khi job kết thúc
+    """
+    job = await _get_owned_job(meal_id, current_user_email, db)
+
+    async def event_generator():
+        current = job
+        try:
+            yield f"data: {json.dumps(_job_response(current))}\n\n"
+            while current["status"] not in TERMINAL_JOB_STATUSES:
+                updated = await wait_for_job(
+                    meal_id, timeout=15, since=current["status"]
+                )
+                if updated is None:
+                    break
+                if updated["status"] == current["status"]:
+                    # Heartbeat comment giữ kết nối qua proxy
+                    yield ": keep-alive\n\n"
+                    continue
+                current = updated
+                yield f"data: {json.dumps(_job_response(current))}\n\n"
+
+            yield "data: [DONE]\n\n"
+
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+            yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
 @router.get("/meals/{meal_id}")
 async def get_meal_detail(
     meal_id: int,
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Lấy chi tiết một bữa ăn theo ID
     """
     try:
-        user = get_user_by_email(db, current_user_email)
+        user = await get_user_by_email(db, current_user_email)
         if not user:
             raise HTTPException(
                 status_code=404,
@@ -268,7 +338,7 @@ async def get_meal_detail(
         user_id = user.id
 
         # Get meal
-        meal = get_user_meal_by_id(db, meal_id)
+        meal = await get_user_meal_by_id(db, meal_id)
         if not meal:
             raise HTTPException(status_code=404, detail="Meal not found")
 
@@ -330,7 +400,7 @@ async def get_meal_history(
         50, ge=1, le=100, description="Maximum number of records to return"
     ),
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Lấy lịch sử bữa ăn của user
@@ -341,7 +411,7 @@ async def get_meal_history(
     - limit: Pagination - số records tối đa (default: 50, max: 100)
     """
     try:
-        user = get_user_by_email(db, current_user_email)
+        user = await get_user_by_email(db, current_user_email)
         if not user:
             raise HTTPException(
                 status_code=404,
@@ -364,7 +434,7 @@ async def get_meal_history(
                 )
 
         # Get meals
-        meals = get_user_meals(
+        meals = await get_user_meals(
             db=db,
             user_id=user_id,
             skip=skip,
@@ -425,7 +495,7 @@ async def get_nutrition_statistics(
         None, description="Filter by meal type (breakfast, lunch, dinner, snack)"
     ),
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Thống kê dinh dưỡng của người dùng trong khoảng thời gian
@@ -446,7 +516,7 @@ async def get_nutrition_statistics(
 
     """
     try:
-        user = get_user_by_email(db, current_user_email)
+        user = await get_user_by_email(db, current_user_email)
         if not user:
             raise HTTPException(
                 status_code=404,
@@ -456,7 +526,7 @@ async def get_nutrition_statistics(
         user_id = user.id
 
         # Verify user exists
-        user = get_user_by_id(db, user_id)
+        user = await get_user_by_id(db, user_id)
         if not user:
             raise HTTPException(
                 status_code=404,
@@ -496,7 +566,7 @@ async def get_nutrition_statistics(
                 )
 
         # Get meals in date range
-        meals = get_user_meals_by_date_range(
+        meals = await get_user_meals_by_date_range(
             db=db,
             user_id=user_id,
             start_date=start_dt,
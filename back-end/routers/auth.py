@@ -1,12 +1,12 @@
 from datetime import timedelta
 
 from config import settings
-from database.connection import get_db
-from database.crud import create_user, get_user_by_email
+from database.connection import get_async_db
+from database.async_crud import create_user, get_user_by_email
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from models.user import Token, User, UserCreate, UserLogin
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from utils.auth import (
     create_access_token,
     get_current_user,
@@ -18,10 +18,10 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
 @router.post("/register", response_model=User, status_code=status.HTTP_201_CREATED)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user - only need email and password"""
     # Check if user already exists
-    db_user = get_user_by_email(db, user.email)
+    db_user = await get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -30,16 +30,16 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 
     # Hash password and create user (username auto-generated from email)
     hashed_password = get_password_hash(user.password)
-    new_user = create_user(db, user.email, hashed_password)
+    new_user = await create_user(db, user.email, hashed_password)
 
     return new_user
 
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user"""
     # Get user from database
-    user = get_user_by_email(db, user_credentials.email)
+    user = await get_user_by_email(db, user_credentials.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -66,10 +66,11 @@ async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """OAuth2 compatible token login (for Swagger UI)"""
-    user = get_user_by_email(db, form_data.username)
+    user = await get_user_by_email(db, form_data.username)
     if not user or not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -87,10 +88,11 @@ async def login_for_access_token(
 
 @router.get("/me", response_model=User)
 async def get_me(
-    current_user_email: str = Depends(get_current_user), db: Session = Depends(get_db)
+    current_user_email: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Get current user information"""
-    user = get_user_by_email(db, current_user_email)
+    user = await get_user_by_email(db, current_user_email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
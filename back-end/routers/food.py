@@ -1,7 +1,7 @@
 from typing import List, Optional
 
-from database.connection import get_db
-from database.crud import (
+from database.connection import get_async_db
+from database.async_crud import (
     create_food,
     delete_food,
     get_food_by_id,
@@ -10,7 +10,7 @@ from database.crud import (
 )
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from models.food import Food, FoodCreate, FoodUpdate
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/foods", tags=["Foods"])
 
@@ -40,7 +40,7 @@ async def get_food_list(
     search: Optional[str] = Query(
         None, min_length=1, max_length=100, description="Search by food name"
     ),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get list of foods with optional filters:
@@ -52,7 +52,7 @@ async def get_food_list(
     - **max_complexity**: Filter by maximum complexity level
     - **search**: Search foods by name (case-insensitive)
     """
-    foods = get_foods(
+    foods = await get_foods(
         db=db,
         skip=skip,
         limit=limit,
@@ -65,11 +65,11 @@ async def get_food_list(
 
 
 @router.get("/{food_id}", response_model=Food)
-async def get_food(food_id: int, db: Session = Depends(get_db)):
+async def get_food(food_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get a specific food by ID
     """
-    food = get_food_by_id(db, food_id)
+    food = await get_food_by_id(db, food_id)
     if not food:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -79,12 +79,12 @@ async def get_food(food_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=Food, status_code=status.HTTP_201_CREATED)
-async def create_new_food(food: FoodCreate, db: Session = Depends(get_db)):
+async def create_new_food(food: FoodCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Create a new food item
     """
     try:
-        new_food = create_food(db, food.model_dump())
+        new_food = await create_food(db, food.model_dump())
         return new_food
     except Exception as e:
         raise HTTPException(
@@ -95,7 +95,7 @@ async def create_new_food(food: FoodCreate, db: Session = Depends(get_db)):
 
 @router.put("/{food_id}", response_model=Food)
 async def update_food_item(
-    food_id: int, food_update: FoodUpdate, db: Session = Depends(get_db)
+    food_id: int, food_update: FoodUpdate, db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update a food item
@@ -108,7 +108,7 @@ async def update_food_item(
             detail="No data provided for update",
         )
 
-    updated_food = update_food(db, food_id, update_data)
+    updated_food = await update_food(db, food_id, update_data)
     if not updated_food:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -118,11 +118,11 @@ async def update_food_item(
 
 
 @router.delete("/{food_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_food_item(food_id: int, db: Session = Depends(get_db)):
+async def delete_food_item(food_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Delete a food item
     """
-    success = delete_food(db, food_id)
+    success = await delete_food(db, food_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,10 +1,10 @@
 from typing import Optional
 
-from database.connection import get_db
-from database.crud import create_user_profile, get_user_by_email
+from database.connection import get_async_db
+from database.async_crud import create_user_profile, get_user_by_email
 from fastapi import APIRouter, Depends, HTTPException, status
 from models.user import UserProfile, UserProfileCreate, UserProfileUpdate
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from utils.auth import get_current_user
 
 router = APIRouter(prefix="/profile", tags=["User Profile"])
@@ -46,7 +46,8 @@ def add_computed_fields(user_db) -> dict:
 
 @router.get("/me", response_model=UserProfile)
 async def get_my_profile(
-    current_user_email: str = Depends(get_current_user), db: Session = Depends(get_db)
+    current_user_email: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get current user's profile with computed fields
@@ -55,7 +56,7 @@ async def get_my_profile(
     - All profile information
     - BMI (automatically calculated from weight and height)
     """
-    user = get_user_by_email(db, current_user_email)
+    user = await get_user_by_email(db, current_user_email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -68,7 +69,7 @@ async def get_my_profile(
 async def create_my_profile(
     profile: UserProfileCreate,
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Create/Update user profile
@@ -89,7 +90,7 @@ async def create_my_profile(
     - allergies: Dị ứng thực phẩm
     - activity_level: Mức độ hoạt động (sedentary, light, moderate, active, very_active)
     """
-    user = get_user_by_email(db, current_user_email)
+    user = await get_user_by_email(db, current_user_email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -98,7 +99,7 @@ async def create_my_profile(
     # Convert to dict and remove None values
     profile_data = profile.model_dump(exclude_unset=True)
 
-    updated_user = create_user_profile(db, user.id, profile_data)
+    updated_user = await create_user_profile(db, user.id, profile_data)
     if not updated_user:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -112,7 +113,7 @@ async def create_my_profile(
 async def update_my_profile(
     profile: UserProfileUpdate,
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Update user profile
@@ -133,7 +134,7 @@ async def update_my_profile(
     - allergies: Dị ứng thực phẩm
     - activity_level: Mức độ hoạt động (sedentary, light, moderate, active, very_active)
     """
-    user = get_user_by_email(db, current_user_email)
+    user = await get_user_by_email(db, current_user_email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -147,7 +148,7 @@ async def update_my_profile(
             status_code=status.HTTP_400_BAD_REQUEST, detail="No fields to update"
         )
 
-    updated_user = create_user_profile(db, user.id, profile_data)
+    updated_user = await create_user_profile(db, user.id, profile_data)
     if not updated_user:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -161,14 +162,14 @@ async def update_my_profile(
 async def partial_update_my_profile(
     profile: UserProfileUpdate,
     current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Partially update user profile (same as PUT but semantically more correct)
 
     All fields are optional - only provided fields will be updated.
     """
-    user = get_user_by_email(db, current_user_email)
+    user = await get_user_by_email(db, current_user_email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -182,7 +183,7 @@ async def partial_update_my_profile(
             status_code=status.HTTP_400_BAD_REQUEST, detail="No fields to update"
         )
 
-    updated_user = create_user_profile(db, user.id, profile_data)
+    updated_user = await create_user_profile(db, user.id, profile_data)
     if not updated_user:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,321 @@
+import io
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import redis
+from config import settings
+from database.connection import SessionLocal
+from database.crud import (
+    create_analysis_cache_entry,
+    find_analysis_cache_candidates,
+    get_analysis_cache_entry,
+    touch_analysis_cache_entry,
+)
+from PIL import Image
+from utils.image_hash import (
+    content_hash,
+    hamming_distance,
+    perceptual_hash,
+    phash_bands,
+)
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.redis_client import RedisCache
+
+logger = setup_logger(__name__)
+
+# Gemini tính ~258 token cho mỗi tile ảnh 768x768
+_IMAGE_TILE_TOKENS = 258
+_IMAGE_TILE_SIZE = 768
+
+
+def estimate_analysis_tokens(
+    prompt_chars: int, output_chars: int, image_size: tuple[int, int]
+) -> int:
+    """
+    Ước tính token của một lần gọi VLM (SDK hiện tại không trả usage)
+
+    ~4 ký tự/token cho text + token theo số tile ảnh
+    """
+    width, height = image_size
+    tiles_x = max(1, -(-width // _IMAGE_TILE_SIZE))
+    tiles_y = max(1, -(-height // _IMAGE_TILE_SIZE))
+    tiles = tiles_x * tiles_y
+    return (prompt_chars + output_chars) // 4 + tiles * _IMAGE_TILE_TOKENS
+
+
+def _to_signed64(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+@dataclass
+class ImageKey:
+    content_hash: str
+    phash: int
+    size: tuple[int, int]
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "ImageKey":
+        """CPU-bound (decode JPEG draft) → gọi qua asyncio.to_thread"""
+        return cls(
+            content_hash=content_hash(content),
+            phash=perceptual_hash(content),
+            size=Image.open(io.BytesIO(content)).size,
+        )
+
+    @property
+    def phash_hex(self) -> str:
+        return f"{self.phash:016x}"
+
+
+@dataclass
+class CachedAnalysis:
+    result: Dict[str, Any]
+    component_detection: Optional[Dict[str, Any]]
+    estimated_tokens: int
+    tier: str  # "redis" | "postgres"
+    near_duplicate: bool
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache cho kết quả phân tích ảnh
+    (ComponentDetectionResult + RecognitionWithSafety đã enrich USDA)
+
+    Key = cache_version (hash prompt + model) + SHA-256 của JPEG đã normalize.
+    Ảnh gần trùng (re-encode, crop/nén nhẹ) match qua dHash 64-bit với
+    hamming distance <= ANALYSIS_CACHE_PHASH_DISTANCE.
+
+    Tier:
+    1. Redis (TTL ANALYSIS_CACHE_TTL)
+    2. Postgres (bảng analysis_cache) - hit sẽ backfill Redis
+
+    ⚠️ Blocking I/O (redis sync + SQLAlchemy sync) → gọi qua asyncio.to_thread
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        use_database: bool = True,
+    ):
+        self.redis = redis_client
+        self.use_database = use_database
+        self.ttl = settings.ANALYSIS_CACHE_TTL
+        self.max_distance = settings.ANALYSIS_CACHE_PHASH_DISTANCE
+        self._hits = 0
+        self._misses = 0
+
+    # ===== Redis keys =====
+
+    @staticmethod
+    def _entry_key(version: str, digest: str) -> str:
+        return f"analysis:{version}:sha:{digest}"
+
+    @staticmethod
+    def _phash_key(version: str, phash_hex: str) -> str:
+        return f"analysis:{version}:phash:{phash_hex}"
+
+    @staticmethod
+    def _band_key(version: str, index: int, band: int) -> str:
+        return f"analysis:{version}:band:{index}:{band:04x}"
+
+    # ===== Lookup =====
+
+    def lookup(self, version: str, key: ImageKey) -> Optional[CachedAnalysis]:
+        """Redis → Postgres; exact match trước, near-duplicate sau"""
+        hit = self._lookup_redis(version, key)
+        if hit is None and self.use_database:
+            hit = self._lookup_database(version, key)
+            if hit is not None:
+                self._write_redis(version, key, hit)
+
+        if hit is None:
+            self._misses += 1
+            metrics.incr("analysis_cache.misses")
+            logger.info(f"Analysis cache MISS: {key.content_hash[:12]}")
+        else:
+            self._hits += 1
+            metrics.incr("analysis_cache.hits")
+            metrics.incr(f"analysis_cache.hits.{hit.tier}")
+            if hit.near_duplicate:
+                metrics.incr("analysis_cache.near_duplicate_hits")
+            metrics.incr("analysis_cache.saved_tokens", hit.estimated_tokens)
+            logger.info(
+                f"Analysis cache HIT ({hit.tier}, "
+                f"{'near-duplicate' if hit.near_duplicate else 'exact'}): "
+                f"{key.content_hash[:12]}"
+            )
+        metrics.set_gauge(
+            "analysis_cache.hit_ratio",
+            round(self._hits / (self._hits + self._misses), 4),
+        )
+        return hit
+
+    def _lookup_redis(self, version: str, key: ImageKey) -> Optional[CachedAnalysis]:
+        if self.redis is None:
+            return None
+
+        try:
+            data = self.redis.get(self._entry_key(version, key.content_hash))
+            if data:
+                return self._from_json(data, "redis", near_duplicate=False)
+
+            # Near-duplicate: gom ứng viên từ các band rồi lọc theo hamming
+            band_keys = [
+                self._band_key(version, i, band)
+                for i, band in enumerate(phash_bands(key.phash))
+            ]
+            candidates = self.redis.sunion(band_keys)
+            match = self._closest(key.phash, (int(c, 16) for c in candidates))
+            if match is None:
+                return None
+
+            digest = self.redis.get(self._phash_key(version, f"{match:016x}"))
+            data = digest and self.redis.get(self._entry_key(version, digest))
+            if data:
+                return self._from_json(data, "redis", near_duplicate=True)
+        except redis.RedisError as e:
+            logger.error(f"Analysis cache Redis error: {e}")
+        return None
+
+    def _lookup_database(
+        self, version: str, key: ImageKey
+    ) -> Optional[CachedAnalysis]:
+        db = SessionLocal()
+        try:
+            entry = get_analysis_cache_entry(db, version, key.content_hash)
+            near_duplicate = False
+            if entry is None:
+                candidates = {
+                    _to_unsigned64(c.phash): c
+                    for c in find_analysis_cache_candidates(
+                        db, version, phash_bands(key.phash)
+                    )
+                }
+                match = self._closest(key.phash, candidates)
+                if match is None:
+                    return None
+                entry = candidates[match]
+                near_duplicate = True
+
+            touch_analysis_cache_entry(db, entry.id)
+            return CachedAnalysis(
+                result=entry.result,
+                component_detection=entry.component_detection,
+                estimated_tokens=entry.estimated_tokens,
+                tier="postgres",
+                near_duplicate=near_duplicate,
+            )
+        except Exception as e:
+            logger.error(f"Analysis cache database error: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _closest(self, phash: int, candidates) -> Optional[int]:
+        best, best_distance = None, self.max_distance + 1
+        for candidate in candidates:
+            distance = hamming_distance(phash, candidate)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    # ===== Store =====
+
+    def store(
+        self,
+        version: str,
+        key: ImageKey,
+        result: Dict[str, Any],
+        component_detection: Optional[Dict[str, Any]],
+        estimated_tokens: int,
+    ) -> None:
+        entry = CachedAnalysis(
+            result=result,
+            component_detection=component_detection,
+            estimated_tokens=estimated_tokens,
+            tier="redis",
+            near_duplicate=False,
+        )
+        self._write_redis(version, key, entry)
+
+        if self.use_database:
+            db = SessionLocal()
+            try:
+                create_analysis_cache_entry(
+                    db,
+                    cache_version=version,
+                    content_hash=key.content_hash,
+                    phash=_to_signed64(key.phash),
+                    bands=phash_bands(key.phash),
+                    result=result,
+                    component_detection=component_detection,
+                    estimated_tokens=estimated_tokens,
+                )
+            except Exception as e:
+                logger.error(f"Failed to persist analysis cache entry: {e}")
+            finally:
+                db.close()
+
+        metrics.incr("analysis_cache.stores")
+
+    def _write_redis(self, version: str, key: ImageKey, entry: CachedAnalysis) -> None:
+        if self.redis is None:
+            return
+
+        payload = json.dumps(
+            {
+                "result": entry.result,
+                "component_detection": entry.component_detection,
+                "estimated_tokens": entry.estimated_tokens,
+            },
+            ensure_ascii=False,
+        )
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.setex(self._entry_key(version, key.content_hash), self.ttl, payload)
+            pipe.setex(
+                self._phash_key(version, key.phash_hex), self.ttl, key.content_hash
+            )
+            for i, band in enumerate(phash_bands(key.phash)):
+                band_key = self._band_key(version, i, band)
+                pipe.sadd(band_key, key.phash_hex)
+                pipe.expire(band_key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Failed to cache analysis in Redis: {e}")
+
+    # ===== Helpers =====
+
+    @staticmethod
+    def _from_json(data: str, tier: str, near_duplicate: bool) -> CachedAnalysis:
+        payload = json.loads(data)
+        return CachedAnalysis(
+            result=payload["result"],
+            component_detection=payload.get("component_detection"),
+            estimated_tokens=payload.get("estimated_tokens", 0),
+            tier=tier,
+            near_duplicate=near_duplicate,
+        )
+
+
+# Singleton instance
+_analysis_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """Analysis cache singleton (None nếu ANALYSIS_CACHE_ENABLED=false)"""
+    global _analysis_cache
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+    if _analysis_cache is None:
+        redis_client = None
+        if settings.REDIS_URL and settings.REDIS_ENABLED:
+            redis_client = RedisCache(url=settings.REDIS_URL).client
+        _analysis_cache = AnalysisCache(redis_client=redis_client)
+    return _analysis_cache
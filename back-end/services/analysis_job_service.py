@@ -0,0 +1,360 @@
+import asyncio
+import base64
+import os
+import socket
+import time
+from typing import Any, Dict, Optional
+
+from config import settings
+from database.async_crud import (
+    claim_analysis_job,
+    complete_analysis_job,
+    fail_analysis_job,
+    get_analysis_job_by_meal_id,
+    mark_meal_failed,
+    renew_analysis_job_lease,
+    update_meal_analysis,
+    update_meal_image_url,
+)
+from database.connection import AsyncSessionLocal
+from database.models import AnalysisJobDB, AnalysisJobStatusDB
+from dependencies import get_workflow_service
+from models.factory import ModelFactory
+from services.cloudinary_service import CloudinaryService, get_cloudinary_service
+from services.workflow_service import WorkflowService
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+TERMINAL_JOB_STATUSES = {AnalysisJobStatusDB.SUCCEEDED, AnalysisJobStatusDB.FAILED}
+
+
+async def analyze_and_save_meal(
+    db: AsyncSession,
+    meal_id: int,
+    user_id: int,
+    image_data_uri: str,
+    upload_payload: bytes,
+    workflow_service: WorkflowService,
+    cloudinary_service: CloudinaryService,
+) -> Dict[str, Any]:
+    """
+    Upload Cloudinary (song song) + vision analysis + lưu kết quả
+
+    Dùng chung cho request đồng bộ và analysis worker
+
+    Raises:
+        RuntimeError: Không lưu được kết quả phân tích
+    """
+    cloudinary_task = asyncio.create_task(
+        cloudinary_service.upload_bytes(upload_payload, user_id=user_id, optimize=True)
+    )
+
+    try:
+        analysis_result = await workflow_service.analyze_image(image_data_uri)
+    except BaseException:
+        cloudinary_task.cancel()
+        raise
+
+    analysis_dict = (
+        analysis_result.model_dump()
+        if hasattr(analysis_result, "model_dump")
+        else analysis_result.dict()
+    )
+
+    vlm_model = ModelFactory.create_vlm()
+    model_name = getattr(vlm_model, "model_name", "unknown_model")
+
+    try:
+        upload_result = await cloudinary_task
+        image_url = upload_result.get("secure_url")
+        logger.info(f"✅ Cloudinary upload completed: {image_url}")
+    except Exception as e:
+        logger.error(f"⚠️ Cloudinary upload failed: {e}")
+        # Continue with analysis, use placeholder
+        upload_result = {
+            "secure_url": "upload_failed",
+            "thumbnail_url": None,
+            "public_id": "none",
+            "width": 0,
+            "height": 0,
+            "format": "unknown",
+            "size": 0,
+        }
+        image_url = "upload_failed"
+
+    updated_meal = await update_meal_analysis(
+        db=db,
+        meal_id=meal_id,
+        analysis_data=analysis_dict,
+        model_name=model_name,
+    )
+    if not updated_meal:
+        raise RuntimeError("Failed to save analysis results")
+
+    if image_url and image_url != "upload_failed":
+        await update_meal_image_url(db, meal_id, image_url)
+        logger.info(f"Updated meal {meal_id} with Cloudinary URL")
+
+    logger.info(f"Analysis results saved for meal ID: {meal_id}")
+
+    return {
+        "meal_id": meal_id,
+        "upload": {
+            "url": upload_result["secure_url"],
+            "thumbnail_url": upload_result.get("thumbnail_url"),
+            "public_id": upload_result["public_id"],
+            "width": upload_result["width"],
+            "height": upload_result["height"],
+            "format": upload_result["format"],
+            "size": upload_result["size"],
+        },
+        "analysis": analysis_dict,
+        "nutrition_summary": {
+            "total_calories": round(updated_meal.total_calories, 2),
+            "total_protein": round(updated_meal.total_protein, 2),
+            "total_fat": round(updated_meal.total_fat, 2),
+            "total_carbs": round(updated_meal.total_carbs, 2),
+            "total_fiber": round(updated_meal.total_fiber, 2),
+            "total_sodium": round(updated_meal.total_sodium, 2),
+        },
+    }
+
+
+async def get_job_status(meal_id: int) -> Optional[Dict[str, Any]]:
+    """Trạng thái job hiện tại (None nếu meal không có job)"""
+    async with AsyncSessionLocal() as db:
+        job = await get_analysis_job_by_meal_id(db, meal_id)
+    if not job:
+        return None
+    return {
+        "meal_id": job.meal_id,
+        "user_id": job.user_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.last_error,
+    }
+
+
+async def wait_for_job(
+    meal_id: int, timeout: float, since: Optional[AnalysisJobStatusDB] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Long-poll: chờ tới khi job kết thúc (hoặc đổi khác `since`) hoặc hết timeout
+
+    Poll database nên hoạt động với worker ở bất kỳ process/host nào
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await get_job_status(meal_id)
+        if (
+            job is None
+            or job["status"] in TERMINAL_JOB_STATUSES
+            or (since is not None and job["status"] != since)
+            or time.monotonic() >= deadline
+        ):
+            return job
+        await asyncio.sleep(
+            min(settings.ANALYSIS_JOB_POLL_INTERVAL, deadline - time.monotonic())
+        )
+
+
+class AnalysisJobWorker:
+    """
+    Worker xử lý analysis job từ bảng analysis_jobs (Postgres SKIP LOCKED)
+
+    - concurrency: số job xử lý song song trong process này
+    - Scale ngang: chạy thêm process `python analysis_worker.py`
+      (có thể tắt worker trong API bằng ANALYSIS_WORKER_ENABLED=false)
+    - Crash recovery: job RUNNING không được gia hạn lease sẽ được claim lại,
+      tối đa ANALYSIS_JOB_MAX_ATTEMPTS lần
+    """
+
+    def __init__(
+        self,
+        workflow_service: WorkflowService,
+        cloudinary_service: CloudinaryService,
+        concurrency: int,
+    ):
+        self.workflow_service = workflow_service
+        self.cloudinary_service = cloudinary_service
+        self.concurrency = concurrency
+        self.poll_interval = settings.ANALYSIS_JOB_POLL_INTERVAL
+        self.lease_seconds = settings.ANALYSIS_JOB_LEASE_SECONDS
+        self.max_attempts = settings.ANALYSIS_JOB_MAX_ATTEMPTS
+
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._running = False
+        self._busy = 0
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._tasks = [
+            asyncio.create_task(self._run(f"{self._worker_prefix}:{i}"))
+            for i in range(self.concurrency)
+        ]
+        logger.info(f"Analysis worker started (concurrency={self.concurrency})")
+
+    def notify(self) -> None:
+        """Đánh thức worker ngay khi có job mới (cùng process)"""
+        self._wakeup.set()
+
+    async def stop(self) -> None:
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Analysis worker stopped")
+
+    async def _run(self, worker_id: str) -> None:
+        while self._running:
+            # Clear trước khi claim để không lỡ notify() trong lúc claim
+            self._wakeup.clear()
+            try:
+                job = await self._claim(worker_id)
+            except Exception as e:
+                logger.error(f"Failed to claim analysis job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._busy += 1
+            metrics.set_gauge("analysis_jobs.busy_workers", self._busy)
+            try:
+                await self._process(job, worker_id)
+            finally:
+                self._busy -= 1
+                metrics.set_gauge("analysis_jobs.busy_workers", self._busy)
+
+    async def _claim(self, worker_id: str) -> Optional[AnalysisJobDB]:
+        async with AsyncSessionLocal() as db:
+            job = await claim_analysis_job(
+                db, worker_id, self.lease_seconds, self.max_attempts
+            )
+            if job is not None:
+                # Load hết column trước khi đóng session
+                db.expunge(job)
+            return job
+
+    async def _renew_lease(self, job_id: int, worker_id: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            return await renew_analysis_job_lease(db, job_id, worker_id)
+
+    async def _keep_lease(self, job_id: int, worker_id: str) -> None:
+        """Gia hạn lease định kỳ; return khi mất lease (job đã bị claim lại)"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self._renew_lease(job_id, worker_id)
+            except Exception as e:
+                # Lỗi tạm thời: thử lại lần sau, lease còn hạn
+                logger.warning(f"Failed to renew lease on analysis job {job_id}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Lost lease on analysis job {job_id}")
+                return
+
+    async def _process(self, job: AnalysisJobDB, worker_id: str) -> None:
+        logger.info(
+            f"Processing analysis job {job.id} (meal {job.meal_id}, "
+            f"attempt {job.attempts}) on {worker_id}"
+        )
+        start = time.perf_counter()
+        db = AsyncSessionLocal()
+        work = asyncio.create_task(self._analyze(db, job))
+        lease_task = asyncio.create_task(self._keep_lease(job.id, worker_id))
+        try:
+            # Shutdown cancel _process → finally cancel cả hai task;
+            # job giữ RUNNING, được claim lại khi lease hết hạn
+            await asyncio.wait({work, lease_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not work.done():
+                # Mất lease: worker khác đã claim lại job → dừng ngay, không lưu
+                # kết quả / đổi trạng thái job
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+                metrics.incr("analysis_jobs.lease_lost")
+                return
+
+            error = work.exception()
+            if error is None:
+                if await complete_analysis_job(db, job.id, worker_id):
+                    metrics.incr("analysis_jobs.succeeded")
+                    metrics.observe(
+                        "analysis_jobs.duration", time.perf_counter() - start
+                    )
+                else:
+                    metrics.incr("analysis_jobs.lease_lost")
+                return
+
+            logger.error(f"Analysis job {job.id} failed: {error}")
+            await db.rollback()
+            failed = await fail_analysis_job(
+                db, job.id, worker_id, str(error), self.max_attempts
+            )
+            if failed is None:
+                metrics.incr("analysis_jobs.lease_lost")
+            elif failed.status == AnalysisJobStatusDB.FAILED:
+                await mark_meal_failed(db, job.meal_id, str(error))
+                metrics.incr("analysis_jobs.failed")
+            else:
+                metrics.incr("analysis_jobs.retried")
+        finally:
+            work.cancel()
+            lease_task.cancel()
+            await asyncio.gather(work, lease_task, return_exceptions=True)
+            await db.close()
+
+    async def _analyze(self, db: AsyncSession, job: AnalysisJobDB) -> None:
+        image_data_uri = (
+            f"data:{job.content_type or 'image/jpeg'};base64,"
+            f"{base64.b64encode(job.image_data).decode('utf-8')}"
+        )
+        await analyze_and_save_meal(
+            db=db,
+            meal_id=job.meal_id,
+            user_id=job.user_id,
+            image_data_uri=image_data_uri,
+            upload_payload=job.image_data,
+            workflow_service=self.workflow_service,
+            cloudinary_service=self.cloudinary_service,
+        )
+
+
+# Singleton instance
+_analysis_worker: Optional[AnalysisJobWorker] = None
+
+
+def get_analysis_worker() -> AnalysisJobWorker:
+    global _analysis_worker
+    if _analysis_worker is None:
+        _analysis_worker = AnalysisJobWorker(
+            workflow_service=get_workflow_service(),
+            cloudinary_service=get_cloudinary_service(),
+            concurrency=settings.ANALYSIS_WORKER_CONCURRENCY,
+        )
+    return _analysis_worker
+
+
+def notify_analysis_worker() -> None:
+    """Báo có job mới cho worker trong process này (nếu đang chạy)"""
+    if _analysis_worker is not None:
+        _analysis_worker.notify()
+
+
+async def stop_analysis_worker() -> None:
+    global _analysis_worker
+    if _analysis_worker is not None:
+        await _analysis_worker.stop()
+        _analysis_worker = None
@@ -1,19 +1,42 @@
+import asyncio
+import random
+import time
 import uuid
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 
 import cloudinary
 import cloudinary.api
+import cloudinary.exceptions
 import cloudinary.uploader
+import cloudinary.utils
+import httpx
 from config import settings
 from fastapi import HTTPException, UploadFile
 from utils.logger import setup_logger
+from utils.metrics import metrics
 
 logger = setup_logger(__name__)
 
+# HTTP status nên retry (rate limit + lỗi phía server)
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
 
 class CloudinaryService:
-    def __init__(self):
+    """
+    Async Cloudinary client
+
+    Gọi trực tiếp Cloudinary Upload REST API qua httpx.AsyncClient
+    (SDK `cloudinary.uploader` là synchronous → block event loop).
+    SDK chỉ còn dùng để build params / ký request / build URL.
+
+    - Connection reuse: một AsyncClient dùng chung
+    - Concurrency limit: CLOUDINARY_MAX_CONCURRENCY
+    - Retry với exponential backoff + full jitter: CLOUDINARY_MAX_RETRIES
+    - CLOUDINARY_UPLOAD_PREFIX: trỏ tới local HTTP stand-in khi test
+    """
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         try:
             cloudinary.config(
                 cloud_name=settings.CLOUDINARY_CLOUD_NAME,
@@ -21,29 +44,146 @@ class CloudinaryService:
                 api_secret=settings.CLOUDINARY_API_SECRET,
                 secure=True,
             )
+            if settings.CLOUDINARY_UPLOAD_PREFIX:
+                cloudinary.config(upload_prefix=settings.CLOUDINARY_UPLOAD_PREFIX)
             logger.info("Cloudinary configured successfully")
         except Exception as e:
             logger.error(f"Failed to configure Cloudinary: {e}")
             raise
 
+        self._client = http_client or httpx.AsyncClient(
+            timeout=settings.CLOUDINARY_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.CLOUDINARY_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.CLOUDINARY_MAX_CONCURRENCY,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(settings.CLOUDINARY_MAX_CONCURRENCY)
+        self.max_retries = settings.CLOUDINARY_MAX_RETRIES
+
+    async def _call_api(
+        self,
+        action: str,
+        params: Dict[str, Any],
+        file: Optional[Union[bytes, str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Signed POST tới Upload API (tương đương cloudinary.uploader.call_api)
+
+        Args:
+            action: "upload", "destroy", ...
+            params: Params chưa ký
+            file: Image bytes, hoặc URL string (upload từ URL)
+
+        Raises:
+            cloudinary.exceptions.Error: Cloudinary trả về lỗi / hết retry
+        """
+        signed = cloudinary.utils.sign_request(params, {})
+
+        data: Dict[str, Any] = {}
+        for key, value in signed.items():
+            if isinstance(value, list):
+                data[f"{key}[]"] = value
+            elif value:
+                data[key] = value
+
+        files = None
+        if isinstance(file, str):
+            data["file"] = file
+        elif file is not None:
+            files = {"file": ("file", file, "application/octet-stream")}
+
+        url = cloudinary.utils.cloudinary_api_url(action)
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                start = time.perf_counter()
+                try:
+                    response = await self._client.post(url, data=data, files=files)
+                except httpx.TransportError as e:
+                    if attempt >= self.max_retries:
+                        raise cloudinary.exceptions.Error(f"Network error: {e!r}")
+                    logger.warning(f"Cloudinary {action} network error: {e!r}")
+                else:
+                    metrics.observe(
+                        f"cloudinary.{action}", time.perf_counter() - start
+                    )
+                    if (
+                        response.status_code not in _RETRYABLE_STATUS
+                        or attempt >= self.max_retries
+                    ):
+                        return self._parse_response(response)
+                    logger.warning(
+                        f"Cloudinary {action} returned {response.status_code}"
+                    )
+
+                # Exponential backoff + full jitter
+                metrics.incr("cloudinary.retries")
+                await asyncio.sleep(random.uniform(0, 0.5 * 2**attempt))
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> Dict[str, Any]:
+        try:
+            result = response.json()
+        except Exception as e:
+            raise cloudinary.exceptions.Error(
+                f"Error parsing server response ({response.status_code}) - "
+                f"{response.text[:200]}. Got - {e}"
+            )
+
+        if "error" in result:
+            raise cloudinary.exceptions.Error(result["error"].get("message"))
+
+        return result
+
+    @staticmethod
+    def _build_public_id(user_id: Optional[str]) -> tuple[str, str]:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        unique_id = uuid.uuid4().hex[:8]
+
+        folder_parts = [settings.CLOUDINARY_FOLDER]
+        if user_id:
+            folder_parts.append(f"user_{user_id}")
+
+        folder = "/".join(folder_parts)
+        return folder, f"{folder}/{timestamp}_{unique_id}"
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
     async def upload_image(
         self,
         file: UploadFile,
         user_id: Optional[str] = None,
         optimize: bool = True,
     ) -> Dict[str, Any]:
-        try:
-            if not file.content_type or not file.content_type.startswith("image/"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=(
-                        f"Invalid file type. Expected image/*, "
-                        f"got {file.content_type}"
-                    ),
-                )
+        if not file.content_type or not file.content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Invalid file type. Expected image/*, "
+                    f"got {file.content_type}"
+                ),
+            )
+
+        content = await file.read()
+        return await self.upload_bytes(content, user_id=user_id, optimize=optimize)
+
+    async def upload_bytes(
+        self,
+        content: bytes,
+        user_id: Optional[str] = None,
+        optimize: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Upload ảnh đã có sẵn trong bộ nhớ (vd: JPEG đã optimize từ ImageIngest)
 
-            file_size = 0
-            content = await file.read()
+        Args:
+            content: Image bytes
+            user_id: User ID (dùng làm sub-folder)
+            optimize: Áp dụng Cloudinary quality/format transformation
+        """
+        try:
             file_size = len(content)
 
             if file_size > settings.CLOUDINARY_MAX_FILE_SIZE:
@@ -53,15 +193,7 @@ class CloudinaryService:
                         {settings.CLOUDINARY_MAX_FILE_SIZE / 1024 / 1024}MB",
                 )
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_id = uuid.uuid4().hex[:8]
-
-            folder_parts = [settings.CLOUDINARY_FOLDER]
-            if user_id:
-                folder_parts.append(f"user_{user_id}")
-
-            folder = "/".join(folder_parts)
-            public_id = f"{folder}/{timestamp}_{unique_id}"
+            folder, public_id = self._build_public_id(user_id)
 
             upload_options = {
                 "public_id": public_id,
@@ -78,7 +210,11 @@ class CloudinaryService:
                     {"quality": "auto:good", "fetch_format": "auto"}
                 ]
 
-            result = cloudinary.uploader.upload(content, **upload_options)
+            result = await self._call_api(
+                "upload",
+                cloudinary.utils.build_upload_params(**upload_options),
+                file=content,
+            )
 
             logger.info(f"Upload successful: {result['secure_url']}")
             response = {
@@ -105,24 +241,19 @@ class CloudinaryService:
         self, image_url: str, user_id: Optional[str] = None
     ) -> Dict[str, Any]:
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_id = uuid.uuid4().hex[:8]
-
-            folder_parts = [settings.CLOUDINARY_FOLDER]
-            if user_id:
-                folder_parts.append(f"user_{user_id}")
-
-            folder = "/".join(folder_parts)
-            public_id = f"{folder}/{timestamp}_{unique_id}"
+            folder, public_id = self._build_public_id(user_id)
 
             logger.info(f"Uploading from URL: {image_url}")
 
-            result = cloudinary.uploader.upload(
-                image_url,
-                public_id=public_id,
-                folder=folder,
-                resource_type="image",
-                transformation=[{"quality": "auto:good", "fetch_format": "auto"}],
+            result = await self._call_api(
+                "upload",
+                cloudinary.utils.build_upload_params(
+                    public_id=public_id,
+                    folder=folder,
+                    resource_type="image",
+                    transformation=[{"quality": "auto:good", "fetch_format": "auto"}],
+                ),
+                file=image_url,
             )
 
             logger.info(f"Upload from URL successful: {result['secure_url']}")
@@ -155,7 +286,10 @@ class CloudinaryService:
             True nếu xóa thành công
         """
         try:
-            result = cloudinary.uploader.destroy(public_id)
+            result = await self._call_api(
+                "destroy",
+                {"timestamp": cloudinary.utils.now(), "public_id": public_id},
+            )
 
             if result.get("result") == "ok":
                 logger.info(f"Image deleted: {public_id}")
@@ -221,3 +355,11 @@ def get_cloudinary_service() -> CloudinaryService:
     if _cloudinary_service is None:
         _cloudinary_service = CloudinaryService()
     return _cloudinary_service
+
+
+async def close_cloudinary_service() -> None:
+    """Đóng HTTP client khi shutdown (gọi trong main.lifespan)"""
+    global _cloudinary_service
+    if _cloudinary_service is not None:
+        await _cloudinary_service.close()
+        _cloudinary_service = None
@@ -0,0 +1,150 @@
+"""
+Embedding cho tên món / nguyên liệu → cột pgvector (meal_items,
+nutrition_embeddings)
+
+- GeminiEmbeddingBackend: gemini-embedding-001, nhiều text trong một request
+- HashingEmbeddingBackend: feature hashing n-gram ký tự, không gọi mạng
+  (dev/test, EMBEDDING_PROVIDER=local). Chỉ bắt được giống nhau về chữ,
+  không hiểu nghĩa
+
+Vector trả về luôn chuẩn hoá L2 → cosine distance = 1 - dot
+"""
+
+import asyncio
+import hashlib
+import time
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import google.generativeai as genai
+import numpy as np
+from config import settings
+from database.models import EMBEDDING_DIMENSIONS
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.ttl_cache import TTLCache
+
+logger = setup_logger(__name__)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """'  Gà  Luộc ' → 'gà luộc' (giữ dấu tiếng Việt, NFC)"""
+    return " ".join(unicodedata.normalize("NFC", text or "").lower().split())
+
+
+class GeminiEmbeddingBackend:
+    # Giới hạn batchEmbedContents
+    max_batch_size = 100
+
+    def __init__(self, model: str, api_key: Optional[str], dimensions: int):
+        genai.configure(api_key=api_key)
+        self.model = model
+        self.dimensions = dimensions
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        response = genai.embed_content(
+            model=self.model,
+            content=list(texts),
+            # Tên ↔ tên (đối xứng), không phải query ↔ document dài
+            task_type="SEMANTIC_SIMILARITY",
+            output_dimensionality=self.dimensions,
+        )
+        return response["embedding"]
+
+
+class HashingEmbeddingBackend:
+    """Hash n-gram ký tự (2-4) và từ vào dimensions chiều, có dấu ±"""
+
+    max_batch_size = 1024
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> List[str]:
+        features = [f"w:{word}" for word in text.split()]
+        padded = f" {text} "
+        for n in (2, 3, 4):
+            features.extend(padded[i : i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(normalize_text(text)):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        return vectors.tolist()
+
+
+class EmbeddingService:
+    """
+    Chia batch theo giới hạn backend, chạy backend trong thread (SDK sync),
+    cache embedding của text lặp lại (tên nguyên liệu phổ biến)
+    """
+
+    def __init__(self, backend, batch_size: int = 100, cache_size: int = 2048):
+        self.backend = backend
+        self.batch_size = max(1, min(batch_size, backend.max_batch_size))
+        self.dimensions = backend.dimensions
+        self._cache = TTLCache(cache_size, ttl=86400)
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dimensions) float32, mỗi hàng chuẩn hoá L2"""
+        texts = [normalize_text(text) for text in texts]
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+
+        missing = {}
+        for row, text in enumerate(texts):
+            found, vector = self._cache.get(text)
+            if found:
+                vectors[row] = vector
+            else:
+                missing.setdefault(text, []).append(row)
+
+        pending = list(missing)
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i : i + self.batch_size]
+            start = time.perf_counter()
+            try:
+                embedded = await asyncio.to_thread(self.backend.embed, batch)
+            finally:
+                metrics.observe("embedding.latency", time.perf_counter() - start)
+            metrics.incr("embedding.requests")
+            metrics.incr("embedding.texts", len(batch))
+
+            normalized = _normalize(np.asarray(embedded, dtype=np.float32))
+            for text, vector in zip(batch, normalized):
+                self._cache.set(text, vector)
+                for row in missing[text]:
+                    vectors[row] = vector
+
+        return vectors
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        return (await self.embed([text]))[0]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+@lru_cache
+def get_embedding_service() -> EmbeddingService:
+    if settings.EMBEDDING_PROVIDER == "local":
+        backend = HashingEmbeddingBackend(EMBEDDING_DIMENSIONS)
+    elif settings.EMBEDDING_PROVIDER == "gemini":
+        backend = GeminiEmbeddingBackend(
+            settings.EMBEDDING_MODEL, settings.GOOGLE_API_KEY, EMBEDDING_DIMENSIONS
+        )
+    else:
+        raise ValueError(f"Unknown embedding provider: {settings.EMBEDDING_PROVIDER}")
+
+    logger.info(f"Embedding provider: {settings.EMBEDDING_PROVIDER}")
+    return EmbeddingService(
+        backend,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        cache_size=settings.EMBEDDING_CACHE_SIZE,
+    )
@@ -0,0 +1,193 @@
+"""
+Index embedding tên nguyên liệu → kết quả USDA đã xác minh
+(nutrition_embeddings, ref_type='ingredient')
+
+- USDAService ghi lại mỗi (name_vi, cooking_method) đã resolve được bằng
+  matcher (mapping/mirror/API), gom theo batch trước khi embed + ghi DB
+- Lần sau, tên tiếng Việt gần nghĩa ("thịt heo quay" ~ "thịt lợn quay")
+  resolve bằng ANN search trước khi search text/API
+
+Chỉ kết quả từ matcher mới được index; kết quả tìm ra bằng ANN thì không
+(tránh lan truyền match sai)
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from database import crud
+from database.connection import SessionLocal
+from services.embedding_service import EmbeddingService, normalize_text
+from services.usda_cache import normalize_ingredient
+from services.usda_matcher import MATCHER_VERSION
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.ttl_cache import TTLCache
+
+logger = setup_logger(__name__)
+
+REF_TYPE = "ingredient"
+# Kết quả USDA lưu trong extra_metadata["result"]
+_RESULT_FIELDS = ("fdc_id", "name", "nutrients_per_100g", "data_source", "match_score")
+
+
+def ingredient_text(name: str, cooking_method: Optional[str]) -> str:
+    """Text được embed (và là content trong DB): 'gà luộc (boiled)'"""
+    name = normalize_text(name)
+    cooking = normalize_text(cooking_method)
+    return f"{name} ({cooking})" if cooking else name
+
+
+def cooking_key(cooking_method: Optional[str]) -> str:
+    """Cùng quy ước với usda_cache_key: không có cooking_method ≡ 'raw'"""
+    return normalize_ingredient(cooking_method) or "raw"
+
+
+class IngredientEmbeddingIndex:
+    def __init__(
+        self,
+        embedder: EmbeddingService,
+        max_distance: float = 0.12,
+        candidates: int = 5,
+        ef_search: Optional[int] = None,
+        search_mode: str = "truncated",
+        rerank_factor: int = 4,
+        flush_delay: float = 0.5,
+    ):
+        self.embedder = embedder
+        self.max_distance = max_distance
+        self.candidates = candidates
+        self.ef_search = ef_search
+        self.search_mode = search_mode
+        self.rerank_factor = rerank_factor
+        self.flush_delay = flush_delay
+        # content đã index (hoặc đang chờ) trong process → không embed lại
+        self._seen = TTLCache(8192, ttl=86400)
+        self._pending: List[Dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def lookup(self, name: str, cooking_method: Optional[str]) -> Optional[Dict]:
+        """
+        Kết quả USDA của nguyên liệu đã index gần nhất (cùng cách chế biến,
+        cùng MATCHER_VERSION, cosine distance <= max_distance), None nếu không có
+        """
+        start = time.perf_counter()
+        vector = await self.embedder.embed_one(ingredient_text(name, cooking_method))
+        candidates = await asyncio.to_thread(self._nearest, vector.tolist())
+        metrics.observe("usda.ann.latency", time.perf_counter() - start)
+
+        wanted = cooking_key(cooking_method)
+        for metadata, distance in candidates:
+            if distance > self.max_distance:
+                break
+            if (
+                metadata.get("cooking_method") != wanted
+                or metadata.get("matcher_version") != MATCHER_VERSION
+            ):
+                continue
+            metrics.incr("usda.ann.hits")
+            metrics.observe("usda.ann.distance", distance)
+            return {**metadata["result"], "resolved_by": "embedding"}
+
+        metrics.incr("usda.ann.misses")
+        return None
+
+    def _nearest(self, vector: List[float]) -> List[Tuple[Dict, float]]:
+        db = SessionLocal()
+        try:
+            rows = crud.nearest_nutrition_embeddings(
+                db,
+                REF_TYPE,
+                vector,
+                limit=self.candidates,
+                ef_search=self.ef_search,
+                mode=self.search_mode,
+                rerank_factor=self.rerank_factor,
+            )
+            return [
+                (row.extra_metadata or {}, float(distance)) for row, distance in rows
+            ]
+        finally:
+            db.close()
+
+    def schedule(
+        self,
+        name: str,
+        cooking_method: Optional[str],
+        ingredient_key: str,
+        result: Dict,
+    ) -> None:
+        """Ghi nhận kết quả đã xác minh; embed + ghi DB theo batch (không chờ)"""
+        content = ingredient_text(name, cooking_method)
+        found, _ = self._seen.get(content)
+        if found or not content:
+            return
+        self._seen.set(content, True)
+        self._pending.append(
+            {
+                "content": content,
+                "ingredient_key": ingredient_key,
+                "cooking_method": cooking_key(cooking_method),
+                "result": result,
+            }
+        )
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        # Chờ một chút để các component cùng bữa ăn vào chung một batch
+        await asyncio.sleep(self.flush_delay)
+        docs, self._pending = self._pending, []
+        self._flush_task = None
+        try:
+            await self.add(docs)
+        except Exception as e:
+            metrics.incr("usda.ann.index_errors")
+            logger.warning(f"Ingredient embedding index error: {e}")
+            for doc in docs:
+                self._seen.pop(doc["content"])
+
+    async def add(self, docs: List[Dict]) -> int:
+        """docs: content, ingredient_key, cooking_method (đã chuẩn hoá), result"""
+        if not docs:
+            return 0
+        vectors = await self.embedder.embed([doc["content"] for doc in docs])
+        rows = [
+            {
+                "ref_type": REF_TYPE,
+                "ref_id": doc["result"]["fdc_id"],
+                "content": doc["content"][:512],
+                "vector": vector.tolist(),
+                "extra_metadata": {
+                    "ingredient_key": doc["ingredient_key"],
+                    "cooking_method": doc["cooking_method"],
+                    "matcher_version": MATCHER_VERSION,
+                    "result": {
+                        field: doc["result"].get(field) for field in _RESULT_FIELDS
+                    },
+                },
+            }
+            for doc, vector in zip(docs, vectors)
+        ]
+        await asyncio.to_thread(self._save, rows)
+        metrics.incr("usda.ann.indexed", len(rows))
+        return len(rows)
+
+    @staticmethod
+    def _save(rows: List[Dict]) -> None:
+        db = SessionLocal()
+        try:
+            crud.save_nutrition_embeddings(db, rows)
+        finally:
+            db.close()
+
+    async def close(self) -> None:
+        """Ghi nốt batch đang chờ"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        docs, self._pending = self._pending, []
+        try:
+            await self.add(docs)
+        except Exception as e:
+            logger.warning(f"Ingredient embedding index flush error on close: {e}")
@@ -0,0 +1,109 @@
+import json
+from typing import Dict, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from services.usda_matcher import MATCHER_VERSION, tokenize
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.ttl_cache import TTLCache
+
+logger = setup_logger(__name__)
+
+_NEGATIVE = "null"
+
+
+def normalize_ingredient(text: Optional[str]) -> str:
+    """'  White  Rices ' → 'white rice' (lowercase, bỏ dấu câu, gộp số nhiều)"""
+    return " ".join(tokenize(text))
+
+
+def usda_cache_key(name_en: str, cooking_method: Optional[str]) -> str:
+    """Không có cooking_method ≡ 'raw' (giữ quy ước key cũ)"""
+    method = normalize_ingredient(cooking_method) or "raw"
+    return f"{normalize_ingredient(name_en)}:{method}"
+
+
+class USDALookupCache:
+    """
+    Cache 2 tầng cho kết quả USDA lookup
+
+    - L1: TTL-LRU trong process (vài trăm nguyên liệu phổ biến chiếm phần
+      lớn traffic)
+    - L2: Redis async, dùng chung giữa các worker
+    - Negative caching: "không có kết quả" được cache với TTL ngắn
+      (negative_ttl), lỗi mạng/API thì không cache
+
+    Redis lỗi → log, chỉ dùng L1
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[aioredis.Redis] = None,
+        l1_size: int = 1024,
+        l1_ttl: float = 3600,
+        ttl: int = 604800,
+        negative_ttl: int = 600,
+        prefix: str = f"usda:v3.m{MATCHER_VERSION}:",
+    ):
+        self._redis = redis_client
+        self._l1 = TTLCache(l1_size, l1_ttl)
+        self.l1_ttl = l1_ttl
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.prefix = prefix
+
+    def peek(self, key: str) -> Tuple[bool, Optional[Dict]]:
+        """Chỉ tra L1 (sync, không I/O)"""
+        found, value = self._l1.get(key)
+        if found:
+            metrics.incr("usda.cache.l1_hits")
+        return found, value
+
+    async def get(self, key: str) -> Tuple[bool, Optional[Dict]]:
+        """(found, value) - value None nghĩa là negative entry"""
+        found, value = self.peek(key)
+        if found:
+            return True, value
+
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(self.prefix + key)
+            except redis.RedisError as e:
+                metrics.incr("usda.cache.redis_errors")
+                logger.warning(f"USDA cache Redis get error: {e}")
+                raw = None
+
+            if raw is not None:
+                value = json.loads(raw)
+                self._l1.set(key, value, self._l1_ttl_for(value))
+                metrics.incr("usda.cache.l2_hits")
+                return True, value
+
+        metrics.incr("usda.cache.misses")
+        return False, None
+
+    async def set(self, key: str, value: Optional[Dict]) -> None:
+        self._l1.set(key, value, self._l1_ttl_for(value))
+        if value is None:
+            metrics.incr("usda.cache.negative_stored")
+
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(
+                self.prefix + key,
+                _NEGATIVE if value is None else json.dumps(value, ensure_ascii=False),
+                ex=self.negative_ttl if value is None else self.ttl,
+            )
+        except redis.RedisError as e:
+            metrics.incr("usda.cache.redis_errors")
+            logger.warning(f"USDA cache Redis set error: {e}")
+
+    def _l1_ttl_for(self, value: Optional[Dict]) -> float:
+        return min(self.l1_ttl, self.negative_ttl) if value is None else self.l1_ttl
+
+    async def close(self) -> None:
+        self._l1.clear()
+        if self._redis is not None:
+            await self._redis.aclose()
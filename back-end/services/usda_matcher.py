@@ -0,0 +1,151 @@
+"""
+Chọn food USDA khớp nhất với một nguyên liệu (name_en + cooking_method)
+
+Điểm (0-1) của mỗi candidate:
+- BM25 (tính vector hoá trên cả tập candidate) giữa token đã stem của
+  name_en và description, chuẩn hoá theo điểm của một description "lý tưởng"
+- Trigram word-similarity (như pg_trgm word_similarity): phần trigram của
+  name_en có mặt trong description → chịu được lỗi chính tả / từ ghép
+- Prior: dataType, head noun của description (từ đầu tiên) trùng nguyên
+  liệu, cooking_method xuất hiện, trừ điểm branded
+
+Token + trigram của description được cache (cùng vài nghìn description
+xuất hiện lặp lại giữa các request)
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Tăng khi đổi cách tính điểm → mapping đã lưu (usda_ingredient_map) bị bỏ qua
+MATCHER_VERSION = "1"
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Từ kết thúc bằng "s" nhưng không phải số nhiều
+_SINGULAR_S_SUFFIXES = ("ss", "us", "is")
+_BRAND_MARKERS = ("brand", "®", "™")
+_DATA_TYPE_PRIOR = {"Foundation": 0.10, "SR Legacy": 0.05}
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+_WEIGHT_BM25 = 0.55
+_WEIGHT_TRIGRAM = 0.25
+_HEAD_NOUN_BONUS = 0.10
+_COOKING_BONUS = 0.10
+_BRAND_PENALTY = 0.30
+
+
+def stem(word: str) -> str:
+    """
+    Stem số ít/số nhiều về cùng một dạng (key nội bộ, không cần đúng chính tả)
+
+    berry/berries → berrie, cookie/cookies → cookie, tomato/tomatoes → tomato,
+    peach/peaches → peach, egg/eggs → egg
+    """
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-1]
+    if word.endswith("y") and word[-2] not in "aeiou":
+        return word[:-1] + "ie"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(_SINGULAR_S_SUFFIXES):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase, bỏ dấu câu, stem từng từ"""
+    return [stem(word) for word in _WORD_RE.findall((text or "").lower())]
+
+
+def _trigrams(tokens: Sequence[str]) -> FrozenSet[str]:
+    grams = set()
+    for token in tokens:
+        padded = f"  {token} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+@dataclass(frozen=True)
+class _Document:
+    tokens: Tuple[str, ...]
+    trigrams: FrozenSet[str]
+    branded: bool
+
+
+@lru_cache(maxsize=8192)
+def _document(description: str) -> _Document:
+    tokens = tuple(tokenize(description))
+    lowered = description.lower()
+    return _Document(
+        tokens=tokens,
+        trigrams=_trigrams(tokens),
+        branded=any(marker in lowered for marker in _BRAND_MARKERS),
+    )
+
+
+def score_candidates(
+    foods: Sequence[Dict], name_en: str, cooking_method: Optional[str]
+) -> np.ndarray:
+    """Điểm 0-1 cho từng food (cùng thứ tự), food cần có description + dataType"""
+    if not foods:
+        return np.zeros(0)
+
+    query = list(dict.fromkeys(tokenize(name_en)))
+    cooking = set(tokenize(cooking_method))
+    docs = [_document(food.get("description") or "") for food in foods]
+
+    # BM25: ma trận term frequency (docs × query terms)
+    tf = np.array(
+        [[doc.tokens.count(term) for term in query] for doc in docs], dtype=float
+    ).reshape(len(docs), len(query))
+    lengths = np.array([len(doc.tokens) or 1 for doc in docs], dtype=float)
+    avg_length = lengths.mean()
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5))
+    norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * lengths / avg_length)
+    bm25 = (idf * tf * (_BM25_K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+    # Description lý tưởng: chứa mỗi từ một lần, độ dài trung bình
+    ideal = (idf * (_BM25_K1 + 1) / (1 + _BM25_K1)).sum()
+    bm25_norm = np.clip(bm25 / ideal, 0, 1) if ideal > 0 else np.zeros(len(docs))
+
+    query_grams = _trigrams(query)
+    trigram = np.array(
+        [
+            len(query_grams & doc.trigrams) / len(query_grams) if query_grams else 0.0
+            for doc in docs
+        ]
+    )
+
+    prior = np.array(
+        [
+            _DATA_TYPE_PRIOR.get(food.get("dataType"), 0.0)
+            + (_HEAD_NOUN_BONUS if doc.tokens and doc.tokens[0] in query else 0.0)
+            + (_COOKING_BONUS if cooking and cooking <= set(doc.tokens) else 0.0)
+            - (_BRAND_PENALTY if doc.branded else 0.0)
+            for food, doc in zip(foods, docs)
+        ]
+    )
+
+    return np.clip(_WEIGHT_BM25 * bm25_norm + _WEIGHT_TRIGRAM * trigram + prior, 0, 1)
+
+
+def select_best_match(
+    foods: Sequence[Dict],
+    name_en: str,
+    cooking_method: Optional[str],
+    min_score: float,
+) -> Optional[Tuple[Dict, float]]:
+    """(food, score) tốt nhất nếu đạt min_score; hoà điểm → giữ thứ tự gốc"""
+    scores = score_candidates(foods, name_en, cooking_method)
+    if not len(scores):
+        return None
+    best = int(np.argmax(scores))
+    if scores[best] < min_score:
+        return None
+    return foods[best], round(float(scores[best]), 4)
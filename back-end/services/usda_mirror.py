@@ -0,0 +1,161 @@
+"""
+Đọc bulk dump USDA FoodData Central (Foundation + SR Legacy) → row cho
+bảng usda_foods, nutrient per 100 g tính sẵn
+
+Hỗ trợ:
+- JSON dump: FoodData_Central_foundation_food_json_*.json ("FoundationFoods"),
+  FoodData_Central_sr_legacy_food_json_*.json ("SRLegacyFoods")
+- CSV dump (thư mục giải nén): food.csv, food_nutrient.csv, food_category.csv
+
+https://fdc.nal.usda.gov/download-datasets
+"""
+
+import csv
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from database.crud import upsert_usda_foods
+from sqlalchemy.orm import Session
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DATA_TYPES = ["Foundation", "SR Legacy"]
+
+# data_type trong food.csv → dataType của API/JSON
+_CSV_DATA_TYPES = {"foundation_food": "Foundation", "sr_legacy_food": "SR Legacy"}
+
+_JSON_ROOT_KEYS = ("FoundationFoods", "SRLegacyFoods")
+
+# field → các (nutrient_id, hệ số quy đổi về đơn vị của USDAService) theo thứ tự ưu tiên
+# Energy: ưu tiên kcal (1008), Foundation thường chỉ có Atwater (2047/2048),
+# cuối cùng mới quy đổi từ kJ
+_ENERGY_IDS = ((1008, 1.0), (2047, 1.0), (2048, 1.0), (1062, 1 / 4.184))
+_NUTRIENT_IDS = {
+    "protein": ((1003, 1.0),),
+    "fat": ((1004, 1.0),),
+    "carbs": ((1005, 1.0), (1050, 1.0)),  # by difference, by summation
+    "fiber": ((1079, 1.0),),
+    "sodium": ((1093, 1 / 1000),),  # mg → g
+}
+NUTRIENT_IDS = {
+    nutrient_id
+    for candidates in (_ENERGY_IDS, *_NUTRIENT_IDS.values())
+    for nutrient_id, _ in candidates
+}
+
+
+def precompute_nutrients(amounts: Dict[int, float]) -> Dict[str, float]:
+    """{nutrient_id: amount per 100 g} → 6 nutrient của app"""
+    result = {}
+    for field, candidates in (("calories", _ENERGY_IDS), *_NUTRIENT_IDS.items()):
+        value = 0.0
+        for nutrient_id, factor in candidates:
+            if amounts.get(nutrient_id) is not None:
+                value = round(amounts[nutrient_id] * factor, 4)
+                break
+        result[field] = value
+    return result
+
+
+def _food_row(
+    fdc_id: int,
+    description: str,
+    data_type: str,
+    food_category: Optional[str],
+    amounts: Dict[int, float],
+) -> Dict:
+    return {
+        "fdc_id": fdc_id,
+        "description": description,
+        "data_type": data_type,
+        "food_category": food_category,
+        **precompute_nutrients(amounts),
+    }
+
+
+def read_json_dump(path: Path) -> Iterator[Dict]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    foods = next((data[key] for key in _JSON_ROOT_KEYS if key in data), None)
+    if foods is None:
+        raise ValueError(f"{path}: expected one of {_JSON_ROOT_KEYS}")
+
+    for food in foods:
+        if food.get("dataType") not in DATA_TYPES:
+            continue
+        amounts = {}
+        for item in food.get("foodNutrients", []):
+            nutrient_id = (item.get("nutrient") or {}).get("id")
+            if nutrient_id in NUTRIENT_IDS and item.get("amount") is not None:
+                amounts[nutrient_id] = float(item["amount"])
+        yield _food_row(
+            int(food["fdcId"]),
+            food["description"],
+            food["dataType"],
+            (food.get("foodCategory") or {}).get("description"),
+            amounts,
+        )
+
+
+def read_csv_dump(directory: Path) -> Iterator[Dict]:
+    categories: Dict[str, str] = {}
+    category_file = directory / "food_category.csv"
+    if category_file.exists():
+        with open(category_file, encoding="utf-8", newline="") as f:
+            categories = {row["id"]: row["description"] for row in csv.DictReader(f)}
+
+    foods: Dict[int, Dict] = {}
+    with open(directory / "food.csv", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            data_type = _CSV_DATA_TYPES.get(row["data_type"])
+            if data_type is None:
+                continue
+            foods[int(row["fdc_id"])] = {
+                "description": row["description"],
+                "data_type": data_type,
+                "food_category": categories.get(row.get("food_category_id") or ""),
+                "amounts": {},
+            }
+
+    # food_nutrient.csv của full dump rất lớn → đọc tuần tự, chỉ giữ row cần
+    with open(directory / "food_nutrient.csv", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            food = foods.get(int(row["fdc_id"]))
+            if food is None or not row.get("amount"):
+                continue
+            nutrient_id = int(row["nutrient_id"])
+            if nutrient_id in NUTRIENT_IDS:
+                food["amounts"][nutrient_id] = float(row["amount"])
+
+    for fdc_id, food in foods.items():
+        yield _food_row(
+            fdc_id,
+            food["description"],
+            food["data_type"],
+            food["food_category"],
+            food["amounts"],
+        )
+
+
+def read_dump(path: Path) -> Iterator[Dict]:
+    """File .json hoặc thư mục CSV"""
+    if path.is_dir():
+        return read_csv_dump(path)
+    return read_json_dump(path)
+
+
+def import_dump(db: Session, path: Path, batch_size: int = 1000) -> int:
+    """Upsert toàn bộ dump vào usda_foods theo batch, trả về số food đã nạp"""
+    total = 0
+    batch: List[Dict] = []
+    for row in read_dump(path):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += upsert_usda_foods(db, batch)
+            batch = []
+    total += upsert_usda_foods(db, batch)
+    logger.info(f"USDA mirror: imported {total} foods from {path}")
+    return total
@@ -1,166 +1,539 @@
 import httpx
 import asyncio
-from typing import List, Dict, Optional
-import json
+import random
+import re
+import time
+from typing import List, Dict, Optional, Set
+import redis.asyncio as aioredis
+from database import crud
+from database.connection import SessionLocal
+from services.embedding_service import get_embedding_service
+from services.ingredient_index import IngredientEmbeddingIndex
+from services.usda_cache import USDALookupCache, usda_cache_key
+from services.usda_matcher import MATCHER_VERSION, select_best_match
+from services.usda_mirror import DATA_TYPES, NUTRIENT_IDS, precompute_nutrients
+from utils.circuit_breaker import CircuitBreaker
 from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.rate_limit import TokenBucket
 from config import settings
 from functools import lru_cache
-from utils.redis_client import RedisCache
 
 logger = setup_logger(__name__)
 
+_TERM_RE = re.compile(r"[a-z0-9]+")
+
+
+class USDALookupError(Exception):
+    """Lỗi mạng/API khi tra USDA (không cache, khác với 'không có kết quả')"""
+
+
+class USDAUnavailableError(USDALookupError):
+    """Circuit breaker đang mở / hết token / hết deadline → dùng fallback ngay"""
+
+
+class _RetryableError(USDALookupError):
+    """Timeout, lỗi mạng, 429, 5xx"""
+
+
 class USDAService:
     BASE_URL = "https://api.nal.usda.gov/fdc/v1"
 
-    def __init__(self, api_key: str, redis_client=None):
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[USDALookupCache] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        index: Optional[IngredientEmbeddingIndex] = None,
+    ):
         self.api_key = api_key
-        self.redis = redis_client
-        self.client = httpx.AsyncClient(timeout=15.0)
+        self.cache = cache or USDALookupCache()
+        # ANN theo name_vi (None → không dùng)
+        self.index = index
+        self.client = httpx.AsyncClient(timeout=settings.USDA_REQUEST_TIMEOUT)
+        # Key USDA giới hạn theo giờ → bucket dùng chung cho mọi request
+        self.rate_limiter = rate_limiter or TokenBucket(
+            settings.USDA_RATE_LIMIT_PER_HOUR / 3600,
+            settings.USDA_RATE_LIMIT_BURST,
+            name="usda.rate_limit",
+        )
+        self.breaker = breaker or CircuitBreaker(
+            "usda",
+            failure_threshold=settings.USDA_BREAKER_FAILURES,
+            reset_timeout=settings.USDA_BREAKER_RESET_SECONDS,
+        )
+        self._semaphore = asyncio.Semaphore(settings.USDA_MAX_CONCURRENCY)
+        # Lookup đang chạy theo cache key → request trùng dùng chung một fetch
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._prefetch_tasks: Set[asyncio.Task] = set()
+
+    def prefetch(
+        self,
+        name_en: str,
+        cooking_method: Optional[str] = None,
+        name_vi: Optional[str] = None,
+    ) -> bool:
+        """
+        Bắt đầu lookup ngay (không chờ). search_ingredient cùng nguyên liệu
+        sau đó dùng chung request đang chạy hoặc kết quả đã vào cache
+
+        Returns:
+            False nếu đã có trong L1 hoặc đang được tra
+        """
+        key = usda_cache_key(name_en, cooking_method)
+        found, _ = self.cache.peek(key)
+        if found or key in self._inflight:
+            return False
+
+        deadline = time.monotonic() + settings.USDA_BATCH_BUDGET
+        task = self._start_lookup(key, name_en, cooking_method, deadline, name_vi)
+        self._prefetch_tasks.add(task)
+        task.add_done_callback(self._prefetch_tasks.discard)
+        metrics.incr("usda.prefetch.dispatched")
+        return True
 
     async def search_ingredient(
         self,
         name_en: str,
-        cooking_method: Optional[str] = None
+        cooking_method: Optional[str] = None,
+        deadline: Optional[float] = None,
+        name_vi: Optional[str] = None,
     ) -> Optional[Dict]:
-        """Search USDA database with Redis caching"""
-
-        # Build cache key
-        cache_key = f"usda:{name_en}:{cooking_method or 'raw'}"
+        """
+        Search USDA: L1 → (coalesce) → Redis → usda_ingredient_map →
+        ANN theo name_vi → mirror local / API
+
+        Key được chuẩn hoá (hoa/thường, khoảng trắng, số nhiều) nên
+        "White Rices" và "white rice" dùng chung cache
+
+        deadline: time.monotonic() tuyệt đối, mặc định now + USDA_BATCH_BUDGET
+        """
+        key = usda_cache_key(name_en, cooking_method)
+        found, value = self.cache.peek(key)
+        if not found:
+            task = self._inflight.get(key)
+            if task is None:
+                if deadline is None:
+                    deadline = time.monotonic() + settings.USDA_BATCH_BUDGET
+                task = self._start_lookup(
+                    key, name_en, cooking_method, deadline, name_vi
+                )
+            else:
+                metrics.incr("usda.cache.coalesced")
+
+            # shield: caller bị cancel không huỷ fetch dùng chung
+            value = await asyncio.shield(task)
+
+        # name_vi mới của nguyên liệu đã resolve bằng matcher → index cho ANN
+        if (
+            self.index is not None
+            and name_vi
+            and value is not None
+            and value.get("resolved_by") != "embedding"
+        ):
+            self.index.schedule(name_vi, cooking_method, key, value)
+        return value
+
+    def _start_lookup(
+        self,
+        key: str,
+        name_en: str,
+        cooking_method: Optional[str],
+        deadline: float,
+        name_vi: Optional[str] = None,
+    ) -> asyncio.Task:
+        task = asyncio.create_task(
+            self._lookup(key, name_en, cooking_method, deadline, name_vi)
+        )
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _lookup(
+        self,
+        key: str,
+        name_en: str,
+        cooking_method: Optional[str],
+        deadline: float,
+        name_vi: Optional[str] = None,
+    ) -> Optional[Dict]:
+        found, value = await self.cache.get(key)
+        if found:
+            return value
+
+        # Nguyên liệu đã resolve trước đây → bỏ qua search
+        if settings.USDA_INGREDIENT_MAP_ENABLED:
+            mapped = await self._load_mapping(key)
+            if mapped is not None:
+                await self.cache.set(key, mapped)
+                return mapped
+
+        # Tên tiếng Việt gần với nguyên liệu đã xác minh → bỏ qua search.
+        # Chỉ cache (không lưu mapping) để match ANN không thành "đã xác minh"
+        if self.index is not None and name_vi:
+            similar = await self._search_similar(name_vi, cooking_method, deadline)
+            if similar is not None:
+                await self.cache.set(key, similar)
+                return similar
 
-        # ✅ FIXED: Check redis exists and has get method
-        if self.redis and hasattr(self.redis, 'get'):
-            cached = self.redis.get(cache_key)
-            if cached:
-                logger.info(f"✅ USDA Cache HIT: {name_en}")
-                import json
-                return json.loads(cached)
+        try:
+            result = await self._search_ingredient(name_en, cooking_method, deadline)
+        except USDAUnavailableError as e:
+            # Node dùng ước tính của Gemini cho component này
+            metrics.incr("usda.api.unavailable")
+            logger.warning(f"USDA unavailable for '{name_en}': {e}")
+            return None
+        except USDALookupError as e:
+            logger.error(f"USDA search error for '{name_en}': {e}")
+            return None
 
-        # Search USDA API
-        query = f"{name_en} {cooking_method}" if cooking_method else name_en
+        # None (không có match) cũng được cache với TTL ngắn, nhưng không lưu
+        # vào mapping (có thể có match khi mirror/matcher cập nhật)
+        await self.cache.set(key, result)
+        if result is not None and settings.USDA_INGREDIENT_MAP_ENABLED:
+            await self._save_mapping(key, name_en, cooking_method, result)
+        return result
 
+    async def _search_similar(
+        self, name_vi: str, cooking_method: Optional[str], deadline: float
+    ) -> Optional[Dict]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
         try:
-            response = await self.client.get(
-                f"{self.BASE_URL}/foods/search",
-                params={
-                    "api_key": self.api_key,
-                    "query": query,
-                    "dataType": ["Foundation", "SR Legacy"],
-                    "pageSize": 10
-                }
+            return await asyncio.wait_for(
+                self.index.lookup(name_vi, cooking_method),
+                timeout=min(remaining, settings.EMBEDDING_LOOKUP_TIMEOUT),
             )
+        except Exception as e:
+            metrics.incr("usda.ann.errors")
+            logger.warning(f"USDA ANN lookup error for '{name_vi}': {e!r}")
+            return None
 
-            if response.status_code != 200:
-                logger.error(f"USDA API error {response.status_code}: {response.text}")
-                return None
-
-            data = response.json()
-            foods = data.get("foods", [])
-
-            if not foods:
-                logger.warning(f"No USDA results for: {query}")
-                return None
-
-            # Select best match
-            best_food = self._select_best_match(foods, name_en, cooking_method)
-
-            if not best_food:
-                return None
-
-            # Parse nutrients
-            result = self._parse_food_nutrients(best_food)
-
-            # ✅ FIXED: Cache result if redis exists
-            if result and self.redis and hasattr(self.redis, 'setex'):
-                import json
-                self.redis.setex(
-                    cache_key,
-                    604800,  # 7 days
-                    json.dumps(result, ensure_ascii=False)
-                )
+    async def _load_mapping(self, key: str) -> Optional[Dict]:
+        try:
+            result = await asyncio.to_thread(self._get_mapping, key)
+        except Exception as e:
+            metrics.incr("usda.map.errors")
+            logger.warning(f"USDA ingredient map read error for '{key}': {e}")
+            return None
 
-            return result
+        metrics.incr("usda.map.hits" if result is not None else "usda.map.misses")
+        return result
 
+    async def _save_mapping(
+        self, key: str, name_en: str, cooking_method: Optional[str], result: Dict
+    ) -> None:
+        try:
+            await asyncio.to_thread(
+                self._put_mapping, key, name_en, cooking_method, result
+            )
         except Exception as e:
-            logger.error(f"USDA search error for '{query}': {e}")
-            return None
+            metrics.incr("usda.map.errors")
+            logger.warning(f"USDA ingredient map write error for '{key}': {e}")
+            return
+        metrics.incr("usda.map.stored")
+
+    @staticmethod
+    def _get_mapping(key: str) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            row = crud.get_usda_ingredient_mapping(db, key, MATCHER_VERSION)
+            if row is None:
+                return None
+            return {
+                "fdc_id": row.fdc_id,
+                "name": row.description,
+                "nutrients_per_100g": row.nutrients,
+                "data_source": row.data_type,
+                "match_score": row.match_score,
+            }
+        finally:
+            db.close()
+
+    @staticmethod
+    def _put_mapping(
+        key: str, name_en: str, cooking_method: Optional[str], result: Dict
+    ) -> None:
+        db = SessionLocal()
+        try:
+            crud.save_usda_ingredient_mapping(
+                db,
+                {
+                    "ingredient_key": key,
+                    "name_en": name_en[:255],
+                    "cooking_method": cooking_method[:100] if cooking_method else None,
+                    "fdc_id": result["fdc_id"],
+                    "description": result["name"],
+                    "data_type": result["data_source"],
+                    "match_score": result["match_score"],
+                    "nutrients": result["nutrients_per_100g"],
+                    "matcher_version": MATCHER_VERSION,
+                },
+            )
+        finally:
+            db.close()
 
-    def _select_best_match(
+    async def _search_ingredient(
         self,
-        foods: List[Dict],
         name_en: str,
-        cooking_method: Optional[str]
+        cooking_method: Optional[str] = None,
+        deadline: Optional[float] = None,
     ) -> Optional[Dict]:
-        scored = []
-        for food in foods:
-            score = 0.0
-            desc = food.get("description", "").lower()
-
-            if food.get("dataType") == "Foundation":
-                score += 0.40
-            elif food.get("dataType") == "SR Legacy":
-                score += 0.30
-
-            if cooking_method and cooking_method.lower() in desc:
-                score += 0.20
-
-            if any(b in desc for b in ["brand", "®", "™"]):
-                score -= 0.30
-
-            if name_en.lower() in desc:
-                score += 0.10
+        """
+        Tra mirror local rồi API
+
+        Returns:
+            None nếu không có match
+        Raises:
+            USDALookupError: lỗi mạng/API (caller không cache)
+        """
+        query = f"{name_en} {cooking_method}" if cooking_method else name_en
 
-            scored.append((score, food))
+        # Mirror local (Postgres full-text + trigram), API chỉ là fallback
+        if settings.USDA_LOCAL_MIRROR:
+            try:
+                result = await self._search_local(query, name_en, cooking_method)
+            except Exception as e:
+                metrics.incr("usda.local.errors")
+                logger.warning(f"USDA local mirror error for '{query}': {e}")
+                if not settings.USDA_API_FALLBACK:
+                    raise USDALookupError(str(e)) from e
+            else:
+                if result is not None or not settings.USDA_API_FALLBACK:
+                    return result
 
-        scored.sort(key=lambda x: x[0], reverse=True)
+        # Search USDA API
+        response = await self._call_api(
+            {
+                "api_key": self.api_key,
+                "query": query,
+                "dataType": DATA_TYPES,
+                "pageSize": 10
+            },
+            deadline or time.monotonic() + settings.USDA_BATCH_BUDGET,
+        )
+
+        data = response.json()
+        foods = data.get("foods", [])
+
+        if not foods:
+            logger.warning(f"No USDA results for: {query}")
+            return None
 
-        if scored and scored[0][0] > 0.3:
-            best_score, best_food = scored[0]
-            best_food["match_score"] = best_score
-            return best_food
+        match = select_best_match(
+            foods, name_en, cooking_method, settings.USDA_MATCH_MIN_SCORE
+        )
+        if match is None:
+            return None
 
-        return None
+        best_food, score = match
+        return self._parse_food_nutrients(best_food, score)
+
+    async def _call_api(self, params: Dict, deadline: float) -> httpx.Response:
+        """
+        GET /foods/search với: circuit breaker → token bucket → semaphore →
+        hedged request, retry (backoff + jitter) cho lỗi tạm thời khi còn
+        thời gian trước deadline
+        """
+        last_error: Optional[USDALookupError] = None
+        for attempt in range(settings.USDA_MAX_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                raise USDAUnavailableError("circuit open")
+            try:
+                if not await self.rate_limiter.acquire(timeout=remaining):
+                    raise USDAUnavailableError("rate limited")
+                await asyncio.wait_for(self._semaphore.acquire(), remaining)
+                try:
+                    response = await self._hedged_get(params, deadline)
+                finally:
+                    self._semaphore.release()
+            except _RetryableError as e:
+                self.breaker.record_failure()
+                last_error = e
+                backoff = min(2.0, 0.2 * 2**attempt) * (0.5 + random.random())
+                if (
+                    attempt == settings.USDA_MAX_RETRIES
+                    or time.monotonic() + backoff >= deadline
+                ):
+                    break
+                metrics.incr("usda.api.retries")
+                await asyncio.sleep(backoff)
+                continue
+            except asyncio.TimeoutError:
+                self.breaker.release()
+                raise USDAUnavailableError("deadline exceeded waiting for a slot")
+            except BaseException:
+                self.breaker.release()
+                raise
+
+            self.breaker.record_success()
+            if response.status_code != 200:
+                raise USDALookupError(
+                    f"USDA API error {response.status_code}: {response.text}"
+                )
+            return response
+
+        raise last_error or USDAUnavailableError("deadline exceeded")
+
+    async def _hedged_get(self, params: Dict, deadline: float) -> httpx.Response:
+        """
+        Request chậm hơn USDA_HEDGE_AFTER giây → gửi thêm một bản (nếu còn
+        token ngay), lấy kết quả về trước, huỷ bản còn lại
+        """
+        primary = asyncio.create_task(self._get(params, deadline))
+        pending = {primary}
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                wait = (
+                    remaining if hedged else min(settings.USDA_HEDGE_AFTER, remaining)
+                )
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, wait), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            metrics.incr("usda.api.hedge_wins")
+                        return task.result()
+                    last_error = task.exception()
+
+                if done or hedged:
+                    continue
+                if time.monotonic() >= deadline:
+                    break
+                if await self.rate_limiter.try_acquire():
+                    hedged = True
+                    metrics.incr("usda.api.hedged")
+                    pending.add(asyncio.create_task(self._get(params, deadline)))
+                else:
+                    hedged = True  # hết token → không hedge, chờ request đầu
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if isinstance(last_error, USDALookupError):
+            raise last_error
+        raise _RetryableError("deadline exceeded")
+
+    async def _get(self, params: Dict, deadline: float) -> httpx.Response:
+        timeout = min(settings.USDA_REQUEST_TIMEOUT, deadline - time.monotonic())
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self.client.get(f"{self.BASE_URL}/foods/search", params=params),
+                max(0.0, timeout),
+            )
+        except asyncio.TimeoutError as e:
+            raise _RetryableError(f"timeout after {timeout:.1f}s") from e
+        except httpx.HTTPError as e:
+            raise _RetryableError(f"{type(e).__name__}: {e}") from e
+        finally:
+            metrics.observe("usda.api.latency", time.perf_counter() - start)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise _RetryableError(f"USDA API error {response.status_code}")
+        return response
+
+    async def _search_local(
+        self, query: str, name_en: str, cooking_method: Optional[str]
+    ) -> Optional[Dict]:
+        """Tra bảng usda_foods, cùng tiêu chí chọn match với kết quả API"""
+        start = time.perf_counter()
+        try:
+            foods = await asyncio.to_thread(self._query_local, query, name_en)
+        finally:
+            metrics.observe("usda.local.query", time.perf_counter() - start)
+
+        match = select_best_match(
+            foods, name_en, cooking_method, settings.USDA_MATCH_MIN_SCORE
+        )
+        if match is None:
+            metrics.incr("usda.local.misses")
+            return None
 
-    def _parse_food_nutrients(self, food: Dict) -> Dict:
-        """Extract nutrition per 100g"""
-        nutrients_map = {
-            "Energy": "calories",
-            "Protein": "protein",
-            "Carbohydrate, by difference": "carbs",
-            "Total lipid (fat)": "fat",
-            "Fiber, total dietary": "fiber",
-            "Sodium, Na": "sodium"
+        metrics.incr("usda.local.hits")
+        best_food, score = match
+        return {
+            "fdc_id": best_food["fdcId"],
+            "name": best_food["description"],
+            "nutrients_per_100g": best_food["nutrients_per_100g"],
+            "data_source": best_food["dataType"],
+            "match_score": score,
         }
-        nutrients = {}
 
+    @staticmethod
+    def _query_local(query: str, name_en: str) -> List[Dict]:
+        """Row usda_foods → dict cùng dạng food API (fdcId, description, dataType)"""
+        db = SessionLocal()
+        try:
+            rows = crud.search_usda_foods(
+                db, _TERM_RE.findall(query.lower()), name_en.lower(), DATA_TYPES
+            )
+            return [
+                {
+                    "fdcId": row.fdc_id,
+                    "description": row.description,
+                    "dataType": row.data_type,
+                    "nutrients_per_100g": {
+                        "calories": row.calories,
+                        "protein": row.protein,
+                        "carbs": row.carbs,
+                        "fat": row.fat,
+                        "fiber": row.fiber,
+                        "sodium": row.sodium,
+                    },
+                }
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _parse_food_nutrients(food: Dict, score: float) -> Dict:
+        """
+        Nutrition per 100g theo nutrient id (không so khớp tên nutrient),
+        cùng bảng quy đổi với mirror local
+        """
+        amounts = {}
         for nutrient in food.get("foodNutrients", []):
-            nutrient_name = nutrient.get("nutrientName", "")
-            value = nutrient.get("value", 0)
-            unit = nutrient.get("unitName", "")
-
-            for usda_name, our_name in nutrients_map.items():
-                if usda_name in nutrient_name:
-                    if our_name == "calories" and unit.upper() == "KCAL":
-                        nutrients[our_name] = value
-                    elif unit.upper() in ["G", "MG"]:
-                        nutrients[our_name] = value if unit.upper() == "G" else value / 1000
-                    break
-
-        for key in ["calories", "protein", "carbs", "fat", "fiber", "sodium"]:
-            if key not in nutrients:
-                nutrients[key] = 0
+            nutrient_id = nutrient.get("nutrientId")
+            value = nutrient.get("value")
+            if nutrient_id in NUTRIENT_IDS and value is not None:
+                amounts[nutrient_id] = value
 
         return {
             "fdc_id": food.get("fdcId"),
             "name": food.get("description"),
-            "nutrients_per_100g": nutrients,
+            "nutrients_per_100g": precompute_nutrients(amounts),
             "data_source": food.get("dataType"),
-            "match_score": food.get("match_score", 0)
+            "match_score": score,
         }
 
-    async def batch_search(self, components: List[Dict]) -> List[Dict]:
-        """Parallel search for multiple components"""
+    async def batch_search(
+        self, components: List[Dict], budget: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        Parallel search for multiple components
+
+        budget: tổng thời gian cho cả batch (mặc định USDA_BATCH_BUDGET), mọi
+        lookup dùng chung deadline → component chậm không giữ cả request
+        """
+        deadline = time.monotonic() + (budget or settings.USDA_BATCH_BUDGET)
         tasks = [
-            self.search_ingredient(comp["name_en"], comp.get("cooking_method"))
+            self.search_ingredient(
+                comp["name_en"],
+                comp.get("cooking_method"),
+                deadline,
+                comp.get("name_vi"),
+            )
             for comp in components
         ]
 
@@ -177,17 +550,55 @@ class USDAService:
         return valid
 
     async def close(self):
+        for task in list(self._prefetch_tasks):
+            task.cancel()
+        if self.index is not None:
+            await self.index.close()
+        await self.cache.close()
         await self.client.aclose()
 
+
 @lru_cache
 def get_usda_service() -> USDAService:
     """Factory for FastAPI Depends"""
-    from utils.redis_client import RedisCache
-    from dependencies import get_checkpointer
-
-    redis_cache = RedisCache()
+    redis_client = None
+    if settings.REDIS_ENABLED and settings.REDIS_URL:
+        redis_client = aioredis.from_url(
+            settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2
+        )
 
     return USDAService(
         api_key=settings.USDA_API_KEY,
-        redis_client=redis_cache  # ✅ Pass RedisCache instance
+        rate_limiter=TokenBucket(
+            settings.USDA_RATE_LIMIT_PER_HOUR / 3600,
+            settings.USDA_RATE_LIMIT_BURST,
+            # Bucket chung giữa các worker (cùng một API key)
+            redis_client=redis_client if settings.USDA_RATE_LIMIT_DISTRIBUTED else None,
+            key="ratelimit:usda",
+            name="usda.rate_limit",
+        ),
+        cache=USDALookupCache(
+            redis_client,
+            l1_size=settings.USDA_CACHE_L1_SIZE,
+            l1_ttl=settings.USDA_CACHE_L1_TTL,
+            ttl=settings.USDA_CACHE_TTL,
+            negative_ttl=settings.USDA_NEGATIVE_CACHE_TTL,
+        ),
+        index=(
+            IngredientEmbeddingIndex(
+                get_embedding_service(),
+                max_distance=settings.EMBEDDING_MATCH_MAX_DISTANCE,
+                ef_search=settings.EMBEDDING_HNSW_EF_SEARCH,
+                search_mode=settings.EMBEDDING_SEARCH_MODE,
+                rerank_factor=settings.EMBEDDING_RERANK_FACTOR,
+            )
+            if settings.EMBEDDING_LOOKUP_ENABLED
+            else None
+        ),
     )
+
+
+async def close_usda_service() -> None:
+    if get_usda_service.cache_info().currsize:
+        await get_usda_service().close()
+        get_usda_service.cache_clear()
@@ -256,39 +256,92 @@
 #     return _service_instance
 
 import asyncio
-from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Dict
+import base64
+import hashlib
+import time
+from typing import Any, AsyncIterator, Dict, Optional
 
+from config import settings
 from database.checkpointer import get_async_checkpointer
 from langchain_core.messages import AIMessage, HumanMessage
 from langgraph_flow.graph import build_workflow
-from langgraph_flow.nodes import vision_node, vision_node_v2, nutrition_lookup_node
+from langgraph_flow.nodes import (
+    nutrition_lookup_node,
+    vision_node,
+    vision_node_v2,
+)
 from langgraph_flow.state import GraphState
 from models.factory import ModelFactory
 from prompt.image_advisor_prompt import get_image_advisor_prompt
+from prompt.registry import (
+    COMPONENT_DETECTION,
+    IMAGE_ADVISOR,
+    TEXT_ADVISOR,
+    prompt_registry,
+)
 from prompt.text_advisor_prompt import get_text_advisor_prompt
 from schema.recognition_food import RecognitionWithSafety
 from schema.food_components import ComponentDetectionResult
+from services.analysis_cache_service import (
+    ImageKey,
+    estimate_analysis_tokens,
+    get_analysis_cache,
+)
 from services.user_service import UserProfileService
 from utils.logger import setup_logger
+from utils.metrics import metrics
 from utils.redis_client import RedisCache
+from utils.thread_locks import get_thread_lock_manager
 
 logger = setup_logger(__name__)
 
+# Node sinh câu trả lời cho user → forward token qua SSE
+_ADVISOR_NODES = {"image_advisor", "text_advisor"}
+
 
 class WorkflowService:
     def __init__(self):
         self._workflow = build_workflow()
         self._compiled_graph = None
         self.reasoning_model = ModelFactory.create_llm()
-        self._locks = {}
+        self._locks = get_thread_lock_manager()
+        self._analysis_cache = get_analysis_cache()
+        self._analysis_cache_version: Optional[str] = None
+        self._vision_prompt_chars = 0
+
+    def _get_analysis_cache_version(self) -> str:
+        """Hash của prompt + VLM model: đổi prompt/model → cache cũ tự vô hiệu"""
+        if self._analysis_cache_version is None:
+            rendered = prompt_registry.get(COMPONENT_DETECTION)
+            vlm = ModelFactory.create_vlm()
+            raw = "|".join(
+                [
+                    settings.ANALYSIS_CACHE_VERSION,
+                    vlm._llm_type,
+                    getattr(vlm, "model_name", ""),
+                    rendered.version_hash,
+                ]
+            )
+            self._analysis_cache_version = hashlib.sha256(
+                raw.encode("utf-8")
+            ).hexdigest()[:16]
+            self._vision_prompt_chars = len(rendered.text)
+        return self._analysis_cache_version
+
+    async def _get_image_cache_key(self, img_url: str) -> Optional[ImageKey]:
+        """ImageKey cho base64 data URI; URL ảnh → không cache"""
+        if self._analysis_cache is None or not img_url.startswith("data:image"):
+            return None
+        try:
+            content = base64.b64decode(img_url.split(",", 1)[1])
+            return await asyncio.to_thread(ImageKey.from_bytes, content)
+        except Exception as e:
+            logger.warning(f"Cannot hash image for analysis cache: {e}")
+            return None
 
-    @asynccontextmanager
-    async def _thread_lock(self, thread_id: str):
-        if thread_id not in self._locks:
-            self._locks[thread_id] = asyncio.Lock()
-        async with self._locks[thread_id]:
-            yield
+    def _thread_lock(self, thread_id: str):
+        """Lock theo thread_id (refcounted, Redis nếu THREAD_LOCK_DISTRIBUTED)"""
+        return self._locks.hold(thread_id)
 
     async def _get_graph(self):
         if self._compiled_graph is None:
@@ -303,6 +356,48 @@ class WorkflowService:
                 self._compiled_graph = self._workflow.compile(checkpointer=checkpointer)
         return self._compiled_graph
 
+    async def warm_up(self, call_models: bool = False) -> None:
+        """
+        Startup: compile graph + checkpointer, render prompt/format instructions,
+        tạo sẵn VLM/LLM → request đầu tiên sau deploy không phải trả chi phí này
+
+        call_models=True: gửi thêm một request nhỏ (stub) tới model để mở
+        sẵn kết nối gRPC/HTTP. Lỗi chỉ log, không chặn startup
+        """
+        with metrics.timer("startup.warm_up"):
+            vlm = ModelFactory.create_vlm()
+            llm = ModelFactory.create_llm()
+
+            prompt_hashes = prompt_registry.warm_up()
+            logger.info(f"Prompts rendered: {prompt_hashes}")
+            self._get_analysis_cache_version()
+
+            await self._get_graph()
+
+            # Explicit context cache (Gemini) tạo ở đây, không trên request path
+            for model, names in (
+                (vlm, [COMPONENT_DETECTION]),
+                (llm, [IMAGE_ADVISOR, TEXT_ADVISOR]),
+            ):
+                prepare = getattr(model, "prepare_context_cache", None)
+                if prepare is not None:
+                    for name in names:
+                        await prepare(prompt_registry.get(name).context_cache)
+
+            if call_models:
+                for model in {id(vlm): vlm, id(llm): llm}.values():
+                    try:
+                        await asyncio.wait_for(
+                            model.ainvoke([HumanMessage(content="ping")]),
+                            settings.MODEL_WARMUP_TIMEOUT,
+                        )
+                    except Exception as e:
+                        logger.warning(
+                            f"Model warm-up call failed ({model._llm_type}): {e}"
+                        )
+
+        logger.info("✅ Workflow warmed up")
+
     async def process_request_stream(
         self,
         thread_id: str,
@@ -312,7 +407,11 @@ class WorkflowService:
     ) -> AsyncIterator[Dict[str, Any]]:
         """
         ✅ FIXED: Handle V2 workflow with proper variable mapping
+
+        stream_mode=["updates", "messages"]: progress theo node + token LLM
+        của advisor được forward ngay khi model sinh ra (metric advice.ttft)
         """
+        started_at = time.perf_counter()
         async with self._thread_lock(thread_id):
             try:
                 graph = await self._get_graph()
@@ -328,6 +427,7 @@ class WorkflowService:
                     "enriched_components": None,
                     "nutrition_totals": None,
                     "data_quality": None,
+                    "profile_context": None,
                     "vision_result": None,
                     "error": None,
                 }
@@ -340,12 +440,34 @@ class WorkflowService:
 
                 # Track state for advisor
                 final_state = None
+                advisor_started = False
                 vision_emitted = False
                 nutrition_emitted = False
 
-                async for event in graph.astream(
-                    initial_state, config, stream_mode="updates"
+                async for mode, event in graph.astream(
+                    initial_state, config, stream_mode=["updates", "messages"]
                 ):
+                    # Token LLM thật từ advisor node (stream_mode="messages")
+                    if mode == "messages":
+                        chunk, metadata = event
+                        if (
+                            metadata.get("langgraph_node") not in _ADVISOR_NODES
+                            or not isinstance(chunk, AIMessage)
+                            or not isinstance(chunk.content, str)
+                            or not chunk.content
+                        ):
+                            continue
+
+                        if not advisor_started:
+                            advisor_started = True
+                            metrics.observe(
+                                "advice.ttft", time.perf_counter() - started_at
+                            )
+                            yield {"type": "advisor_start"}
+
+                        yield {"type": "token", "content": chunk.content}
+                        continue
+
                     for node_name, state_update in event.items():
                         logger.info(f"📍 Node: {node_name}")
 
@@ -429,21 +551,16 @@ class WorkflowService:
                                 "message": "Tư vấn hoàn tất",
                             }
 
-                # ✅ FIXED: Stream advisor response AFTER graph completes
-                if final_state:
-                    yield {"type": "advisor_start"}
-
-                    # Get last AI message from state
+                # Model không stream token → gửi nguyên câu trả lời một lần
+                if final_state and not advisor_started:
                     messages = final_state.get("messages", [])
 
-                    if messages:
-                        last_message = messages[-1]
+                    if messages and isinstance(messages[-1], AIMessage):
+                        metrics.observe("advice.ttft", time.perf_counter() - started_at)
+                        yield {"type": "advisor_start"}
+                        yield {"type": "token", "content": messages[-1].content}
 
-                        if isinstance(last_message, AIMessage):
-                            # Stream character by character
-                            for char in last_message.content:
-                                yield {"type": "token", "content": char}
-                                await asyncio.sleep(0.01)
+                metrics.observe("advice.stream", time.perf_counter() - started_at)
 
                 yield {"type": "complete"}
 
@@ -461,6 +578,16 @@ class WorkflowService:
         try:
             logger.info("Starting image analysis for")
 
+            cache_key = await self._get_image_cache_key(img_url)
+            if cache_key is not None:
+                cached = await asyncio.to_thread(
+                    self._analysis_cache.lookup,
+                    self._get_analysis_cache_version(),
+                    cache_key,
+                )
+                if cached is not None:
+                    return RecognitionWithSafety.model_validate(cached.result)
+
             initial_state: GraphState = {
                 "messages": [],
                 "image_url": img_url,
@@ -475,7 +602,8 @@ class WorkflowService:
                 "error": None,
             }
 
-            analyze_state = await vision_node_v2(initial_state)
+            # vision_node_v2 chỉ trả phần update (node chạy song song trong graph)
+            analyze_state = {**initial_state, **await vision_node_v2(initial_state)}
             result_state = await nutrition_lookup_node(analyze_state)
 
             if result_state.get("error"):
@@ -488,6 +616,23 @@ class WorkflowService:
                 raise ValueError("Vision analysis did not return result")
 
             logger.info(f"Vision analysis successful: {vision_result.dish_name}")
+
+            if cache_key is not None:
+                detection = result_state.get("component_detection")
+                detection_dict = detection.model_dump() if detection else None
+                await asyncio.to_thread(
+                    self._analysis_cache.store,
+                    self._get_analysis_cache_version(),
+                    cache_key,
+                    vision_result.model_dump(),
+                    detection_dict,
+                    estimate_analysis_tokens(
+                        self._vision_prompt_chars,
+                        len(detection.model_dump_json()) if detection else 0,
+                        cache_key.size,
+                    ),
+                )
+
             return vision_result
 
         except Exception as e:
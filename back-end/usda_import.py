@@ -0,0 +1,50 @@
+"""
+Nạp USDA FoodData Central (Foundation + SR Legacy) vào bảng usda_foods
+
+Tải dump tại https://fdc.nal.usda.gov/download-datasets (JSON hoặc CSV).
+
+Usage (thư mục back-end, sau `alembic upgrade head`):
+    python usda_import.py FoodData_Central_foundation_food_json_2024-10-31.json \
+        FoodData_Central_sr_legacy_food_json_2018-04.json
+
+    # CSV: thư mục đã giải nén (food.csv, food_nutrient.csv, food_category.csv)
+    python usda_import.py FoodData_Central_csv_2024-10-31/
+
+Import lại dump mới sẽ update theo fdc_id. Bật USDA_LOCAL_MIRROR=true để
+USDAService tra mirror trước khi gọi API.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from database import crud
+from database.connection import SessionLocal
+from services.usda_mirror import import_dump
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "paths", nargs="+", type=Path, help="JSON dump hoặc thư mục CSV"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        for path in args.paths:
+            start = time.perf_counter()
+            count = import_dump(db, path, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            logger.info(f"{path.name}: {count} foods in {elapsed:.1f}s")
+        logger.info(f"usda_foods now has {crud.count_usda_foods(db)} rows")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import time
+
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Ngắt gọi dịch vụ ngoài sau failure_threshold lỗi liên tiếp
+
+    - closed: gọi bình thường
+    - open: từ chối ngay trong reset_timeout giây (caller dùng fallback)
+    - half_open: cho đúng một request thử; thành công → closed, lỗi → open lại
+
+    Gauge {name}.circuit_open (0/1), counter {name}.circuit_opened
+    """
+
+    def __init__(
+        self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def release(self) -> None:
+        """Request được allow() kết thúc không rõ kết quả (bị cancel)"""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+            metrics.set_gauge(f"{self.name}.circuit_open", 0)
+        self.state = CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(
+                    f"Circuit {self.name} opened after {self._failures} failures"
+                )
+                metrics.incr(f"{self.name}.circuit_opened")
+                metrics.set_gauge(f"{self.name}.circuit_open", 1)
+            self.state = OPEN
+            self._opened_at = time.monotonic()
@@ -1,12 +1,327 @@
 import base64
-from typing import Optional
-from fastapi import UploadFile
-from PIL import Image
 import io
+import mmap
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from config import settings
+from fastapi import UploadFile
+from PIL import ExifTags, Image
+from utils.image_executor import ImageQueueFullError, get_image_executor
 from utils.logger import setup_logger
+from utils.metrics import metrics
 
 logger = setup_logger(__name__)
 
+
+# EXIF IFD1 tags: vị trí + độ dài JPEG thumbnail nhúng trong APP1
+_EXIF_THUMBNAIL_OFFSET = 0x0201
+_EXIF_THUMBNAIL_LENGTH = 0x0202
+# APP1 payload bắt đầu bằng b"Exif\x00\x00", offset trong IFD tính từ TIFF header
+_EXIF_HEADER_SIZE = 6
+
+
+def _target_size(
+    width: int, height: int, max_dimension: int
+) -> Optional[Tuple[int, int]]:
+    """Kích thước sau resize, None nếu ảnh đã đủ nhỏ"""
+    if width <= max_dimension and height <= max_dimension:
+        return None
+    ratio = min(max_dimension / width, max_dimension / height)
+    return (int(width * ratio), int(height * ratio))
+
+
+def _exif_thumbnail(
+    image: Image.Image, target: Tuple[int, int]
+) -> Optional[Image.Image]:
+    """
+    Lấy JPEG thumbnail nhúng trong EXIF (IFD1) nếu đủ lớn cho target
+
+    Phần lớn máy ảnh/điện thoại nhúng thumbnail 160x120 nên shortcut này chỉ
+    dùng được khi max_dimension nhỏ, nhưng khi dùng được thì không cần decode
+    ảnh gốc.
+    """
+    exif_bytes = image.info.get("exif")
+    if not exif_bytes:
+        return None
+
+    try:
+        ifd1 = image.getexif().get_ifd(ExifTags.IFD.IFD1)
+        offset = ifd1.get(_EXIF_THUMBNAIL_OFFSET)
+        length = ifd1.get(_EXIF_THUMBNAIL_LENGTH)
+        if not offset or not length:
+            return None
+
+        start = _EXIF_HEADER_SIZE + offset
+        thumbnail = Image.open(io.BytesIO(exif_bytes[start:start + length]))
+        if thumbnail.width < target[0] or thumbnail.height < target[1]:
+            return None
+
+        thumbnail.load()
+        return thumbnail
+    except Exception:
+        return None
+
+
+def _optimize_image(
+    content: Union[bytes, str], max_dimension: int, reduced_decode: bool = True
+) -> Tuple[bytes, str, Dict[str, float], dict]:
+    """
+    Decode → resize → JPEG encode
+
+    content: bytes ảnh, hoặc path tới file tạm (ImageIngest đã spool ra disk)
+
+    ⚠️ Chạy trong worker process của ImageProcessingExecutor,
+    KHÔNG gọi trực tiếp trong async code (CPU-bound, block event loop)
+
+    reduced_decode=True (mặc định) tránh decode full resolution khi có thể:
+    1. EXIF thumbnail đủ lớn → dùng luôn
+    2. JPEG → draft mode (DCT scaling, decode thẳng ở 1/2, 1/4, 1/8)
+    3. Format khác (PNG, WebP, ...) → full decode, reduce() trước LANCZOS
+
+    Returns:
+        (jpeg_bytes, content_type, stage_timings_seconds, info)
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(content) if isinstance(content, bytes) else content)
+    width, height = image.size
+    target = _target_size(width, height, max_dimension)
+
+    decode_mode = "full"
+    if target and reduced_decode:
+        thumbnail = _exif_thumbnail(image, target)
+        if thumbnail is not None:
+            image = thumbnail
+            decode_mode = "exif_thumbnail"
+        elif image.format == "JPEG":
+            image.draft(None, target)
+            decode_mode = f"draft_1_{width // image.width}"
+
+    image.load()
+    timings["decode"] = time.perf_counter() - start
+
+    # Resize if too large
+    start = time.perf_counter()
+    if target and image.size != target:
+        image = image.resize(
+            target,
+            Image.Resampling.LANCZOS,
+            reducing_gap=3.0 if reduced_decode else None,
+        )
+    timings["resize"] = time.perf_counter() - start
+
+    # Convert to RGB for JPEG + save optimized
+    start = time.perf_counter()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85, optimize=True)
+    timings["encode"] = time.perf_counter() - start
+
+    info = {
+        "original_size": (width, height),
+        "new_size": target,
+        "decode_mode": decode_mode,
+    }
+    return output.getvalue(), "image/jpeg", timings, info
+
+
+class ImageIngest:
+    """
+    Đọc UploadFile đúng MỘT lần vào một buffer dùng chung
+
+    - Dưới spool_threshold: giữ trong RAM (BytesIO)
+    - Trên spool_threshold: ghi ra file tạm trên disk (mmap khi cần view)
+    - view() / optimized_view(): memoryview zero-copy cho các consumer
+      (base64 encode, worker process, Cloudinary upload)
+
+    Usage:
+        ingest = await ImageIngest.from_upload(file, max_size_mb=10.0)
+        try:
+            data_uri = await ingest.to_data_uri(max_dimension=1024)
+            await cloudinary_service.upload_bytes(ingest.upload_payload(), ...)
+        finally:
+            ingest.close()
+    """
+
+    _CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, content_type: Optional[str], spool_threshold: int):
+        self.content_type = content_type or "image/jpeg"
+        self.size = 0
+        self.optimized: Optional[bytes] = None
+        self.optimized_content_type: Optional[str] = None
+
+        self._spool_threshold = spool_threshold
+        self._memory: Optional[io.BytesIO] = io.BytesIO()
+        self._disk = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+
+    @classmethod
+    async def from_upload(
+        cls,
+        file: UploadFile,
+        max_size_mb: float = 5.0,
+        spool_threshold: Optional[int] = None,
+    ) -> "ImageIngest":
+        """
+        Stream UploadFile vào buffer theo chunk, dừng sớm nếu vượt max_size_mb
+
+        Raises:
+            ValueError: File quá lớn
+        """
+        ingest = cls(
+            content_type=file.content_type,
+            spool_threshold=spool_threshold or settings.UPLOAD_SPOOL_THRESHOLD,
+        )
+        max_bytes = int(max_size_mb * 1024 * 1024)
+
+        try:
+            with metrics.timer("image.read"):
+                while chunk := await file.read(cls._CHUNK_SIZE):
+                    ingest._write(chunk)
+                    if ingest.size > max_bytes:
+                        raise ValueError(
+                            f"File too large (>{max_size_mb}MB). "
+                            f"Maximum: {max_size_mb}MB"
+                        )
+        except Exception:
+            ingest.close()
+            raise
+
+        if ingest.on_disk:
+            metrics.incr("image.spooled_to_disk")
+        return ingest
+
+    def _write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self._disk is None and self.size > self._spool_threshold:
+            # Rollover: chuyển phần đã đọc từ RAM sang file tạm
+            self._disk = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".img")
+            self._disk.write(self._memory.getbuffer())
+            self._memory = None
+        (self._disk or self._memory).write(chunk)
+
+    @property
+    def on_disk(self) -> bool:
+        return self._disk is not None
+
+    def view(self) -> memoryview:
+        """Zero-copy view trên bytes gốc (RAM hoặc mmap của file tạm)"""
+        if self._disk is not None:
+            if self._mmap is None:
+                self._disk.flush()
+                self._mmap = mmap.mmap(
+                    self._disk.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            view = memoryview(self._mmap)
+        else:
+            view = self._memory.getbuffer()
+        self._views.append(view)
+        return view
+
+    def optimized_view(self) -> memoryview:
+        """Zero-copy view trên JPEG đã optimize (fallback: bytes gốc)"""
+        if self.optimized is None:
+            return self.view()
+        return memoryview(self.optimized)
+
+    def upload_payload(self) -> bytes:
+        """
+        Bytes gửi lên Cloudinary: JPEG đã optimize nếu có,
+        tránh upload lại ảnh gốc full-size
+        """
+        if self.optimized is not None:
+            return self.optimized
+        with self.view() as view:
+            return view.tobytes()
+
+    async def optimize(self, max_dimension: int = 1024) -> None:
+        """
+        Decode/resize/encode trong image process pool
+
+        Buffer trên disk → truyền path cho worker (không copy bytes qua IPC)
+
+        Raises:
+            ImageQueueFullError: Image executor đã đầy (router → 429)
+        """
+        if self.on_disk:
+            self._disk.flush()
+            source = self._disk.name
+        else:
+            # Process pool pickle argument → cần bytes
+            source = self._memory.getvalue()
+
+        submit_start = time.perf_counter()
+        content, content_type, timings, info = await get_image_executor().submit(
+            _optimize_image, source, max_dimension
+        )
+        elapsed = time.perf_counter() - submit_start
+
+        for stage, seconds in timings.items():
+            metrics.observe(f"image.{stage}", seconds)
+        metrics.observe("image.queue_wait", max(elapsed - sum(timings.values()), 0.0))
+
+        metrics.incr(f"image.decode_mode.{info['decode_mode']}")
+        if info["new_size"]:
+            width, height = info["original_size"]
+            logger.info(
+                f"Resized: {width}x{height} → {info['new_size']} "
+                f"(decode: {info['decode_mode']})"
+            )
+
+        self.optimized = content
+        self.optimized_content_type = content_type
+        logger.info(
+            f"Optimized: {self.size / (1024 * 1024):.2f}MB → "
+            f"{len(content) / (1024 * 1024):.2f}MB"
+        )
+
+    async def to_data_uri(
+        self, optimize: bool = True, max_dimension: int = 1024
+    ) -> str:
+        """
+        Base64 data URI cho VLM
+
+        Optimize thất bại (format lạ, ảnh hỏng, ...) → dùng bytes gốc
+        """
+        if optimize and self.optimized is None:
+            try:
+                await self.optimize(max_dimension)
+            except ImageQueueFullError:
+                raise
+            except Exception as e:
+                metrics.incr("image.optimize_failed")
+                logger.warning(f"Optimization failed: {e}. Using original.")
+
+        content_type = self.optimized_content_type or self.content_type
+        with metrics.timer("image.base64"):
+            with self.optimized_view() as view:
+                base64_str = base64.b64encode(view).decode("utf-8")
+            data_uri = f"data:{content_type};base64,{base64_str}"
+
+        logger.info(f"Converted to base64 ({len(base64_str) / 1024:.2f}KB)")
+        return data_uri
+
+    def close(self) -> None:
+        """Giải phóng views, mmap và file tạm"""
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+        self._memory = None
+
+
 async def upload_file_to_base64(
         file: UploadFile,
         max_size_mb: int = 5.0,
@@ -15,71 +330,46 @@ async def upload_file_to_base64(
     ) -> Optional[str]:
     """
     Convert UploadFile to base64 data URI
-    
+
+    Decode/resize/encode chạy trong image process pool (không block event loop).
+    Nếu cần dùng lại bytes (vd: upload Cloudinary) → dùng ImageIngest trực tiếp
+
     Args:
         file: FastAPI UploadFile object
         max_size_mb: Maximum file size in MB
         optimize: Compress image if needed
         max_dimension: Max width/height for optimization
-    
+
     Returns:
         Base64 data URI: "data:image/jpeg;base64,..."
+
+    Raises:
+        ImageQueueFullError: Image executor đã đầy (router → 429)
+        ValueError: File quá lớn hoặc xử lý thất bại
     """
+    total_start = time.perf_counter()
+    ingest = None
     try:
-        content = await file.read()
-        file_size_mb = len(content) / (1024 * 1024)
-        if file_size_mb > max_size_mb:
-                raise ValueError(
-                    f"File too large ({file_size_mb:.2f}MB). "
-                    f"Maximum: {max_size_mb}MB"
-                )
-        
-        content_type = file.content_type or "image/jpeg"
-
-        if optimize:
-            try:
-                image = Image.open(io.BytesIO(content))
-                
-                # Resize if too large
-                width, height = image.size
-                if width > max_dimension or height > max_dimension:
-                    ratio = min(max_dimension / width, max_dimension / height)
-                    new_size = (int(width * ratio), int(height * ratio))
-                    image = image.resize(new_size, Image.Resampling.LANCZOS)
-                    logger.info(f"Resized: {width}x{height} → {new_size}")
-                
-                # Convert to RGB for JPEG
-                if image.mode not in ("RGB", "L"):
-                    image = image.convert("RGB")
-                
-                # Save optimized
-                output = io.BytesIO()
-                image.save(output, format="JPEG", quality=85, optimize=True)
-                content = output.getvalue()
-                content_type = "image/jpeg"
-                
-                logger.info(
-                    f"Optimized: {file_size_mb:.2f}MB → "
-                    f"{len(content) / (1024 * 1024):.2f}MB"
-                )
-            except Exception as e:
-                logger.warning(f"Optimization failed: {e}. Using original.")
-        
-            base64_str = base64.b64encode(content).decode('utf-8')
-            data_uri = f"data:{content_type};base64,{base64_str}"
-                
-            logger.info(f"Converted to base64 ({len(base64_str) / 1024:.2f}KB)")
-            return data_uri
+        ingest = await ImageIngest.from_upload(file, max_size_mb=max_size_mb)
+        data_uri = await ingest.to_data_uri(
+            optimize=optimize, max_dimension=max_dimension
+        )
+        metrics.observe("image.total", time.perf_counter() - total_start)
+        return data_uri
+    except ImageQueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Base64 conversion failed: {e}")
         raise ValueError(f"Image processing failed: {str(e)}")
     finally:
-        await file.seek(0)
+        if ingest is not None:
+            ingest.close()
+
 
 def validate_image_file(file: UploadFile) -> bool:
     """Validate if uploaded file is a valid image"""
     allowed_types = {
-        "image/jpeg", "image/jpg", "image/png", 
+        "image/jpeg", "image/jpg", "image/png",
         "image/webp", "image/heic", "image/heif"
     }
     return file.content_type in allowed_types
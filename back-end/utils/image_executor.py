@@ -0,0 +1,114 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from config import settings
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class ImageQueueFullError(Exception):
+    """Executor đã đầy (đang xử lý + đang chờ) → router trả HTTP 429"""
+
+
+class ImageProcessingExecutor:
+    """
+    Bounded process pool cho các tác vụ CPU-bound trên ảnh
+    (PIL decode / resize / JPEG encode)
+
+    - max_workers: số process xử lý song song
+    - queue_depth: số job được phép chờ khi tất cả workers đang bận
+    - Vượt quá max_workers + queue_depth → ImageQueueFullError (backpressure)
+
+    Dùng "spawn" thay vì "fork": process cha đã có thread (grpc của Gemini SDK,
+    uvicorn) nên fork không an toàn.
+    """
+
+    def __init__(self, max_workers: int, queue_depth: int):
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.queue_depth
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(
+                f"Image executor started "
+                f"(workers={self.max_workers}, queue_depth={self.queue_depth})"
+            )
+
+    async def submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Chạy fn(*args) trong process pool, không block event loop
+
+        Raises:
+            ImageQueueFullError: Nếu executor đã đầy
+        """
+        # Chỉ được gọi từ event loop thread → không cần lock cho counter
+        if self._in_flight >= self.capacity:
+            metrics.incr("image_executor.rejected")
+            raise ImageQueueFullError(
+                f"Image processing queue is full ({self.capacity} jobs). "
+                f"Please retry shortly."
+            )
+
+        self.start()
+        self._in_flight += 1
+        metrics.set_gauge("image_executor.in_flight", self._in_flight)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, fn, *args)
+        except BrokenProcessPool:
+            # Worker bị kill (OOM, ...) → tạo pool mới cho request sau
+            logger.error("Image process pool is broken - recreating")
+            metrics.incr("image_executor.broken_pool")
+            self._pool = None
+            raise
+        finally:
+            self._in_flight -= 1
+            metrics.set_gauge("image_executor.in_flight", self._in_flight)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("Image executor shut down")
+
+
+# Singleton instance
+_image_executor: Optional[ImageProcessingExecutor] = None
+
+
+def get_image_executor() -> ImageProcessingExecutor:
+    """Get singleton image executor (tạo lazily nếu chưa start ở lifespan)"""
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = ImageProcessingExecutor(
+            max_workers=settings.IMAGE_PROCESS_WORKERS,
+            queue_depth=settings.IMAGE_QUEUE_DEPTH,
+        )
+    return _image_executor
+
+
+def shutdown_image_executor() -> None:
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown()
+        _image_executor = None
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import httpx
+from config import settings
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+try:
+    import h2  # noqa: F401
+
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+
+class ImageFetchError(Exception):
+    """Không tải được ảnh (HTTP lỗi, quá lớn, network)"""
+
+
+class ImageDiskCache:
+    """
+    LRU cache trên disk cho ảnh đã tải, key theo URL (+ ETag để revalidate)
+
+    Mỗi entry: <sha256(url)>.img + <sha256(url)>.json (url, etag, mime, fetched_at).
+    Index LRU giữ trong RAM, rebuild từ thư mục khi khởi động.
+
+    get/put/touch chạy trong asyncio.to_thread → mọi truy cập _index,
+    _total_bytes và file của entry đều nằm trong self._lock
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, dict]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.directory / f"{key}.img", self.directory / f"{key}.json"
+
+    def _load_index(self) -> None:
+        entries = []
+        for meta_path in self.directory.glob("*.json"):
+            try:
+                meta = json.loads(meta_path.read_text())
+                data_path = meta_path.with_suffix(".img")
+                meta["size"] = data_path.stat().st_size
+                entries.append((data_path.stat().st_atime, meta))
+            except (OSError, ValueError):
+                continue
+
+        # Cũ nhất trước → phần tử cuối OrderedDict là mới dùng nhất
+        for _, meta in sorted(entries, key=lambda e: e[0]):
+            self._index[self._key(meta["url"])] = meta
+            self._total_bytes += meta["size"]
+
+    def get(self, url: str) -> Optional[Tuple[dict, bytes]]:
+        key = self._key(url)
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                return None
+
+            data_path, _ = self._paths(key)
+            try:
+                content = data_path.read_bytes()
+            except OSError:
+                self._evict(key)
+                return None
+
+            self._index.move_to_end(key)
+            return dict(meta), content
+
+    def put(
+        self, url: str, content: bytes, mime_type: str, etag: Optional[str]
+    ) -> None:
+        if len(content) > self.max_bytes:
+            return
+
+        key = self._key(url)
+        meta = {
+            "url": url,
+            "etag": etag,
+            "mime_type": mime_type,
+            "fetched_at": time.time(),
+        }
+        with self._lock:
+            if key in self._index:
+                self._evict(key)
+
+            data_path, meta_path = self._paths(key)
+            try:
+                data_path.write_bytes(content)
+                meta_path.write_text(json.dumps(meta))
+            except OSError as e:
+                logger.error(f"Failed to write image cache entry: {e}")
+                return
+
+            meta["size"] = len(content)
+            self._index[key] = meta
+            self._total_bytes += len(content)
+
+            while self._total_bytes > self.max_bytes and self._index:
+                oldest = next(iter(self._index))
+                self._evict(oldest)
+                metrics.incr("image_fetch.cache_evictions")
+
+    def touch(self, url: str) -> None:
+        """Revalidate thành công (304) → cập nhật fetched_at"""
+        key = self._key(url)
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                return
+            meta["fetched_at"] = time.time()
+            _, meta_path = self._paths(key)
+            try:
+                meta_path.write_text(
+                    json.dumps({k: v for k, v in meta.items() if k != "size"})
+                )
+            except OSError:
+                pass
+
+    def _evict(self, key: str) -> None:
+        """Gọi khi đang giữ self._lock"""
+        meta = self._index.pop(key, None)
+        if meta:
+            self._total_bytes -= meta.get("size", 0)
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ImageFetcher:
+    """
+    Tải ảnh từ URL cho vision input
+
+    - Một httpx.AsyncClient dùng chung: keep-alive pool + HTTP/2 (nếu có h2)
+    - Streaming guard: dừng tải khi vượt IMAGE_FETCH_MAX_BYTES
+    - Disk LRU: trong IMAGE_FETCH_CACHE_FRESH_SECONDS dùng luôn bản trên disk,
+      sau đó revalidate bằng If-None-Match (304 → không tải lại)
+    """
+
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        disk_cache: Optional[ImageDiskCache] = None,
+    ):
+        self.max_bytes = settings.IMAGE_FETCH_MAX_BYTES
+        self.fresh_seconds = settings.IMAGE_FETCH_CACHE_FRESH_SECONDS
+        self._client = http_client or httpx.AsyncClient(
+            http2=_HTTP2_AVAILABLE,
+            timeout=settings.IMAGE_FETCH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        self._cache = disk_cache
+
+    async def fetch(self, url: str) -> Tuple[bytes, str]:
+        """
+        Returns:
+            (image_bytes, mime_type)
+
+        Raises:
+            ImageFetchError: HTTP lỗi, ảnh quá lớn hoặc lỗi network
+        """
+        cached = None
+        if self._cache is not None:
+            cached = await asyncio.to_thread(self._cache.get, url)
+
+        headers = {}
+        if cached is not None:
+            meta, content = cached
+            if time.time() - meta["fetched_at"] < self.fresh_seconds:
+                metrics.incr("image_fetch.cache_hits")
+                return content, meta["mime_type"]
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+
+        start = time.perf_counter()
+        try:
+            async with self._client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and cached is not None:
+                    metrics.incr("image_fetch.revalidated")
+                    await asyncio.to_thread(self._cache.touch, url)
+                    return cached[1], cached[0]["mime_type"]
+
+                if response.status_code != 200:
+                    raise ImageFetchError(
+                        f"Image download failed ({response.status_code}): {url}"
+                    )
+
+                content_length = int(response.headers.get("content-length") or 0)
+                if content_length > self.max_bytes:
+                    raise ImageFetchError(
+                        f"Image too large ({content_length} bytes > {self.max_bytes})"
+                    )
+
+                chunks, received = [], 0
+                async for chunk in response.aiter_bytes():
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise ImageFetchError(
+                            f"Image too large (> {self.max_bytes} bytes)"
+                        )
+                    chunks.append(chunk)
+
+                content = b"".join(chunks)
+                mime_type = response.headers.get("content-type", "").split(";")[0]
+                etag = response.headers.get("etag")
+        except httpx.HTTPError as e:
+            metrics.incr("image_fetch.errors")
+            raise ImageFetchError(f"Image download failed: {e!r}")
+        except ImageFetchError:
+            metrics.incr("image_fetch.errors")
+            raise
+
+        metrics.incr("image_fetch.downloads")
+        metrics.observe("image_fetch.download", time.perf_counter() - start)
+        logger.info(f"Downloaded image from URL ({len(content)} bytes)")
+
+        if self._cache is not None:
+            await asyncio.to_thread(self._cache.put, url, content, mime_type, etag)
+
+        return content, mime_type
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+# Singleton instance
+_image_fetcher: Optional[ImageFetcher] = None
+
+
+def get_image_fetcher() -> ImageFetcher:
+    global _image_fetcher
+    if _image_fetcher is None:
+        disk_cache = None
+        if settings.IMAGE_FETCH_CACHE_MAX_BYTES > 0:
+            disk_cache = ImageDiskCache(
+                directory=settings.IMAGE_FETCH_CACHE_DIR
+                or os.path.join(tempfile.gettempdir(), "macro-mate-image-cache"),
+                max_bytes=settings.IMAGE_FETCH_CACHE_MAX_BYTES,
+            )
+        _image_fetcher = ImageFetcher(disk_cache=disk_cache)
+        if not _HTTP2_AVAILABLE:
+            logger.warning("h2 not installed - image fetcher using HTTP/1.1")
+    return _image_fetcher
+
+
+async def close_image_fetcher() -> None:
+    global _image_fetcher
+    if _image_fetcher is not None:
+        await _image_fetcher.close()
+        _image_fetcher = None
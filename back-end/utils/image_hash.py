@@ -0,0 +1,47 @@
+import hashlib
+import io
+from typing import List
+
+from PIL import Image
+
+# dHash 64-bit = 8 hàng x 8 phép so sánh (ảnh 9x8 grayscale)
+_DHASH_SIZE = 8
+# Chia hash thành 4 band 16-bit: 2 hash lệch <= 3 bit chắc chắn trùng ít nhất 1 band
+PHASH_BANDS = 4
+_BAND_BITS = 64 // PHASH_BANDS
+
+
+def content_hash(content: bytes) -> str:
+    """SHA-256 của bytes ảnh đã normalize (JPEG output của _optimize_image)"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def perceptual_hash(content: bytes) -> int:
+    """
+    dHash 64-bit: ổn định với re-encode, resize, thay đổi nhỏ về màu/nén
+
+    JPEG decode bằng draft mode (DCT scaling) nên rẻ cả với ảnh 1024px
+    """
+    image = Image.open(io.BytesIO(content))
+    image.draft("L", (_DHASH_SIZE * 4, _DHASH_SIZE * 4))
+    image = image.convert("L").resize(
+        (_DHASH_SIZE + 1, _DHASH_SIZE), Image.Resampling.BILINEAR
+    )
+    pixels = list(image.getdata())
+
+    value = 0
+    for row in range(_DHASH_SIZE):
+        offset = row * (_DHASH_SIZE + 1)
+        for col in range(_DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def phash_bands(value: int) -> List[int]:
+    """Tách hash thành PHASH_BANDS band để tra cứu near-duplicate"""
+    mask = (1 << _BAND_BITS) - 1
+    return [(value >> (i * _BAND_BITS)) & mask for i in range(PHASH_BANDS)]
@@ -0,0 +1,111 @@
+import json
+import re
+from typing import Optional
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*|\s*```")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def strip_json_fences(text: str) -> str:
+    """Bỏ markdown fence ```json ... ``` quanh output của model"""
+    return _FENCE_RE.sub("", text).strip()
+
+
+def repair_json(text: str) -> Optional[str]:
+    """
+    Sửa JSON lỗi thường gặp của LLM ngay tại local (không gọi model)
+
+    - Text/fence thừa trước và sau object
+    - Dấu phẩy thừa trước } / ]
+    - Output bị cắt giữa chừng: đóng string, bỏ key/value dở, đóng bracket
+
+    Quét một lượt theo stack bracket (có tính string + escape).
+
+    Returns:
+        JSON string parse được, hoặc None nếu không sửa được
+    """
+    text = strip_json_fences(text)
+    start = min(
+        (i for i in (text.find("{"), text.find("[")) if i != -1), default=-1
+    )
+    if start == -1:
+        return None
+    text = text[start:]
+
+    stack = []
+    in_string = False
+    escaped = False
+    # Vị trí kết thúc của phần tử hoàn chỉnh gần nhất (để cắt phần dở dang)
+    last_complete = 0
+    end = len(text)
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack or stack[-1] != char:
+                return None
+            stack.pop()
+            last_complete = i + 1
+            if not stack:
+                # Object gốc đã đóng → bỏ text thừa phía sau
+                end = i + 1
+                break
+        elif char == ",":
+            last_complete = i
+
+    if not stack:
+        return _loads_or_none(text[:end])
+
+    # Output bị cắt: thử đóng nguyên văn trước, sau đó cắt về phần tử hoàn chỉnh
+    for prefix in (text, text[:last_complete]):
+        candidate = _loads_or_none(_close_brackets(prefix.rstrip().rstrip(",")))
+        if candidate is not None:
+            return candidate
+    return None
+
+
+def _loads_or_none(candidate: str) -> Optional[str]:
+    candidate = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+    try:
+        json.loads(candidate)
+    except ValueError:
+        return None
+    return candidate
+
+
+def _close_brackets(prefix: str) -> str:
+    """Đóng string và các bracket còn mở của prefix"""
+    closers = []
+    in_string = False
+    escaped = False
+    for char in prefix:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+
+    if escaped:
+        prefix = prefix[:-1]
+    return prefix + ('"' if in_string else "") + "".join(reversed(closers))
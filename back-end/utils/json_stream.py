@@ -0,0 +1,149 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class JsonArrayStreamScanner:
+    """
+    Theo dõi JSON object đang được model stream, báo từng phần tử của mảng
+    `array_key` (ở object gốc) ngay khi có field mới hoàn chỉnh
+
+    feed(chunk) trả về list (index, item, complete):
+    - complete=False: snapshot chỉ gồm các field đã có value đầy đủ (string
+      chưa đóng / số chưa kết thúc không bao giờ xuất hiện dở dang)
+    - complete=True: object đã đóng, parse nguyên văn
+
+    Quét tuyến tính, mỗi ký tự một lần (có tính string + escape). Buffer
+    quét chỉ giữ phần text từ item / string đang mở trở đi; toàn bộ response
+    được giữ dạng list chunk và chỉ join khi đọc `text`.
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self._chunks: List[str] = []
+        # _buffer bắt đầu tại vị trí tuyệt đối _offset; mọi index khác là tuyệt đối
+        self._buffer = ""
+        self._offset = 0
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None
+        self._root_key: Optional[str] = None
+        # len(stack) khi đang ở trong mảng cần theo dõi
+        self._array_depth: Optional[int] = None
+        self._index = 0
+        self._item_start = -1
+        # Kết thúc của field hoàn chỉnh gần nhất trong item hiện tại
+        self._item_safe_end = -1
+        self._item_emitted_end = -1
+        self._expect_value = False
+
+    def _in_item(self) -> bool:
+        return self._item_start != -1 and len(self._stack) == self._array_depth + 1
+
+    def _slice(self, start: int, end: int) -> str:
+        return self._buffer[start - self._offset : end - self._offset]
+
+    def feed(self, chunk: str) -> List[Tuple[int, Dict[str, Any], bool]]:
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        end = self._offset + len(self._buffer)
+        events: List[Tuple[int, Dict[str, Any], bool]] = []
+
+        for i in range(self._pos, end):
+            char = self._buffer[i - self._offset]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self._slice(self._string_start, i + 1)
+                    if self._in_item() and self._expect_value:
+                        self._item_safe_end = i + 1
+                        self._expect_value = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":":
+                if len(self._stack) == 1 and self._last_string is not None:
+                    self._root_key = json.loads(self._last_string)
+                elif self._in_item():
+                    self._expect_value = True
+            elif char in "{[":
+                if (
+                    char == "["
+                    and self._stack == ["{"]
+                    and self._root_key == self.array_key
+                ):
+                    self._array_depth = 2
+                self._stack.append(char)
+                if (
+                    char == "{"
+                    and self._array_depth is not None
+                    and len(self._stack) == self._array_depth + 1
+                ):
+                    self._item_start = i
+                    self._item_safe_end = self._item_emitted_end = -1
+                    self._expect_value = False
+            elif char in "}]":
+                if self._in_item() and char == "}":
+                    item = self._loads(self._slice(self._item_start, i + 1))
+                    if item is not None:
+                        events.append((self._index, item, True))
+                    self._index += 1
+                    self._item_start = -1
+                if self._stack:
+                    self._stack.pop()
+                if (
+                    self._array_depth is not None
+                    and len(self._stack) < self._array_depth
+                ):
+                    self._array_depth = None
+                elif self._in_item():
+                    # Value dạng object/array (estimated_nutrition) vừa đóng
+                    self._item_safe_end = i + 1
+                    self._expect_value = False
+            elif char == "," and self._in_item():
+                # Số / bool / null kết thúc tại dấu phẩy
+                self._item_safe_end = max(self._item_safe_end, i)
+                self._expect_value = False
+
+        self._pos = end
+
+        if self._item_start != -1 and self._item_safe_end > self._item_emitted_end:
+            partial = self._slice(self._item_start, self._item_safe_end)
+            item = self._loads(partial.rstrip().rstrip(",") + "}")
+            if item is not None:
+                self._item_emitted_end = self._item_safe_end
+                events.append((self._index, item, False))
+
+        self._trim()
+        return events
+
+    def _trim(self) -> None:
+        """Bỏ phần buffer đã quét mà không slice nào còn cần tới"""
+        keep = self._pos
+        if self._item_start != -1:
+            keep = min(keep, self._item_start)
+        if self._in_string:
+            keep = min(keep, self._string_start)
+        if keep > self._offset:
+            self._buffer = self._buffer[keep - self._offset :]
+            self._offset = keep
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    @staticmethod
+    def _loads(candidate: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+
+class MetricsRegistry:
+    """
+    In-process metrics registry (counters, gauges, timings)
+
+    Thread-safe, không phụ thuộc thư viện ngoài.
+    Snapshot được expose qua endpoint `/metrics` trong main.py
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Tăng counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Set giá trị tức thời (queue depth, pool size, ...)"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Ghi nhận một timing sample (giây)"""
+        with self._lock:
+            stat = self._timings.get(name)
+            if stat is None:
+                stat = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+                self._timings[name] = stat
+            stat["count"] += 1
+            stat["total"] += seconds
+            stat["last"] = seconds
+            if seconds > stat["max"]:
+                stat["max"] = seconds
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Usage:
+            with metrics.timer("image.read"):
+                content = await file.read()
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """Export toàn bộ metrics (timings tính bằng ms)"""
+        with self._lock:
+            timings = {
+                name: {
+                    "count": stat["count"],
+                    "avg_ms": round(stat["total"] / stat["count"] * 1000, 2),
+                    "max_ms": round(stat["max"] * 1000, 2),
+                    "last_ms": round(stat["last"] * 1000, 2),
+                }
+                for name, stat in self._timings.items()
+                if stat["count"]
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+
+# Singleton
+metrics = MetricsRegistry()
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+# Refill + lấy 1 token nguyên tử; trả về số giây cần chờ (0 = đã lấy được).
+# Trả về string vì Lua number bị cắt thành integer trong reply
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+if tokens < 1 then
+    return tostring((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return '0'
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket (rate token/giây, tối đa capacity token burst)
+
+    - Local: dùng chung trong process (mọi request của worker)
+    - redis_client != None: bucket chung giữa nhiều worker/pod (Lua script
+      nguyên tử). Redis lỗi → log và dùng bucket local
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        redis_client: Optional[aioredis.Redis] = None,
+        key: str = "ratelimit:default",
+        name: str = "rate_limit",
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.key = key
+        self.name = name
+        self._redis = redis_client
+        self._script = (
+            redis_client.register_script(_TAKE_SCRIPT) if redis_client else None
+        )
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _take_local(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def _take(self) -> float:
+        if self._script is None:
+            return self._take_local()
+        try:
+            wait = await self._script(
+                keys=[self.key], args=[self.rate, self.capacity, time.time()]
+            )
+            return float(wait)
+        except redis.RedisError as e:
+            metrics.incr(f"{self.name}.redis_errors")
+            logger.warning(f"Rate limiter Redis error, using local bucket: {e}")
+            return self._take_local()
+
+    async def try_acquire(self) -> bool:
+        """
+        Lấy token ngay nếu còn, không chờ. Cùng backend với acquire (Redis
+        khi distributed) - lần lấy hụt không tiêu token
+        """
+        return await self._take() == 0.0
+
+    async def acquire(self, timeout: float) -> bool:
+        """Chờ tối đa timeout giây; False nếu token không về kịp (không ngủ vô ích)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = await self._take()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                metrics.incr(f"{self.name}.rejected")
+                return False
+            metrics.incr(f"{self.name}.waits")
+            await asyncio.sleep(wait)
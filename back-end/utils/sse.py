@@ -0,0 +1,171 @@
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+
+import orjson
+from config import settings
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+SSEFormat = Literal["json", "compact"]
+
+_LINE_BREAK_RE = re.compile(r"\r\n|\r|\n")
+_END_OF_STREAM = object()
+
+
+class SSEWriter:
+    """
+    Encode event dict → SSE frame, gộp token liên tiếp thành một frame
+
+    Flush token buffer khi:
+    - đã giữ token lâu hơn flush_interval (giây), hoặc
+    - buffer vượt flush_bytes, hoặc
+    - có event khác token (giữ đúng thứ tự event)
+
+    Format:
+    - "json" (mặc định): `data: {"type": ..., ...}` - tương thích client cũ,
+      token gộp vẫn là {"type": "token", "content": "<nhiều token>"}
+    - "compact": `event: <type>` + data; token gửi text thô, mỗi dòng một
+      `data:` line (SSE ghép lại bằng \\n) → không escape JSON, an toàn với
+      mọi ký tự
+
+    Counter theo connection: frames, bytes, events, tokens (log khi đóng,
+    tổng hợp vào sse.* trong /metrics)
+    """
+
+    def __init__(
+        self,
+        format: SSEFormat = "json",
+        flush_interval: Optional[float] = None,
+        flush_bytes: Optional[int] = None,
+    ):
+        self.format = format
+        self.flush_interval = (
+            settings.SSE_FLUSH_INTERVAL_MS / 1000
+            if flush_interval is None
+            else flush_interval
+        )
+        self.flush_bytes = (
+            settings.SSE_FLUSH_BYTES if flush_bytes is None else flush_bytes
+        )
+        self.stats: Dict[str, int] = {"frames": 0, "bytes": 0, "events": 0, "tokens": 0}
+
+    # ===== Encoding =====
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        """Một event → một SSE frame"""
+        if self.format == "compact":
+            event_type = event.get("type", "message")
+            if event_type == "token":
+                lines = _LINE_BREAK_RE.split(event.get("content", ""))
+                data = b"".join(
+                    b"data: " + line.encode("utf-8") + b"\n" for line in lines
+                )
+                frame = b"event: t\n" + data + b"\n"
+            else:
+                frame = (
+                    b"event: " + event_type.encode("utf-8") + b"\n"
+                    b"data: " + orjson.dumps(event) + b"\n\n"
+                )
+        else:
+            frame = b"data: " + orjson.dumps(event) + b"\n\n"
+
+        self.stats["frames"] += 1
+        self.stats["bytes"] += len(frame)
+        return frame
+
+    def raw(self, text: str) -> bytes:
+        """Frame viết sẵn (comment, field riêng như thread_id)"""
+        frame = text.encode("utf-8")
+        self.stats["frames"] += 1
+        self.stats["bytes"] += len(frame)
+        return frame
+
+    def done(self) -> bytes:
+        return self.raw("data: [DONE]\n\n")
+
+    # ===== Streaming =====
+
+    async def stream(
+        self, events: AsyncIterator[Dict[str, Any]]
+    ) -> AsyncIterator[bytes]:
+        """
+        Đọc event từ `events`, yield SSE frame đã gộp
+
+        Upstream chạy trong task riêng để flush theo thời gian ngay cả khi
+        model đang chậm sinh token tiếp theo. Exception của upstream được
+        raise lại sau khi đã flush phần token đang giữ.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for event in events:
+                    await queue.put(event)
+                await queue.put(_END_OF_STREAM)
+            except BaseException as e:
+                await queue.put(e)
+
+        pump_task = asyncio.create_task(pump())
+        tokens: List[str] = []
+        buffered_bytes = 0
+        buffered_since = 0.0
+
+        def flush() -> bytes:
+            nonlocal tokens, buffered_bytes
+            frame = self.encode({"type": "token", "content": "".join(tokens)})
+            tokens, buffered_bytes = [], 0
+            return frame
+
+        try:
+            while True:
+                timeout = None
+                if tokens:
+                    deadline = buffered_since + self.flush_interval
+                    timeout = max(0.0, deadline - time.monotonic())
+
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield flush()
+                    continue
+
+                if item is _END_OF_STREAM or isinstance(item, BaseException):
+                    if tokens:
+                        yield flush()
+                    if isinstance(item, BaseException):
+                        raise item
+                    return
+
+                self.stats["events"] += 1
+                if item.get("type") == "token":
+                    content = item.get("content", "")
+                    if not tokens:
+                        buffered_since = time.monotonic()
+                    tokens.append(content)
+                    buffered_bytes += len(content.encode("utf-8"))
+                    self.stats["tokens"] += 1
+                    if buffered_bytes >= self.flush_bytes:
+                        yield flush()
+                    continue
+
+                if tokens:
+                    yield flush()
+                yield self.encode(item)
+        finally:
+            pump_task.cancel()
+            await asyncio.gather(pump_task, return_exceptions=True)
+
+    def close(self) -> None:
+        """Ghi counter của connection vào log + metrics tổng"""
+        metrics.incr("sse.connections")
+        for name, value in self.stats.items():
+            metrics.incr(f"sse.{name}", value)
+        logger.info(
+            f"SSE closed: {self.stats['events']} events "
+            f"({self.stats['tokens']} tokens) → {self.stats['frames']} frames, "
+            f"{self.stats['bytes']} bytes"
+        )
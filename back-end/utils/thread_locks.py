@@ -0,0 +1,159 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+from config import settings
+from redis.exceptions import LockError
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class ThreadLockTimeoutError(Exception):
+    """Không lấy được lock của thread trong thời gian cho phép"""
+
+
+@dataclass
+class _LockEntry:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    refcount: int = 0
+
+
+class ThreadLockManager:
+    """
+    Serialize request theo thread_id (tránh ghi đè checkpoint của cùng một chat)
+
+    - Local: asyncio.Lock có reference counting, entry bị xoá ngay khi không
+      còn ai giữ/chờ → registry chỉ chứa thread đang hoạt động
+    - Distributed (redis_client != None): thêm Redis lock (SET NX PX + Lua
+      release) để serialize giữa nhiều uvicorn worker/pod. Lease được gia hạn
+      định kỳ trong lúc stream; process chết thì lock tự hết hạn.
+      Redis lỗi → log và chỉ dùng lock local
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[aioredis.Redis] = None,
+        lease_seconds: float = 60.0,
+        acquire_timeout: float = 30.0,
+    ):
+        self._entries: Dict[str, _LockEntry] = {}
+        self._redis = redis_client
+        self.lease_seconds = lease_seconds
+        self.acquire_timeout = acquire_timeout
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        start = time.perf_counter()
+        async with self._local(key):
+            if self._redis is None:
+                metrics.observe("thread_locks.acquire", time.perf_counter() - start)
+                yield
+                return
+
+            async with self._distributed(key):
+                metrics.observe("thread_locks.acquire", time.perf_counter() - start)
+                yield
+
+    @asynccontextmanager
+    async def _local(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _LockEntry()
+            metrics.set_gauge("thread_locks.active", len(self._entries))
+        entry.refcount += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.refcount -= 1
+            if entry.refcount == 0:
+                del self._entries[key]
+                metrics.set_gauge("thread_locks.active", len(self._entries))
+
+    @asynccontextmanager
+    async def _distributed(self, key: str):
+        lock = self._redis.lock(
+            f"lock:thread:{key}",
+            timeout=self.lease_seconds,
+            sleep=0.05,
+            blocking_timeout=self.acquire_timeout,
+        )
+        try:
+            acquired = await lock.acquire()
+        except redis.RedisError as e:
+            metrics.incr("thread_locks.redis_errors")
+            logger.error(f"Redis lock error, falling back to local lock: {e}")
+            lock = None
+
+        if lock is None:
+            yield
+            return
+
+        if not acquired:
+            metrics.incr("thread_locks.timeouts")
+            raise ThreadLockTimeoutError(f"Thread {key} is busy, try again later")
+
+        renew_task = asyncio.create_task(self._keep_lease(lock, key))
+        try:
+            yield
+        finally:
+            renew_task.cancel()
+            await asyncio.gather(renew_task, return_exceptions=True)
+            try:
+                await lock.release()
+            except (LockError, redis.RedisError) as e:
+                # Lease đã hết hạn (process bị treo quá lâu) hoặc Redis lỗi
+                logger.warning(f"Failed to release thread lock {key}: {e}")
+
+    async def _keep_lease(self, lock, key: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await lock.reacquire()
+            except (LockError, redis.RedisError) as e:
+                logger.warning(f"Lost thread lock lease {key}: {e}")
+                return
+
+
+# Singleton instance
+_thread_lock_manager: Optional[ThreadLockManager] = None
+
+
+def get_thread_lock_manager() -> ThreadLockManager:
+    global _thread_lock_manager
+    if _thread_lock_manager is None:
+        redis_client = None
+        if (
+            settings.THREAD_LOCK_DISTRIBUTED
+            and settings.REDIS_URL
+            and settings.REDIS_ENABLED
+        ):
+            redis_client = aioredis.from_url(
+                settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2
+            )
+        _thread_lock_manager = ThreadLockManager(
+            redis_client=redis_client,
+            lease_seconds=settings.THREAD_LOCK_LEASE_SECONDS,
+            acquire_timeout=settings.THREAD_LOCK_ACQUIRE_TIMEOUT,
+        )
+        logger.info(
+            f"Thread lock manager ready ({'redis' if redis_client else 'local'})"
+        )
+    return _thread_lock_manager
+
+
+async def close_thread_lock_manager() -> None:
+    global _thread_lock_manager
+    if _thread_lock_manager is not None:
+        if _thread_lock_manager._redis is not None:
+            await _thread_lock_manager._redis.aclose()
+        _thread_lock_manager = None